@@ -1,14 +1,127 @@
+import functools
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Any, Callable, ContextManager, List, Optional, Tuple
 
 import click
 
+from ata_pipeline0.helpers.cache import ObjectCache
 from ata_pipeline0.helpers.datetime import get_timestamps
+from ata_pipeline0.helpers.engine import Engine
 from ata_pipeline0.helpers.logging import logging
+from ata_pipeline0.helpers.manifest import Manifest
 from ata_pipeline0.helpers.site import SiteName
-from ata_pipeline0.main import run_pipeline
+from ata_pipeline0.helpers.staging import Staging
+from ata_pipeline0.main import PipelineResult, run_pipeline
 
 logger = logging.getLogger(__name__)
 
+# Semaphore shared by worker processes to cap concurrent DB writes, set by _init_worker
+_write_semaphore: Optional[ContextManager[Any]] = None
+
+
+@dataclass
+class BatchSummary:
+    """
+    Outcome of running the pipeline for a batch of timestamps of a site.
+    """
+
+    site_name: SiteName
+    timestamps: List[datetime]
+    seconds: float
+    result: Optional[PipelineResult] = None
+    error: Optional[str] = None
+
+
+def get_batches(
+    sites: List[SiteName], timestamps: List[datetime], batch_size: Optional[int] = None
+) -> List[Tuple[SiteName, List[datetime]]]:
+    """
+    Splits timestamps into batches of `batch_size` (or a single batch, if not set)
+    for each site, e.g., 3 timestamps t0, t1 and t2 in batches of 2 for sites A and B
+    become [(A, [t0, t1]), (A, [t2]), (B, [t0, t1]), (B, [t2])].
+    """
+    batch_size = batch_size or len(timestamps)
+    return [(site, timestamps[idx : idx + batch_size]) for site in sites for idx in range(0, len(timestamps), batch_size)]
+
+
+def run_batches(
+    batches: List[Tuple[SiteName, List[datetime]]],
+    run: Callable[..., PipelineResult],
+    workers: int = 1,
+    max_concurrent_writes: Optional[int] = None,
+) -> List[BatchSummary]:
+    """
+    Calls `run` (e.g., `run_pipeline` with options other than the site name and
+    timestamps already set) for each batch, and returns a summary of each.
+
+    If `workers` is more than 1, batches run concurrently in that many processes, so
+    that some can fetch from S3 while others write to the DB. Writes are capped at
+    `max_concurrent_writes` (`workers` if not set) at a time across processes, since
+    the DB copes with fewer concurrent writers than S3 does with downloads. `run`
+    must then be picklable.
+
+    A failed batch doesn't stop the others; its summary holds the error.
+    """
+    if workers <= 1:
+        return [_run_batch(run, site, timestamps) for site, timestamps in batches]
+
+    # Spawn rather than fork worker processes, since forking a process that has
+    # started threads (e.g., boto3's) isn't safe
+    context = multiprocessing.get_context("spawn")
+    write_semaphore = context.BoundedSemaphore(max_concurrent_writes or workers)
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(write_semaphore,)
+    ) as executor:
+        futures = [executor.submit(_run_batch, run, site, timestamps) for site, timestamps in batches]
+
+        summaries = []
+        for (site, timestamps), future in zip(batches, futures):
+            try:
+                summaries.append(future.result())
+            except Exception as e:
+                # _run_batch catches errors itself, so this is the worker process dying
+                summaries.append(BatchSummary(site, timestamps, seconds=0, error=repr(e)))
+        return summaries
+
+
+def _init_worker(write_semaphore: ContextManager[Any]) -> None:
+    global _write_semaphore
+    _write_semaphore = write_semaphore
+
+
+def _run_batch(run: Callable[..., PipelineResult], site: SiteName, timestamps: List[datetime]) -> BatchSummary:
+    logger.info(f"Running batch for site {site} and the following timestamps:")
+    for ts in timestamps:
+        logger.info(f"--> {ts}")
+
+    start = time.perf_counter()
+    try:
+        result = run(site_name=site, timestamps=timestamps, write_semaphore=_write_semaphore)
+    except Exception as e:
+        logger.exception(f"Batch for site {site} starting at {timestamps[0]} failed")
+        return BatchSummary(site, timestamps, seconds=time.perf_counter() - start, error=repr(e))
+    return BatchSummary(site, timestamps, seconds=time.perf_counter() - start, result=result)
+
+
+def _log_summaries(summaries: List[BatchSummary]) -> None:
+    logger.info(
+        f"{'Site':<20} {'Start':<16} {'Hours':>5} {'Fetched':>10} {'Preprocessed':>12} {'Inserted':>10} "
+        f"{'Objects skipped':>15} {'Seconds':>8}  Status"
+    )
+    for summary in summaries:
+        result = summary.result or PipelineResult()
+        start = summary.timestamps[0].strftime("%Y-%m-%d %H:%M")
+        logger.info(
+            f"{summary.site_name:<20} {start:<16} {len(summary.timestamps):>5} {result.num_rows_fetched:>10} "
+            f"{result.num_rows_preprocessed:>12} {result.num_rows_inserted:>10} {result.num_objects_skipped:>15} "
+            f"{summary.seconds:>8.1f}  {summary.error or 'OK'}"
+        )
+
 
 @click.command()
 @click.option(
@@ -20,24 +133,136 @@ logger = logging.getLogger(__name__)
 @click.option("--days", type=int, default=1, help="How many days of data to grab after the start date.")
 @click.option("--batch", is_flag=True, default=False, help="Set to batch runs per-timestamp; use for larger ranges.")
 @click.option("--batch-size", type=int, default=1, help="Number of hours to batch by.")
-@click.argument("site", type=SiteName)
-def backfill(start_date: datetime, days: int, batch: bool, batch_size: int, site: SiteName):
+@click.option(
+    "--chunk-max-rows",
+    type=int,
+    default=None,
+    help="Stream each run through the pipeline in chunks of S3 objects holding about this many rows; bounds memory usage.",
+)
+@click.option(
+    "--use-copy", is_flag=True, default=False, help="Write events with Postgres' COPY; faster for larger ranges."
+)
+@click.option(
+    "--write-batch-size", type=int, default=None, help="Number of rows per INSERT statement when not using COPY."
+)
+@click.option(
+    "--skip-existing",
+    is_flag=True,
+    default=False,
+    help="Drop events already in the DB before writing; faster for ranges that are mostly loaded already.",
+)
+@click.option("--concurrency", type=int, default=4, help="Number of S3 objects to download concurrently, per worker.")
+@click.option(
+    "--async-fetch",
+    is_flag=True,
+    default=False,
+    help="Fetch S3 objects with the asyncio-based engine, which adapts concurrency up to --concurrency (can be hundreds).",
+)
+@click.option("--workers", type=int, default=1, help="Number of batches to run concurrently, each in its own process.")
+@click.option(
+    "--max-concurrent-writes",
+    type=int,
+    default=None,
+    help="Max number of batches writing to the DB at once; defaults to --workers.",
+)
+@click.option(
+    "--manifest",
+    "manifest_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Local SQLite file to record S3 objects whose events have been written in, so that the backfill can be resumed.",
+)
+@click.option(
+    "--resume", is_flag=True, default=False, help="Skip S3 objects --manifest records as written by a previous run."
+)
+@click.option(
+    "--cache",
+    "cache_dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Local directory to cache downloaded S3 objects in, so that re-running over the same range reads them from disk.",
+)
+@click.option(
+    "--cache-size-max",
+    type=float,
+    default=10.0,
+    help="Max size of the S3 object cache, in GiB; least recently used objects are evicted beyond it.",
+)
+@click.option(
+    "--staging",
+    "staging_dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Local directory to stage parsed events in as Parquet, one file per hour, so that re-running over the same range "
+    "doesn't parse them again. Requires pyarrow.",
+)
+@click.option(
+    "--parse-processes",
+    type=int,
+    default=None,
+    help="Number of processes to decompress and parse S3 objects in, per worker; by default, they're parsed in threads.",
+)
+@click.option(
+    "--engine",
+    type=click.Choice([engine.value for engine in Engine]),
+    default=Engine.PANDAS.value,
+    help="Engine to preprocess events on; arrow converts and filters columns in parallel threads. Requires pyarrow.",
+)
+@click.argument("sites", type=SiteName, nargs=-1, required=True)
+def backfill(
+    start_date: datetime,
+    days: int,
+    batch: bool,
+    batch_size: int,
+    chunk_max_rows: Optional[int],
+    use_copy: bool,
+    write_batch_size: Optional[int],
+    skip_existing: bool,
+    concurrency: int,
+    async_fetch: bool,
+    workers: int,
+    max_concurrent_writes: Optional[int],
+    manifest_path: Optional[str],
+    resume: bool,
+    cache_dir: Optional[str],
+    cache_size_max: float,
+    staging_dir: Optional[str],
+    parse_processes: Optional[int],
+    engine: str,
+    sites: Tuple[SiteName, ...],
+):
+    if resume and manifest_path is None:
+        raise click.UsageError("--resume requires --manifest.")
+
     exec_start = datetime.now()
     timestamps = get_timestamps(start_date=start_date, days=days)
     # call function that calls the whole process; handler should call the same fn
-    if batch:
-        for batch_num, idx in enumerate(range(0, len(timestamps), batch_size)):
-            current_timestamps = timestamps[idx : idx + batch_size]
-            logger.info(f"Running batch #{batch_num} for the following timestamps:")
-            for ts in current_timestamps:
-                logger.info(f"--> {ts}")
-            run_pipeline(site_name=site, timestamps=current_timestamps)
-    else:
-        run_pipeline(site_name=site, timestamps=timestamps)
+    run = functools.partial(
+        run_pipeline,
+        concurrency=concurrency,
+        chunk_max_rows=chunk_max_rows,
+        use_copy=use_copy,
+        write_batch_size=write_batch_size,
+        skip_existing=skip_existing,
+        use_async_fetch=async_fetch,
+        manifest=None if manifest_path is None else Manifest(manifest_path),
+        resume=resume,
+        cache=None if cache_dir is None else ObjectCache(cache_dir, size_max=int(cache_size_max * 2**30)),
+        staging=None if staging_dir is None else Staging(staging_dir),
+        num_parse_processes=parse_processes,
+        engine=Engine(engine),
+    )
+    batches = get_batches([*sites], timestamps, batch_size=batch_size if batch else None)
+    summaries = run_batches(batches, run, workers=workers, max_concurrent_writes=max_concurrent_writes)
     exec_end = datetime.now()
     exec_total = exec_end - exec_start
+    _log_summaries(summaries)
     logger.info(f"Backfill finished, took: {exec_total} long.")
 
+    num_batches_failed = sum(summary.error is not None for summary in summaries)
+    if num_batches_failed > 0:
+        raise click.ClickException(f"{num_batches_failed} of {len(summaries)} batches failed.")
+
 
 if __name__ == "__main__":
     backfill()
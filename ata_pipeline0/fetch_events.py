@@ -1,19 +1,55 @@
+from __future__ import annotations
+
+import asyncio
+import functools
 import gzip
+import io
 import itertools
 import json
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime
-from typing import List, Optional
+from types import TracebackType
+from typing import (
+    TYPE_CHECKING,
+    AbstractSet,
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
+import numpy as np
 import pandas as pd
-from mypy_boto3_s3.service_resource import ObjectSummary, S3ServiceResource
-from mypy_boto3_s3.type_defs import GetObjectOutputTypeDef
 
+from ata_pipeline0.helpers import arrow, categorical, metrics
+from ata_pipeline0.helpers.cache import Content, ObjectCache
+from ata_pipeline0.helpers.concurrency import AdaptiveLimiter
+from ata_pipeline0.helpers.json import loads_lines
 from ata_pipeline0.helpers.logging import logging
 from ata_pipeline0.helpers.site import SiteName
+from ata_pipeline0.helpers.staging import Staging
+
+# Type stubs are slow to import and only needed by mypy
+if TYPE_CHECKING:
+    from botocore.response import StreamingBody
+    from mypy_boto3_s3.service_resource import Bucket, ObjectSummary, S3ServiceResource
+    from mypy_boto3_s3.type_defs import GetObjectOutputTypeDef
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 def fetch_events(
     s3_resource: S3ServiceResource,
@@ -21,6 +57,13 @@ def fetch_events(
     num_concurrent_downloads: int,
     timestamps: Optional[List[datetime]] = None,
     object_key: Optional[str] = None,
+    use_async: bool = False,
+    fields: Optional[AbstractSet[str]] = None,
+    object_keys: Optional[List[str]] = None,
+    cache: Optional[ObjectCache] = None,
+    staging: Optional[Staging] = None,
+    num_parse_processes: Optional[int] = None,
+    fields_categorical: Optional[AbstractSet[str]] = None,
 ) -> pd.DataFrame:
     """
     Given config inputs, including a site's bucket name and a list of date-hour
@@ -30,60 +73,554 @@ def fetch_events(
     Requires an S3ServiceResource as a parameter; here's how to create it:
     >>> import boto3
     >>> s3_resource = boto3.resource("s3")
+
+    If `use_async` is True, objects are fetched by an asyncio-based engine, which
+    adapts the number of in-flight downloads (up to `num_concurrent_downloads`,
+    which can be in the hundreds) to how well S3 copes. In that case, make sure the
+    resource's connection pool is large enough:
+    >>> from botocore.config import Config
+    >>> s3_resource = boto3.resource("s3", config=Config(max_pool_connections=num_concurrent_downloads))
+
+    If `fields` is set, only those fields are extracted from events while parsing,
+    e.g., `fields={*FieldSnowplow}`, instead of all ~130 Snowplow fields.
+
+    Instead of timestamps or an object key prefix, `object_keys` can list the exact
+    keys of the objects to fetch.
+
+    If `cache` is set, objects are read from that local cache when they're in it, and
+    downloaded into it otherwise.
+
+    If `staging` is set (along with timestamps), each hour's parsed events are read
+    from that local Parquet staging when they're in it, and written to it otherwise.
+
+    If `num_parse_processes` is set, objects are still downloaded by threads (or
+    asyncio), but decompressed and parsed in a pool of that many processes, which,
+    unlike threads, don't contend for the GIL. Parsed events are sent back from
+    processes in the Arrow IPC format if pyarrow is installed, and pickled otherwise.
+
+    If `fields_categorical` is set, those fields are dictionary-encoded into pandas
+    categoricals as soon as each object is parsed, which hold each distinct value once
+    rather than one str per row, and stay categorical when objects are concatenated.
     """
-    # Grab S3 bucket
+    # Without a row budget, fetch_events_in_chunks yields everything as one chunk
+    chunks = fetch_events_in_chunks(
+        s3_resource=s3_resource,
+        site_name=site_name,
+        num_concurrent_downloads=num_concurrent_downloads,
+        timestamps=timestamps,
+        object_key=object_key,
+        use_async=use_async,
+        fields=fields,
+        object_keys=object_keys,
+        cache=cache,
+        staging=staging,
+        num_parse_processes=num_parse_processes,
+        fields_categorical=fields_categorical,
+    )
+    df = _concat(df_chunk for _, df_chunk in chunks)
+
+    logger.info(f"Fetched DataFrame shape: {df.shape}")
+
+    return df
+
+
+def fetch_events_in_chunks(
+    s3_resource: S3ServiceResource,
+    site_name: SiteName,
+    num_concurrent_downloads: int,
+    timestamps: Optional[List[datetime]] = None,
+    object_key: Optional[str] = None,
+    max_rows_per_chunk: Optional[int] = None,
+    use_async: bool = False,
+    fields: Optional[AbstractSet[str]] = None,
+    object_filter: Optional[Callable[[ObjectSummary], bool]] = None,
+    object_keys: Optional[List[str]] = None,
+    cache: Optional[ObjectCache] = None,
+    staging: Optional[Staging] = None,
+    num_parse_processes: Optional[int] = None,
+    fields_categorical: Optional[AbstractSet[str]] = None,
+) -> Iterator[Tuple[List[ObjectSummary], pd.DataFrame]]:
+    """
+    Streaming version of `fetch_events`. Instead of returning all events at once,
+    yields them chunk by chunk, alongside the S3 objects each chunk was made from.
+
+    A chunk is made of whole S3 objects and is yielded as soon as it holds at least
+    `max_rows_per_chunk` rows, so at most one chunk plus `num_concurrent_downloads`
+    objects are in memory at any time. If `max_rows_per_chunk` is None, all objects
+    are yielded as a single chunk.
+
+    If `object_filter` is set, only objects for which it returns True are fetched.
+
+    If `staging` is set, objects are fetched and chunked hour by hour rather than one
+    by one, so that each hour can be staged as a whole.
+    """
+    if staging is not None and not timestamps:
+        raise ValueError("Staging only works with timestamps, since events are staged by date-hour")
+
     bucket = s3_resource.Bucket(f"lnl-snowplow-{site_name}")
+    fetch: Callable[[List[ObjectSummary]], Iterable[pd.DataFrame]]
+
+    with ExitStack() as stack:
+        if use_async:
+            fetcher = AsyncFetcher(
+                max_concurrency=num_concurrent_downloads,
+                fields=fields,
+                cache=cache,
+                num_parse_processes=num_parse_processes,
+                fields_categorical=fields_categorical,
+            )
+            fetch = stack.enter_context(fetcher).map
+        else:
+            # Spread fetching tasks over a number of CPU threads. Until aioboto3 is
+            # thoroughly documented and isn't a pain to work with (or until boto3
+            # is asyncio-friendly), multithreading is a decent alternative and much
+            # (2x, using max_workers=os.cpu_count() + 4) faster than sequential fetching
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=num_concurrent_downloads))
+            fetch_decompress_parse: Callable[[ObjectSummary], pd.DataFrame]
+            if num_parse_processes:
+                executor_parse = stack.enter_context(_make_parse_executor(num_parse_processes))
+                fetch_decompress_parse = functools.partial(
+                    _fetch_decompress_parse_in_process,
+                    executor=executor_parse,
+                    fields=fields,
+                    cache=cache,
+                    fields_categorical=fields_categorical,
+                )
+            else:
+                fetch_decompress_parse = functools.partial(
+                    _fetch_decompress_parse, fields=fields, cache=cache, fields_categorical=fields_categorical
+                )
+            # mypy can't infer the return type of a partial of a generic method
+            fetch = functools.partial(executor.map, fetch_decompress_parse)  # type: ignore
+
+        parts: Iterator[Tuple[List[ObjectSummary], pd.DataFrame]]
+        if staging is not None and timestamps:
+            parts = _fetch_hours_staged(fetch, bucket, site_name, timestamps, staging, fields, object_filter)
+        else:
+            object_summaries: Iterable[ObjectSummary] = _get_object_summaries(bucket, timestamps, object_key, object_keys)
+            if object_filter is not None:
+                object_summaries = filter(object_filter, object_summaries)
+            # Only submit as many objects as can be downloaded concurrently at a time, so that downloads
+            # don't run too far ahead of the chunk currently being consumed. Fetching all data (even
+            # gzipped) from the get-go without a row budget might incur significant memory footprint,
+            # but this is a simple start
+            parts = _fetch_objects(
+                fetch, object_summaries, num_concurrent_downloads if max_rows_per_chunk is not None else None
+            )
 
-    # Get S3 objects to fetch
-    if object_key:
-        object_summaries = itertools.chain(*[bucket.objects.filter(Prefix=object_key)])
+        chunk_object_summaries: List[ObjectSummary] = []
+        chunk_dfs: List[pd.DataFrame] = []
+        num_rows = 0
+        # Each chunk is measured from when the previous one was consumed, so that time spent
+        # by the consumer (e.g., preprocessing and writing) isn't counted
+        stage = metrics.start("fetch_events")
+
+        for part_object_summaries, df in parts:
+            chunk_object_summaries.extend(part_object_summaries)
+            chunk_dfs.append(df)
+            num_rows += df.shape[0]
+
+            if max_rows_per_chunk is not None and num_rows >= max_rows_per_chunk:
+                df_chunk = _concat_chunk(chunk_object_summaries, chunk_dfs)
+                stage.finish(df_out=df_chunk, num_bytes=_get_size(chunk_object_summaries))
+                yield chunk_object_summaries, df_chunk
+                chunk_object_summaries, chunk_dfs, num_rows = [], [], 0
+                stage = metrics.start("fetch_events")
+
+        # Without a row budget, everything is yielded as one chunk, even if it's empty
+        if chunk_object_summaries or max_rows_per_chunk is None:
+            df_chunk = _concat_chunk(chunk_object_summaries, chunk_dfs)
+            stage.finish(df_out=df_chunk, num_bytes=_get_size(chunk_object_summaries))
+            yield chunk_object_summaries, df_chunk
+
+
+def _fetch_objects(
+    fetch: Callable[[List[ObjectSummary]], Iterable[pd.DataFrame]],
+    object_summaries: Iterable[ObjectSummary],
+    window_size: Optional[int],
+) -> Iterator[Tuple[List[ObjectSummary], pd.DataFrame]]:
+    """
+    Fetches objects `window_size` at a time (or all at once if None), yielding them
+    one by one.
+    """
+    windows = [list(object_summaries)] if window_size is None else _batch(object_summaries, window_size)
+    for window in windows:
+        for object_summary, df in zip(window, fetch(window)):
+            yield [object_summary], df
+
+
+def _fetch_hours_staged(
+    fetch: Callable[[List[ObjectSummary]], Iterable[pd.DataFrame]],
+    bucket: Bucket,
+    site_name: SiteName,
+    timestamps: List[datetime],
+    staging: Staging,
+    fields: Optional[AbstractSet[str]] = None,
+    object_filter: Optional[Callable[[ObjectSummary], bool]] = None,
+) -> Iterator[Tuple[List[ObjectSummary], pd.DataFrame]]:
+    """
+    Fetches objects hour by hour, yielding each hour's events as a whole, read from
+    staging if they're staged and parsed from S3 (and staged) otherwise.
+    """
+    for timestamp in timestamps:
+        object_summaries_hour = list(_get_object_summaries(bucket, [timestamp], None))
+        object_summaries = object_summaries_hour
+        if object_filter is not None:
+            object_summaries = [*filter(object_filter, object_summaries_hour)]
+        if not object_summaries:
+            continue
+
+        # If some of the hour's objects are filtered out (e.g., when resuming), the hour can't be
+        # read from or written to staging as a whole, so only fetch the rest
+        if len(object_summaries) < len(object_summaries_hour):
+            yield object_summaries, _concat(fetch(object_summaries))
+            continue
+
+        df = staging.get(site_name, timestamp, object_summaries, fields)
+        if df is None:
+            df = _concat(fetch(object_summaries))
+            staging.put(site_name, timestamp, object_summaries, df, fields)
+        yield object_summaries, df
+
+
+def _get_object_summaries(
+    bucket: Bucket,
+    timestamps: Optional[List[datetime]],
+    object_key: Optional[str],
+    object_keys: Optional[List[str]] = None,
+) -> Iterator[ObjectSummary]:
+    if object_keys:
+        # Listing by prefix gets summaries (ETag, size, etc.) like the other options do,
+        # but a key is also a prefix of any longer key, so only keep exact matches
+        object_summaries_by_key = [
+            [object_summary for object_summary in bucket.objects.filter(Prefix=key) if object_summary.key == key]
+            for key in object_keys
+        ]
+        return itertools.chain(*object_summaries_by_key)
+    elif object_key:
+        return itertools.chain(*[bucket.objects.filter(Prefix=object_key)])
     elif timestamps:
         object_summaries_by_timestamp = [
             bucket.objects.filter(Prefix=f"enriched/good/{ts.strftime('%Y/%m/%d/%H')}") for ts in timestamps
         ]
-        object_summaries = itertools.chain(*object_summaries_by_timestamp)
+        return itertools.chain(*object_summaries_by_timestamp)
     else:
-        raise ValueError("Need to provide either timestamps or object_key to fetch_events")
-
-    # Spread fetching tasks over a number of CPU threads. Until aioboto3 is
-    # thoroughly documented and isn't a pain to work with (or until boto3
-    # is asyncio-friendly), multithreading is a decent alternative and much
-    # (2x, using max_workers=os.cpu_count() + 4) faster than sequential fetching
-    #
-    # Fetching all data (even gzipped) from the get-go might incur significant
-    # memory footprint, but this is a simple start
-    with ThreadPoolExecutor(max_workers=num_concurrent_downloads) as executor:
-        dfs = executor.map(_fetch_decompress_parse, object_summaries)
-
-    # Append an empty DataFrame at the beginning in case len(dfs) == 0, in which
-    # case using dfs alone causes pd.concat throws an error
-    df = pd.concat([pd.DataFrame(), *dfs])
+        raise ValueError("Need to provide either timestamps, object_key or object_keys to fetch_events")
+
+
+def _batch(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _get_size(object_summaries: List[ObjectSummary]) -> int:
+    return sum(object_summary.size for object_summary in object_summaries)
 
-    logger.info(f"Fetched DataFrame shape: {df.shape}")
 
+def _concat_chunk(object_summaries: List[ObjectSummary], dfs: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    df = _concat(dfs)
+    logger.info(f"Fetched {len(object_summaries)} objects into a chunk of shape {df.shape}")
     return df
 
 
-def _fetch_decompress_parse(object_summary: ObjectSummary) -> pd.DataFrame:
+def _concat(dfs: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    # Objects have different sets of values, so pd.concat would decode categorical fields.
+    # Each object's rows are numbered from 0, so they're numbered anew, which lets
+    # preprocessors drop rows in place by label
+    return categorical.concat(dfs, ignore_index=True)
+
+
+def _fetch_decompress_parse(
+    object_summary: ObjectSummary,
+    fields: Optional[AbstractSet[str]] = None,
+    cache: Optional[ObjectCache] = None,
+    fields_categorical: Optional[AbstractSet[str]] = None,
+) -> pd.DataFrame:
+    if cache is not None:
+        with _fetch_object_cached(object_summary, cache) as content:
+            return _decompress_parse_object(content, fields, fields_categorical)
+
     response = _fetch_object(object_summary)
-    data = _decompress_object(response)
-    df = _parse_object(data)
+    # Decompress and parse the object's body while it's being downloaded
+    df = _decompress_parse_object(response["Body"], fields, fields_categorical)
     return df
 
 
+def _fetch_decompress_parse_in_process(
+    object_summary: ObjectSummary,
+    executor: Executor,
+    fields: Optional[AbstractSet[str]] = None,
+    cache: Optional[ObjectCache] = None,
+    fields_categorical: Optional[AbstractSet[str]] = None,
+) -> pd.DataFrame:
+    """
+    Downloads an object in the calling thread, then hands it over to a process of
+    `executor` to decompress and parse, and waits for its events.
+    """
+    with _download_object(object_summary, cache) as content:
+        data = content.read()
+    return _from_columnar(executor.submit(_decompress_parse_columnar, data, fields, fields_categorical).result())
+
+
+def _make_parse_executor(num_processes: int) -> ProcessPoolExecutor:
+    # Processes are spawned rather than forked, since forking a process that's running threads
+    # (e.g., downloads) isn't safe
+    return ProcessPoolExecutor(max_workers=num_processes, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _decompress_parse_columnar(
+    data: bytes, fields: Optional[AbstractSet[str]] = None, fields_categorical: Optional[AbstractSet[str]] = None
+) -> Union[bytes, pd.DataFrame]:
+    """
+    Decompresses and parses an object in a parsing process, returning its events in
+    the Arrow IPC format if pyarrow is installed, or as a DataFrame to be pickled
+    otherwise. Arrow IPC is more compact and much cheaper to deserialize in the main
+    process, where deserializing competes for the GIL with everything else.
+    Categorical fields are sent as Arrow dictionaries.
+    """
+    df = _decompress_parse_object(io.BytesIO(data), fields, fields_categorical)
+    return arrow.to_ipc(df) if arrow.is_installed() else df
+
+
+def _from_columnar(result: Union[bytes, pd.DataFrame]) -> pd.DataFrame:
+    return arrow.from_ipc(result) if isinstance(result, bytes) else result
+
+
 def _fetch_object(object_summary: ObjectSummary) -> GetObjectOutputTypeDef:
     return object_summary.get()
 
 
-def _decompress_object(object_response: GetObjectOutputTypeDef) -> bytes:
-    data = object_response["Body"].read()
-    # Assuming all objects are .gz files
-    data = gzip.decompress(data)
-    return data
+def _fetch_object_cached(object_summary: ObjectSummary, cache: ObjectCache) -> Content:
+    """
+    Returns an object's content from the cache, first downloading it into the cache
+    (streaming it to disk) if it isn't there.
+    """
+    content = cache.get(object_summary)
+    if content is None:
+        content = cache.put(object_summary, _fetch_object(object_summary)["Body"])
+    return content
 
 
-def _parse_object(object_data: bytes) -> pd.DataFrame:
-    data = object_data.decode("utf-8").strip().split("\n")
-    data = [json.loads(row) for row in data]
+def _decompress_parse_object(
+    object_body: Union[StreamingBody, BinaryIO, Content],
+    fields: Optional[AbstractSet[str]] = None,
+    fields_categorical: Optional[AbstractSet[str]] = None,
+) -> pd.DataFrame:
+    """
+    Incrementally decompresses a gzipped S3 object (assuming all objects are .gz
+    files) and parses it line by line, so that neither its whole decompressed
+    content nor a list of its lines is ever held in memory.
+    """
+    with gzip.GzipFile(fileobj=object_body) as lines:
+        return _parse_lines(lines, fields, fields_categorical)
+
+
+def _parse_lines(
+    lines: Iterable[bytes],
+    fields: Optional[AbstractSet[str]] = None,
+    fields_categorical: Optional[AbstractSet[str]] = None,
+) -> pd.DataFrame:
+    """
+    Parses newline-delimited JSON events into a DataFrame, one column buffer
+    per field. Fields missing from an event are filled with NaN.
+
+    If `fields` is set, only those fields are extracted, so no column buffers are
+    allocated for the others.
+
+    If `fields_categorical` is set, those fields are dictionary-encoded into
+    categoricals once the object is parsed, so each distinct value is only kept once
+    rather than once per row.
+    """
+    columns: Dict[str, List[Any]] = {}
+    num_rows = 0
+    # Field enums are cast to str so that columns are labeled with plain strings, same as
+    # when fields aren't projected
+    fields_projected = None if fields is None else [str(field) for field in fields]
+    fields_categorical_str = {str(field) for field in fields_categorical or ()}
+
+    for event in _decode_lines(lines):
+        items: Iterable[Tuple[str, Any]]
+        if fields_projected is None:
+            items = event.items()
+        else:
+            items = [(field, event[field]) for field in fields_projected if field in event]
+
+        for field, value in items:
+            column = columns.setdefault(field, [])
+            # Pad for previous events that didn't have this field
+            if len(column) < num_rows:
+                column.extend([np.nan] * (num_rows - len(column)))
+            column.append(value)
+        num_rows += 1
+
+    for field, column in columns.items():
+        if len(column) < num_rows:
+            column.extend([np.nan] * (num_rows - len(column)))
+        # Setting everything as str below would turn nested JSON values (e.g., self-describing
+        # events) into their Python repr, so serialize them back to JSON instead, for
+        # ConvertFieldTypes to decode with a JSON parser. A field is either always nested or
+        # never, so only its first non-missing value needs checking
+        if isinstance(_get_first_value(column), (dict, list)):
+            columns[field] = [json.dumps(value) if isinstance(value, (dict, list)) else value for value in column]
+
     # Setting everything as str because we'll do our own typecasting later
-    return pd.DataFrame(data, dtype=str)
+    df = pd.DataFrame(columns, dtype=str)
+    for field in fields_categorical_str.intersection(df.columns):
+        # Encoding the whole column at once hashes values in C, which is much faster than
+        # looking each value up while parsing. JSON nulls become missing values
+        df[field] = df[field].astype("category")
+    return df
+
+
+def _get_first_value(column: List[Any]) -> Any:
+    # Padding is the np.nan object itself, and None is JSON's null
+    return next((value for value in column if value is not np.nan and value is not None), None)
+
+
+def _decode_lines(lines: Iterable[bytes], batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """
+    Decodes newline-delimited JSON events `batch_size` lines at a time, skipping
+    blank lines. Batching keeps memory bounded while saving a decoder call per line.
+    """
+    lines_nonblank = (line for line in lines if line.strip())
+    for batch in _batch(lines_nonblank, batch_size):
+        yield from loads_lines(batch)
+
+
+class AsyncFetcher:
+    """
+    Asyncio-based engine to fetch, decompress and parse S3 objects.
+
+    boto3 isn't asyncio-friendly, so each GET (and reading its body) still blocks a
+    thread, but one from a pool large enough to keep up to `max_concurrency` GETs
+    in flight, since they spend nearly all their time waiting on the network. The
+    event loop caps how many of them actually are at a time with an AdaptiveLimiter,
+    which backs off when S3 throttles or errors out and retries those GETs (other
+    errors, e.g., a missing object, are raised right away), and hands
+    CPU-bound decompression and parsing over to a separate, CPU-sized pool, of threads
+    or, if `num_parse_processes` is set, of that many processes.
+    >>> with AsyncFetcher(max_concurrency=256) as fetcher:
+    ...     dfs = fetcher.map(object_summaries)
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_attempts: int = 5,
+        backoff_base: float = 0.1,
+        fields: Optional[AbstractSet[str]] = None,
+        cache: Optional[ObjectCache] = None,
+        num_parse_processes: Optional[int] = None,
+        fields_categorical: Optional[AbstractSet[str]] = None,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.fields = fields
+        self.cache = cache
+        self.num_parse_processes = num_parse_processes
+        self.fields_categorical = fields_categorical
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        # Start at a quarter of the allowed concurrency and let the limiter ramp up from there.
+        # The limit is carried over from one map call to the next
+        self._limit = max(1, max_concurrency // 4)
+        self._executor_io = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._executor_cpu: Executor
+        if num_parse_processes:
+            self._executor_cpu = _make_parse_executor(num_parse_processes)
+        else:
+            self._executor_cpu = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+    def __enter__(self) -> "AsyncFetcher":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self._executor_io.shutdown()
+        self._executor_cpu.shutdown()
+
+    def map(self, object_summaries: Iterable[ObjectSummary]) -> List[pd.DataFrame]:
+        """
+        Fetches, decompresses and parses S3 objects, returning one DataFrame per
+        object, in the same order as the objects.
+        """
+        return asyncio.run(self._map(object_summaries))
+
+    async def _map(self, object_summaries: Iterable[ObjectSummary]) -> List[pd.DataFrame]:
+        limiter = AdaptiveLimiter(limit_max=self.max_concurrency, limit_initial=self._limit, is_failure=_is_retryable)
+        try:
+            return await asyncio.gather(
+                *[self._fetch_decompress_parse(object_summary, limiter) for object_summary in object_summaries]
+            )
+        finally:
+            self._limit = limiter.limit
+
+    async def _fetch_decompress_parse(self, object_summary: ObjectSummary, limiter: AdaptiveLimiter) -> pd.DataFrame:
+        loop = asyncio.get_running_loop()
+        content = await self._download(object_summary, limiter)
+        if not self.num_parse_processes:
+            return await loop.run_in_executor(
+                self._executor_cpu, _decompress_parse, content, self.fields, self.fields_categorical
+            )
+
+        with content:
+            data = content.read()
+        result = await loop.run_in_executor(
+            self._executor_cpu, _decompress_parse_columnar, data, self.fields, self.fields_categorical
+        )
+        # Deserialize off the event loop's thread, so it doesn't hold up downloads
+        return await loop.run_in_executor(self._executor_io, _from_columnar, result)
+
+    async def _download(self, object_summary: ObjectSummary, limiter: AdaptiveLimiter) -> Content:
+        loop = asyncio.get_running_loop()
+        attempt = 1
+        while True:
+            try:
+                async with limiter:
+                    return await loop.run_in_executor(self._executor_io, _download_object, object_summary, self.cache)
+            except Exception as e:
+                if attempt == self.max_attempts or not _is_retryable(e):
+                    raise
+                logger.warning(f"Attempt #{attempt} to fetch {object_summary.key} failed ({e}), retrying")
+                # Exponential backoff
+                await asyncio.sleep(self.backoff_base * 2 ** (attempt - 1))
+                attempt += 1
+
+
+# Error codes S3 throttles requests with
+# (see: https://docs.aws.amazon.com/AmazonS3/latest/API/ErrorResponses.html#ErrorCodeList)
+_ERROR_CODES_THROTTLING = {"RequestTimeout", "SlowDown", "Throttling", "ThrottlingException", "TooManyRequestsException"}
+
+
+def _is_retryable(e: BaseException) -> bool:
+    """
+    Whether a failed GET is worth retrying: S3 throttled it or failed on its end
+    (5xx), or the connection failed. Other errors (e.g., NoSuchKey, AccessDenied)
+    won't go away by retrying.
+    """
+    from botocore.exceptions import ClientError
+    from botocore.exceptions import ConnectionError as BotocoreConnectionError
+    from botocore.exceptions import HTTPClientError, IncompleteReadError
+
+    if isinstance(e, ClientError):
+        code = e.response.get("Error", {}).get("Code")
+        status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return code in _ERROR_CODES_THROTTLING or status == 429 or status >= 500
+    return isinstance(e, (BotocoreConnectionError, HTTPClientError, IncompleteReadError, ConnectionError, TimeoutError))
+
+
+def _download_object(object_summary: ObjectSummary, cache: Optional[ObjectCache] = None) -> Content:
+    if cache is not None:
+        return _fetch_object_cached(object_summary, cache)
+    return io.BytesIO(_fetch_object(object_summary)["Body"].read())
+
+
+def _decompress_parse(
+    content: Content, fields: Optional[AbstractSet[str]] = None, fields_categorical: Optional[AbstractSet[str]] = None
+) -> pd.DataFrame:
+    with content:
+        return _decompress_parse_object(content, fields, fields_categorical)
@@ -0,0 +1,84 @@
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, TypeVar, Union
+
+import numpy as np
+import pandas as pd
+
+# pyarrow is optional and imported on first use, since it's slow to import
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+
+def is_installed() -> bool:
+    """
+    Checks if pyarrow is installed, without importing it.
+    """
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def to_pandas(table: Any) -> pd.DataFrame:
+    """
+    Converts an Arrow table of parsed events back to a DataFrame like the one they
+    were parsed into. Arrow nulls come back as None, whereas freshly parsed events
+    have NaN for missing values (and JSON nulls, which both end up as Arrow nulls),
+    so nulls are replaced with NaN. The table can't be used afterwards.
+    """
+    names_null = [name for name, column in zip(table.column_names, table.itercolumns()) if column.null_count > 0]
+    # Converting column by column and freeing each once converted keeps peak memory down
+    # (see: https://arrow.apache.org/docs/python/pandas.html#reducing-memory-use-in-table-to-pandas)
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    for name in names_null:
+        df[name] = df[name].where(df[name].notna(), np.nan)
+    return df
+
+
+def to_ipc(df: pd.DataFrame) -> bytes:
+    """
+    Serializes a DataFrame of parsed events in the Arrow IPC streaming format, which
+    is more compact and much cheaper to deserialize than a pickled DataFrame of str
+    objects.
+    """
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def from_ipc(data: Union[bytes, memoryview]) -> pd.DataFrame:
+    """
+    Deserializes a DataFrame serialized by `to_ipc`.
+    """
+    import pyarrow as pa
+
+    with pa.ipc.open_stream(data) as reader:
+        table = reader.read_all()
+    return to_pandas(table)
+
+
+def map_threaded(function: Callable[[T], U], values: Iterable[T]) -> List[U]:
+    """
+    Calls a function on each value in a pool of as many threads as there are CPU cores.
+    Arrow's compute functions release the GIL, so functions spending their time in them
+    (e.g., casting or filtering a column) run in parallel.
+    """
+    import pyarrow as pa
+
+    with ThreadPoolExecutor(max_workers=pa.cpu_count()) as executor:
+        return list(executor.map(function, values))
+
+
+def filter(table: Any, mask: np.ndarray) -> Any:
+    """
+    Keeps the rows of an Arrow table where a boolean mask is True, filtering its columns
+    in parallel (see `map_threaded`).
+    """
+    import pyarrow as pa
+
+    mask_arrow = pa.array(mask, type=pa.bool_())
+    columns = map_threaded(lambda column: column.filter(mask_arrow), table.columns)
+    return pa.Table.from_arrays(columns, schema=table.schema)
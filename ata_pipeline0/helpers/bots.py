@@ -0,0 +1,67 @@
+import functools
+import re
+from enum import Enum
+from typing import Any, Pattern
+
+import pandas as pd
+
+
+class BotDetector(str, Enum):
+    """
+    Enum of engines that can tell if a user agent string belongs to a bot.
+    """
+
+    # Fully parses user agents with the user-agents package, which says a user agent is
+    # a bot if its device family is "Spider"
+    USER_AGENTS = "user-agents"
+    # Matches user agents against a single precompiled regex of crawler patterns
+    REGEX = "regex"
+
+
+@functools.lru_cache(maxsize=None)
+def get_pattern_bot() -> Pattern[str]:
+    """
+    Combines the regexes ua-parser (which user-agents uses under the hood) maps to the
+    "Spider" device family into a single regex, so that the two detectors stay in sync.
+
+    Unlike ua-parser, which takes the first device regex that matches a user agent, the
+    combined regex doesn't check device regexes that precede the crawler ones, so a user
+    agent with both a device model and a crawler token (e.g., an Android WhatsApp link
+    previewer) is a bot to the regex detector but not to user-agents.
+
+    Compiled on first call rather than at import, since loading ua-parser's regexes
+    takes a while. This reads ua-parser's parser list, which isn't part of its public
+    API, hence its version being pinned in pyproject.toml.
+    """
+    from ua_parser.user_agent_parser import DEVICE_PARSERS
+
+    patterns = []
+    for parser in DEVICE_PARSERS:
+        if parser.device_replacement != "Spider":
+            continue
+        flags = "i" if parser.user_agent_re.flags & re.IGNORECASE else ""
+        patterns.append(f"(?{flags}:{parser.pattern})")
+
+    # Fail loudly rather than let every user agent through if ua-parser's internals change
+    if not patterns:
+        raise RuntimeError("Found no crawler regexes in ua-parser's device parsers")
+
+    return re.compile("|".join(patterns))
+
+
+def is_bot_regex(user_agents: pd.Series) -> pd.Series:
+    """
+    Checks a Series of user agent strings against the combined crawler regex.
+    Non-string values (e.g., missing user agents) are considered bots.
+
+    >>> is_bot_regex(pd.Series(["Mozilla/5.0 (compatible; bingbot/2.0)", None])).tolist()
+    [True, True]
+    """
+    # Same single pass over the column as Series.str.contains, which can't be used here
+    # because it raises if the Series happens to hold no strings at all
+    pattern_bot = get_pattern_bot()
+
+    def is_bot(user_agent: Any) -> bool:
+        return not isinstance(user_agent, str) or pattern_bot.search(user_agent) is not None
+
+    return user_agents.map(is_bot).astype(bool)
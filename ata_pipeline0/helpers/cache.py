@@ -0,0 +1,141 @@
+import contextlib
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import tempfile
+from typing import IO, TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+from ata_pipeline0.helpers.logging import logging
+
+if TYPE_CHECKING:
+    from botocore.response import StreamingBody
+    from mypy_boto3_s3.service_resource import ObjectSummary
+
+logger = logging.getLogger(__name__)
+
+# Read-only memory map of a cached object, or an empty buffer for an empty object, which can't be memory-mapped
+Content = Union[mmap.mmap, io.BytesIO]
+
+# Files being written are named with this prefix until they're complete, so they're never read or evicted
+_PREFIX_TEMPORARY = ".tmp-"
+
+# Share of `size_max` the cache is brought down to once it's over it, so that eviction
+# doesn't happen again on the very next object
+_SIZE_LOW_WATER = 0.9
+
+
+class ObjectCache:
+    """
+    Local on-disk cache of S3 objects' content, by bucket, key and ETag. Once it
+    takes up more than `size_max` bytes, the least recently used objects are evicted
+    until it's back under 90% of that. Cached content is memory-mapped.
+    """
+
+    def __init__(self, directory: str, size_max: int) -> None:
+        self.directory = directory
+        self.size_max = size_max
+        # Size of the cache directory, scanned on the first write rather than up front. Each
+        # process only adds its own writes, so the cache may go over size_max by what
+        # others wrote since, until the next scan
+        self._size: Optional[int] = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Processes scan the directory themselves, since others may have written to it since
+        return {**self.__dict__, "_size": None}
+
+    def get(self, object_summary: "ObjectSummary") -> Optional[Content]:
+        """
+        Returns a read-only memory map of an object's cached content, or None if it
+        isn't cached. Close it when done, e.g., by using it as a context manager.
+        """
+        path = self._get_path(object_summary)
+        try:
+            with open(path, "rb") as f:
+                content = _map(f)
+        except FileNotFoundError:
+            return None
+
+        # Mark as recently used. mtime is used rather than atime, which many filesystems don't update.
+        # The file may have been evicted by another process since it was opened, but it's mapped already
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        return content
+
+    def put(self, object_summary: "ObjectSummary", body: Union[IO[bytes], "StreamingBody"]) -> Content:
+        """
+        Copies an object's content into the cache from a file-like body (e.g., a
+        streaming S3 response body), evicting older objects if needed, and returns
+        a read-only memory map of it.
+        """
+        path = self._get_path(object_summary)
+        with tempfile.NamedTemporaryFile(dir=self.directory, prefix=_PREFIX_TEMPORARY, delete=False) as f:
+            try:
+                shutil.copyfileobj(body, f)
+                f.flush()
+                # Map the file before it's renamed, so that it's still readable even if another
+                # process evicts it right after
+                content = _map(f)
+                size_file = os.fstat(f.fileno()).st_size
+                os.replace(f.name, path)
+            except BaseException:
+                os.remove(f.name)
+                raise
+
+        # The directory is only scanned for the first write, and then to evict
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._scan())
+        else:
+            self._size += size_file
+        if self._size > self.size_max:
+            self._evict(path_keep=path)
+        return content
+
+    def _get_path(self, object_summary: "ObjectSummary") -> str:
+        name = f"{object_summary.bucket_name}/{object_summary.key}/{object_summary.e_tag}"
+        return os.path.join(self.directory, hashlib.sha256(name.encode()).hexdigest())
+
+    def _evict(self, path_keep: str) -> None:
+        """
+        Deletes the least recently used files until the cache fits in 90% of
+        `size_max`, except for `path_keep` (the file just written), so that an object
+        larger than the cap can still be read once.
+        """
+        files = self._scan()
+        size = sum(size for _, size, _ in files)
+        for _, size_file, path in sorted(files):
+            if size <= self.size_max * _SIZE_LOW_WATER:
+                break
+            if path == path_keep:
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            size -= size_file
+            logger.debug(f"Evicted {path} from the S3 object cache")
+
+        self._size = size
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        """
+        Lists the modification time, size and path of every complete file in the cache.
+        """
+        files: List[Tuple[float, int, str]] = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(_PREFIX_TEMPORARY) or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # Evicted by another process in the meantime
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+
+def _map(f: IO[bytes]) -> Content:
+    if os.fstat(f.fileno()).st_size == 0:
+        return io.BytesIO()
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
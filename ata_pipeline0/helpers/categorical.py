@@ -0,0 +1,43 @@
+from typing import Dict, Iterable, List
+
+import pandas as pd
+
+
+def concat(dfs: Iterable[pd.DataFrame], ignore_index: bool = False) -> pd.DataFrame:
+    """
+    Concatenates DataFrames like `pd.concat`, except categorical columns stay
+    categorical even if their categories differ from one DataFrame to the next
+    (`pd.concat` would decode them into object columns), by recoding them to the
+    union of their categories first. Recoding only maps codes, not values.
+    """
+    # Start with an empty DataFrame in case dfs is empty, which pd.concat doesn't accept
+    dfs = [pd.DataFrame(), *dfs]
+
+    categories_by_field: Dict[str, List[pd.Index]] = {}
+    for df in dfs:
+        for field, dtype in df.dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype):
+                categories_by_field.setdefault(str(field), []).append(dtype.categories)
+
+    for field, categories in categories_by_field.items():
+        if len(categories) < 2:
+            continue
+        dtype = pd.CategoricalDtype(pd.Index(categories[0]).append(categories[1:]).unique())
+        for i, df in enumerate(dfs):
+            dtype_df = df.dtypes.get(field)
+            if isinstance(dtype_df, pd.CategoricalDtype) and not dtype_df.categories.equals(dtype.categories):
+                # Shallow copy, so that other columns aren't copied and the caller's DataFrame isn't modified
+                dfs[i] = df = df.copy(deep=False)
+                df[field] = df[field].astype(dtype)
+
+    return pd.concat(dfs, ignore_index=ignore_index)
+
+
+def decode(values: pd.Series) -> pd.Series:
+    """
+    Decodes a categorical column back into an object column of its values, with
+    None for missing values, as written to the DB.
+    >>> decode(pd.Series(pd.Categorical(["a", None, "a"]))).tolist()
+    ['a', None, 'a']
+    """
+    return values.astype(object).where(values.notna(), None)
@@ -0,0 +1,83 @@
+import functools
+import time
+from typing import TYPE_CHECKING, Optional, Tuple
+
+import boto3
+from ata_db_models.helpers import get_conn_string
+from botocore.config import Config
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from ata_pipeline0.helpers.logging import logging
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.service_resource import S3ServiceResource
+
+logger = logging.getLogger(__name__)
+
+# boto3's default size of a connection pool
+_MAX_POOL_CONNECTIONS_MIN = 10
+
+# S3 resource shared by all calls in this process, and the size of its connection pool
+_s3_resource: Optional["S3ServiceResource"] = None
+_s3_max_pool_connections = 0
+
+# Number of clients built in this process, to tell whether a call built any (cold) or not (warm)
+_num_clients_built = 0
+
+
+def get_clients(max_pool_connections: int) -> Tuple["S3ServiceResource", sessionmaker]:
+    """
+    Returns an S3 resource and a DB session factory. Both are cached at the module
+    level, so on AWS Lambda, warm invocations reuse the clients (and their open
+    connections) of the first, cold one instead of building new ones.
+
+    Logs how long setting them up took, including checking out a DB connection,
+    and whether any of them had to be built (cold) or not (warm).
+    """
+    num_clients_built = _num_clients_built
+    start = time.perf_counter()
+    s3_resource = get_s3_resource(max_pool_connections)
+    session_factory = get_session_factory()
+    # Connect now rather than on the first write, so that setup time includes it (the
+    # connection then goes back to the pool for the pipeline to use)
+    with session_factory() as session:
+        session.connection()
+
+    is_warm = _num_clients_built == num_clients_built
+    logger.info(f"Set up S3 and DB clients in {time.perf_counter() - start:.3f}s ({'warm' if is_warm else 'cold'})")
+    return s3_resource, session_factory
+
+
+def get_s3_resource(max_pool_connections: int) -> "S3ServiceResource":
+    """
+    Returns the S3 resource of this process, whose connection pool holds at least
+    `max_pool_connections` connections. It's only built again if asked for a larger
+    pool than it has, so that invocations downloading different numbers of objects
+    share it.
+    """
+    global _s3_resource, _s3_max_pool_connections, _num_clients_built
+
+    if _s3_resource is None or max_pool_connections > _s3_max_pool_connections:
+        # The pool would otherwise bottleneck concurrent downloads. Connections are only
+        # opened as needed, so it's never made smaller than boto3's default, which already
+        # covers the handler's downloads (see: main.HANDLER_CONCURRENCY_MAX)
+        _s3_max_pool_connections = max(max_pool_connections, _MAX_POOL_CONNECTIONS_MIN)
+        _s3_resource = boto3.resource("s3", config=Config(max_pool_connections=_s3_max_pool_connections))
+        _num_clients_built += 1
+
+    return _s3_resource
+
+
+@functools.lru_cache(maxsize=None)
+def get_session_factory() -> sessionmaker:
+    global _num_clients_built
+
+    # A Lambda container handles one invocation at a time, and the pipeline uses one
+    # DB connection at a time, so keep a single connection (plus one spare) around.
+    # Connections may go stale while the container is frozen between invocations, so
+    # test them before use and recycle them after a while
+    # (see: https://docs.sqlalchemy.org/en/14/core/pooling.html#disconnect-handling-pessimistic)
+    engine = create_engine(get_conn_string(), pool_size=1, max_overflow=1, pool_pre_ping=True, pool_recycle=600)
+    _num_clients_built += 1
+    return sessionmaker(engine)
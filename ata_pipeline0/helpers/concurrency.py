@@ -0,0 +1,54 @@
+import asyncio
+from types import TracebackType
+from typing import Callable, Optional, Type
+
+
+class AdaptiveLimiter:
+    """
+    Asyncio concurrency limiter whose limit adapts to how well the downstream
+    service copes, additive-increase/multiplicative-decrease (AIMD) style, like
+    TCP congestion control: every window of `limit` tasks that succeed raises the
+    limit by 1, up to `limit_max`, and every task that fails (e.g., gets throttled)
+    halves it. Exceptions for which `is_failure` returns False (e.g., a missing
+    object) leave the limit as it is.
+
+    Must be created from within a running event loop.
+    >>> async with limiter:
+    ...     await do_something()
+    """
+
+    def __init__(
+        self,
+        limit_max: int,
+        limit_initial: Optional[int] = None,
+        is_failure: Optional[Callable[[BaseException], bool]] = None,
+    ) -> None:
+        self.limit_max = limit_max
+        self.limit = min(limit_max, limit_initial or limit_max)
+        self.is_failure = is_failure
+        self._num_in_flight = 0
+        self._num_succeeded = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._num_in_flight < self.limit)
+            self._num_in_flight += 1
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        async with self._condition:
+            self._num_in_flight -= 1
+            if exc is None:
+                self._num_succeeded += 1
+                if self._num_succeeded >= self.limit:
+                    self.limit = min(self.limit_max, self.limit + 1)
+                    self._num_succeeded = 0
+            elif self.is_failure is None or self.is_failure(exc):
+                self.limit = max(1, self.limit // 2)
+                self._num_succeeded = 0
+            self._condition.notify_all()
@@ -0,0 +1,77 @@
+from datetime import timedelta
+from typing import AbstractSet, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ata_pipeline0.helpers.fields import FieldSnowplow
+
+# Stands for event IDs that haven't been written
+_TIMESTAMP_NONE = np.iinfo(np.int64).min
+
+# Number of events kept below which old ones aren't pruned
+_NUM_EVENTS_PRUNED_MIN = 10_000
+
+
+class EventsWritten:
+    """
+    Derived timestamps (as nanoseconds) of the events a streaming pipeline run has
+    inserted, by event ID, so that duplicates split across chunks can be told apart
+    (see `run_pipeline`).
+
+    To bound memory usage, events more than `window` older than the latest one
+    inserted are forgotten, so duplicates further apart than that aren't detected.
+    """
+
+    def __init__(self, window: timedelta) -> None:
+        self.window = window
+        self._timestamps: Dict[str, int] = {}
+        self._timestamp_max = _TIMESTAMP_NONE
+        self._num_events_pruned = _NUM_EVENTS_PRUNED_MIN
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def split(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Splits preprocessed events into those whose event ID hasn't been inserted,
+        and those that duplicate an event inserted with a later derived timestamp.
+        Events that duplicate an event inserted with an earlier (or the same)
+        timestamp are dropped.
+        """
+        if not self._timestamps:
+            return df, df.iloc[:0]
+
+        # Only the chunk's event IDs are looked up, rather than mapping them through all events kept
+        timestamps_prev = np.fromiter(
+            (self._timestamps.get(event_id, _TIMESTAMP_NONE) for event_id in df[FieldSnowplow.EVENT_ID]),
+            dtype=np.int64,
+            count=df.shape[0],
+        )
+        is_inserted = timestamps_prev != _TIMESTAMP_NONE
+        is_earlier = is_inserted & (_get_timestamps(df) < timestamps_prev)
+        return df[~is_inserted], df[is_earlier]
+
+    def add(self, df: pd.DataFrame, event_ids: AbstractSet[str]) -> None:
+        """
+        Records the events of a DataFrame whose event ID is in `event_ids`, i.e.,
+        those that were actually inserted, and forgets old ones once there are twice
+        as many as after they were last forgotten.
+        """
+        is_added = df[FieldSnowplow.EVENT_ID].isin(event_ids).to_numpy()
+        timestamps = _get_timestamps(df)[is_added]
+        self._timestamps.update(zip(df[FieldSnowplow.EVENT_ID].to_numpy()[is_added], timestamps.tolist()))
+        if timestamps.size > 0:
+            self._timestamp_max = max(self._timestamp_max, int(timestamps.max()))
+
+        if len(self._timestamps) > 2 * self._num_events_pruned:
+            timestamp_min = self._timestamp_max - pd.Timedelta(self.window).value
+            self._timestamps = {
+                event_id: timestamp for event_id, timestamp in self._timestamps.items() if timestamp >= timestamp_min
+            }
+            self._num_events_pruned = max(len(self._timestamps), _NUM_EVENTS_PRUNED_MIN)
+
+
+def _get_timestamps(df: pd.DataFrame) -> np.ndarray:
+    # Timezone-aware timestamps as nanoseconds since the epoch, in UTC
+    return pd.DatetimeIndex(df[FieldSnowplow.DERIVED_TSTAMP]).asi8
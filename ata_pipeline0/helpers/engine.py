@@ -0,0 +1,13 @@
+from enum import Enum
+
+
+class Engine(str, Enum):
+    """
+    Enum of engines preprocessors can run on (see `preprocess_events`).
+    """
+
+    # pandas DataFrames, which preprocessors transform on a single core
+    PANDAS = "pandas"
+    # Arrow tables, which preprocessors transform with pyarrow's compute functions, running
+    # column-wise work (type conversion, filtering) in parallel threads. Requires pyarrow
+    ARROW = "arrow"
@@ -0,0 +1,68 @@
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+Loads = Callable[[Union[bytes, str]], Any]
+
+# Faster decoders are optional: use them when installed, otherwise fall back to the standard library
+_BACKENDS: Dict[str, Loads] = {"json": json.loads}
+
+try:
+    import orjson
+
+    _BACKENDS["orjson"] = orjson.loads
+except ImportError:
+    pass
+
+try:
+    import simdjson
+
+    _BACKENDS["simdjson"] = simdjson.loads
+except ImportError:
+    pass
+
+# In order of preference
+_BACKENDS_PREFERRED = ["orjson", "simdjson", "json"]
+
+
+def get_loads(backend: Optional[str] = None) -> Loads:
+    """
+    Returns the `loads` function of the given JSON backend ("orjson", "simdjson" or
+    "json"), or of the fastest one installed if no backend is given.
+
+    >>> get_loads("json")("{\"a\": 1}")
+    {'a': 1}
+    """
+    if backend is None:
+        backend = next(name for name in _BACKENDS_PREFERRED if name in _BACKENDS)
+    elif backend not in _BACKENDS:
+        raise ValueError(f"JSON backend {backend} isn't installed. Installed backends: {sorted(_BACKENDS)}")
+    return _BACKENDS[backend]
+
+
+loads = get_loads()
+
+
+def loads_lines(lines: Sequence[bytes], loads: Loads = loads) -> List[Any]:
+    """
+    Decodes a batch of newline-delimited JSON lines in a single call by wrapping
+    them in a JSON array, which saves a Python-level call per line.
+
+    If the batch doesn't decode as a whole, lines are decoded one by one, so that
+    the error raised points at the offending line.
+
+    >>> loads_lines([b"{\"a\": 1}", b"{\"a\": 2}"])
+    [{'a': 1}, {'a': 2}]
+    """
+    if not lines:
+        return []
+
+    try:
+        values = loads(b"[" + b",".join(lines) + b"]")
+    except ValueError:
+        return [loads(line) for line in lines]
+
+    # A line holding several values separated by commas (e.g. b"1, 2") would be
+    # flattened into the array, so only trust the batch if counts match
+    if len(values) != len(lines):
+        return [loads(line) for line in lines]
+    return values
@@ -19,11 +19,20 @@ CONFIG = {
             "format": "%(levelname)-8s  %(name)s:%(lineno)s: %(message)s",
             # "datefmt": "%Y-%m-%d %H:%M:%S",
         },
+        # Metrics are logged as bare JSON lines, which CloudWatch can parse (e.g., in the Embedded Metric Format)
+        "bare": {"format": "%(message)s"},
     },
     "handlers": {
         "default": {"formatter": "standard", "class": "logging.StreamHandler"},
+        "metrics": {"formatter": "bare", "class": "logging.StreamHandler", "stream": "ext://sys.stdout"},
     },
     "root": {"handlers": ["default"], "level": "INFO"},
+    "loggers": {
+        # boto3 and friends are imported lazily, i.e., possibly after this config is applied, in which
+        # case disable_existing_loggers doesn't apply to their loggers, so quiet them explicitly
+        **{name: {"level": "WARNING"} for name in ["boto3", "botocore", "s3transfer", "urllib3"]},
+        "ata_pipeline0.helpers.metrics": {"handlers": ["metrics"], "level": "INFO", "propagate": False},
+    },
 }
 
 logging.config.dictConfig(CONFIG)
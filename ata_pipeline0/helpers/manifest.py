@@ -0,0 +1,78 @@
+import contextlib
+import re
+import sqlite3
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Set, Tuple
+
+from ata_pipeline0.helpers.site import SiteName
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.service_resource import ObjectSummary
+
+# Snowplow's S3 loader partitions object keys by date-hour, e.g., enriched/good/2022/11/23/00/...
+_PATTERN_HOUR = re.compile(r"(\d{4})/(\d{2})/(\d{2})/(\d{2})")
+
+
+class Manifest:
+    """
+    Local SQLite record of S3 objects, by key and ETag, whose events have been
+    written to the DB, so that a resumed backfill can skip them.
+    """
+
+    def __init__(self, path: str, timeout: float = 60.0) -> None:
+        self.path = path
+        self.timeout = timeout
+
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS object (
+                    site_name TEXT NOT NULL,
+                    hour TEXT,
+                    key TEXT NOT NULL,
+                    etag TEXT NOT NULL,
+                    PRIMARY KEY (site_name, key, etag)
+                )
+                """
+            )
+
+    def get_objects_done(self, site_name: SiteName) -> Set[Tuple[str, str]]:
+        """
+        Returns the (key, ETag) pairs of all objects recorded for a site.
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT key, etag FROM object WHERE site_name = ?", (site_name.value,)).fetchall()
+        return {(key, etag) for key, etag in rows}
+
+    def add_objects_done(self, site_name: SiteName, object_summaries: Iterable["ObjectSummary"]) -> None:
+        """
+        Records objects as done. Call this only once their events have been committed
+        to the DB.
+        """
+        rows = [
+            (site_name.value, _get_hour(object_summary.key), object_summary.key, object_summary.e_tag)
+            for object_summary in object_summaries
+        ]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR IGNORE INTO object VALUES (?, ?, ?, ?)", rows)
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Connecting on each call keeps instances picklable for worker processes. A
+        # sqlite3.Connection context manager only commits or rolls back, so close it separately
+        with contextlib.closing(sqlite3.connect(self.path, timeout=self.timeout)) as conn:
+            with conn:
+                yield conn
+
+
+def _get_hour(object_key: str) -> Optional[str]:
+    """
+    Gets the date-hour an object's key is partitioned by, if any.
+
+    >>> _get_hour("enriched/good/2022/11/23/00/a.gz")
+    '2022-11-23 00:00'
+    """
+    match = _PATTERN_HOUR.search(object_key)
+    if match is None:
+        return None
+    year, month, day, hour = match.groups()
+    return f"{year}-{month}-{day} {hour}:00"
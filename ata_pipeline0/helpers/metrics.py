@@ -0,0 +1,196 @@
+import json
+import os
+import resource
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from ata_pipeline0.helpers.logging import logging
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Metrics are logged by their own logger, whose records are bare JSON lines (see helpers/logging.py),
+# so that CloudWatch can parse them
+logger = logging.getLogger(__name__)
+
+# CloudWatch namespace metrics are put under when logged in the Embedded Metric Format
+NAMESPACE_EMF = "ata-pipeline0"
+
+
+@dataclass
+class StageMetrics:
+    """
+    Measurements of a pipeline stage (e.g., a preprocessor, or fetching a chunk).
+
+    CPU time is the whole process', including threads the stage ran work on. Bytes are
+    the stage's output: the compressed size of the S3 objects fetched, or the shallow
+    in-memory size of the DataFrame preprocessed or written (object columns count 8
+    bytes per row). Peak memory is the process' peak RSS so far, and how much the
+    stage raised it.
+    """
+
+    stage: str
+    seconds_wall: float
+    seconds_cpu: float
+    num_rows_in: Optional[int]
+    num_rows_out: Optional[int]
+    num_bytes: Optional[int]
+    memory_peak_bytes: int
+    memory_peak_increase_bytes: int
+
+
+Hook = Callable[[StageMetrics], None]
+
+# Called with the metrics of each stage once it's over. While there are none, stages
+# aren't measured at all
+_hooks: List[Hook] = []
+
+
+def add_hook(hook: Hook) -> None:
+    """
+    Registers a function to be called with the metrics of every stage from then on.
+    >>> add_hook(log_json)
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    _hooks.remove(hook)
+
+
+class Stage:
+    """
+    A stage being measured, started by `start`.
+    """
+
+    def __init__(self, name: str, df_in: Optional["pd.DataFrame"] = None) -> None:
+        self.name = name
+        self.num_rows_in = None if df_in is None else df_in.shape[0]
+        self._memory_peak_start = _get_memory_peak()
+        self._seconds_cpu_start = time.process_time()
+        self._seconds_wall_start = time.perf_counter()
+
+    def finish(
+        self,
+        df_out: Optional["pd.DataFrame"] = None,
+        num_rows_out: Optional[int] = None,
+        num_bytes: Optional[int] = None,
+    ) -> None:
+        """
+        Ends the stage and passes its metrics to hooks. The number of rows out and of
+        bytes default to those of `df_out`.
+        """
+        seconds_wall = time.perf_counter() - self._seconds_wall_start
+        seconds_cpu = time.process_time() - self._seconds_cpu_start
+        memory_peak = _get_memory_peak()
+
+        if df_out is not None:
+            num_rows_out = df_out.shape[0] if num_rows_out is None else num_rows_out
+            num_bytes = int(df_out.memory_usage(deep=False).sum()) if num_bytes is None else num_bytes
+
+        stage_metrics = StageMetrics(
+            stage=self.name,
+            seconds_wall=seconds_wall,
+            seconds_cpu=seconds_cpu,
+            num_rows_in=self.num_rows_in,
+            num_rows_out=num_rows_out,
+            num_bytes=num_bytes,
+            memory_peak_bytes=memory_peak,
+            memory_peak_increase_bytes=memory_peak - self._memory_peak_start,
+        )
+        for hook in _hooks:
+            hook(stage_metrics)
+
+
+class _StageDisabled(Stage):
+    def __init__(self) -> None:
+        pass
+
+    def finish(self, df_out=None, num_rows_out=None, num_bytes=None) -> None:
+        pass
+
+
+_STAGE_DISABLED = _StageDisabled()
+
+
+def start(name: str, df_in: Optional["pd.DataFrame"] = None) -> Stage:
+    """
+    Starts measuring a stage, to be ended by calling `finish` on the returned `Stage`.
+    If no hooks are registered, nothing is measured, and `finish` does nothing.
+    >>> stage = start("DeleteRowsBot", df_in=df)
+    >>> stage.finish(df_out=df_out)
+    """
+    if not _hooks:
+        return _STAGE_DISABLED
+    return Stage(name, df_in)
+
+
+def _get_memory_peak() -> int:
+    # ru_maxrss is in KiB on Linux, but in bytes on macOS
+    memory_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return memory_peak if sys.platform == "darwin" else memory_peak * 2**10
+
+
+def log_json(stage_metrics: StageMetrics) -> None:
+    """
+    Hook logging a stage's metrics as a JSON line.
+    """
+    logger.info(json.dumps(asdict(stage_metrics)))
+
+
+# CloudWatch units of StageMetrics' numeric fields
+# (see: https://docs.aws.amazon.com/AmazonCloudWatch/latest/APIReference/API_MetricDatum.html)
+_UNITS_EMF = {
+    "seconds_wall": "Seconds",
+    "seconds_cpu": "Seconds",
+    "num_rows_in": "Count",
+    "num_rows_out": "Count",
+    "num_bytes": "Bytes",
+    "memory_peak_bytes": "Bytes",
+    "memory_peak_increase_bytes": "Bytes",
+}
+
+
+def format_emf(stage_metrics: StageMetrics) -> Dict[str, Any]:
+    """
+    Formats a stage's metrics in CloudWatch's Embedded Metric Format, with the stage
+    as dimension. Metrics that weren't measured (None) are left out.
+    (see: https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html)
+    """
+    values = {name: value for name, value in asdict(stage_metrics).items() if name in _UNITS_EMF and value is not None}
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE_EMF,
+                    "Dimensions": [["stage"]],
+                    "Metrics": [{"Name": name, "Unit": _UNITS_EMF[name]} for name in values],
+                }
+            ],
+        },
+        "stage": stage_metrics.stage,
+        **values,
+    }
+
+
+def log_emf(stage_metrics: StageMetrics) -> None:
+    """
+    Hook logging a stage's metrics in CloudWatch's Embedded Metric Format, which
+    CloudWatch Logs (e.g., of a Lambda function) turns into metrics.
+    """
+    logger.info(json.dumps(format_emf(stage_metrics)))
+
+
+HOOKS_BY_FORMAT: Dict[str, Hook] = {"json": log_json, "emf": log_emf}
+
+# Metrics are off unless the METRICS_FORMAT environment variable says how to log them, which,
+# unlike registering a hook, also applies to the Lambda function and backfill worker processes
+if os.environ.get("METRICS_FORMAT"):
+    if os.environ["METRICS_FORMAT"] not in HOOKS_BY_FORMAT:
+        raise ValueError(
+            f"METRICS_FORMAT should be one of {', '.join(HOOKS_BY_FORMAT)}, not {os.environ['METRICS_FORMAT']}"
+        )
+    add_hook(HOOKS_BY_FORMAT[os.environ["METRICS_FORMAT"]])
@@ -1,18 +1,35 @@
 import ast
+import functools
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Any, Dict, Set
+from typing import TYPE_CHECKING, Any, Dict, List, Set, Tuple, Union
 
 import numpy as np
 import pandas as pd
-import user_agents as ua
 
+from ata_pipeline0.helpers import arrow, metrics
+from ata_pipeline0.helpers.bots import BotDetector, is_bot_regex
+from ata_pipeline0.helpers.engine import Engine
 from ata_pipeline0.helpers.fields import FieldNew, FieldSnowplow
+from ata_pipeline0.helpers.json import loads
 from ata_pipeline0.helpers.logging import logging
 from ata_pipeline0.helpers.site import SiteName
 
+if TYPE_CHECKING:
+    import pyarrow as pa
+
 logger = logging.getLogger(__name__)
 
+# Column of Arrow tables made by to_arrow holding the position of each row in the DataFrame
+# it was converted from, so that from_arrow can restore the DataFrame's index
+_FIELD_POSITION = "__position"
+
+# Arrow columns can't hold arbitrary Python objects, so on the Arrow engine, ConvertFieldTypes
+# marks JSON fields with this field metadata key, and ReplaceNaNs(None) the table with this
+# schema metadata key, and from_arrow decodes JSON and replaces NaNs with None accordingly
+_KEY_METADATA_JSON = b"ata_pipeline0.json"
+_KEY_METADATA_NONE = b"ata_pipeline0.none"
+
 
 class Preprocessor(ABC):
     """
@@ -20,21 +37,53 @@ class Preprocessor(ABC):
     variables needed for the specific transformation.
     """
 
-    def __call__(self, df: pd.DataFrame) -> pd.DataFrame:
+    def __call__(self, df: pd.DataFrame, copy: bool = True, engine: Engine = Engine.PANDAS) -> pd.DataFrame:
         """
         Calls an instance of a child class as if it's a (preprocessing) function.
+        On the Arrow engine, `df` is converted to an Arrow table and back.
         """
-        df_out = self.transform(df)
-        self.log_result(df, df_out)
+        if engine == Engine.ARROW:
+            return from_arrow(self.call_arrow(to_arrow(df)), df.index)
+
+        # If copy is False, df may be modified in place, so keep its original number of
+        # rows around for logging as a cheap, column-less DataFrame
+        df_in = df if copy else df.iloc[:, :0]
+        stage = metrics.start(type(self).__name__, df_in=df_in)
+        df_out = self.transform(df, copy=copy)
+        stage.finish(df_out=df_out)
+        self.log_result(df_in, df_out)
         return df_out
 
     @abstractmethod
-    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+    def transform(self, df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
         """
         Transforms a Snowplow DataFrame using parameters predefined in the dataclass.
+
+        If `copy` is False, the caller owns `df` and doesn't need it afterwards, so
+        it may be modified in place instead of defensively copied. Rows are then
+        deleted in place too, which frees them even while the caller still holds a
+        reference to `df`.
         """
         pass
 
+    def call_arrow(self, table: "pa.Table") -> "pa.Table":
+        """
+        Calls the preprocessor on an Arrow table made by `to_arrow`, like `__call__`
+        does on a DataFrame.
+        """
+        stage = metrics.start(type(self).__name__, df_in=table)
+        table_out = self.transform_arrow(table)
+        stage.finish(num_rows_out=table_out.num_rows, num_bytes=table_out.nbytes)
+        self.log_result(table, table_out)
+        return table_out
+
+    def transform_arrow(self, table: "pa.Table") -> "pa.Table":
+        """
+        Transforms an Arrow table made by `to_arrow` the same way `transform` does a
+        DataFrame. Arrow tables are immutable, so there's nothing to copy.
+        """
+        raise NotImplementedError(f"{type(self).__name__} can't run on the Arrow engine")
+
     @abstractmethod
     def log_result(self, df_in: pd.DataFrame, df_out: pd.DataFrame) -> None:
         """
@@ -43,6 +92,81 @@ class Preprocessor(ABC):
         pass
 
 
+def to_arrow(df: pd.DataFrame) -> "pa.Table":
+    """
+    Converts a DataFrame of events to an Arrow table preprocessors can run on (see
+    `Preprocessor.call_arrow`), with an extra column holding each row's position, so
+    that `from_arrow` can restore the DataFrame's index. Columns of nothing but
+    missing values become string columns, which they'd be if they weren't empty.
+    """
+    if not arrow.is_installed():
+        raise ImportError("The Arrow engine requires pyarrow: pip install pyarrow")
+
+    import pyarrow as pa
+
+    # pandas' metadata would be out of date once preprocessors are done with the table
+    table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(i, field.with_type(pa.string()), table.column(i).cast(pa.string()))
+    return table.append_column(_FIELD_POSITION, pa.array(np.arange(table.num_rows)))
+
+
+def from_arrow(table: "pa.Table", index: pd.Index) -> pd.DataFrame:
+    """
+    Converts an Arrow table made by `to_arrow` back to a DataFrame, with the labels of
+    `index` (the original DataFrame's) its rows had, and the same values and types as
+    if the same preprocessors had run on the pandas engine. The table can't be used
+    afterwards.
+    """
+    positions = table.column(_FIELD_POSITION).to_numpy()
+    fields_json = [field.name for field in table.schema if _KEY_METADATA_JSON in (field.metadata or {})]
+    is_none = _KEY_METADATA_NONE in (table.schema.metadata or {})
+
+    df = arrow.to_pandas(table.drop([_FIELD_POSITION]))
+    df.index = index[positions]
+    for field in fields_json:
+        df[field] = ConvertFieldTypes._convert_to_json_column(df[field])
+    if is_none:
+        df = ReplaceNaNs(replace_with=None).transform(df, copy=False)
+    return df
+
+
+def _factorize(values: "pa.ChunkedArray") -> Tuple[np.ndarray, "pa.Array"]:
+    """
+    Arrow equivalent of `pd.factorize`: codes of each value (-1 for missing ones) in
+    the array of distinct values, which dictionary-encoded values already are.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if not pa.types.is_dictionary(values.type):
+        values = values.dictionary_encode()
+    values = values.unify_dictionaries()
+    if values.num_chunks == 0:
+        return np.empty(0, dtype=np.int64), pa.array([], type=values.type.value_type)
+
+    codes = np.concatenate([pc.fill_null(chunk.indices.cast(pa.int64()), -1).to_numpy() for chunk in values.chunks])
+    return codes, values.chunk(0).dictionary
+
+
+def _drop_rows(df: pd.DataFrame, is_kept: np.ndarray, copy: bool) -> pd.DataFrame:
+    """
+    Keeps the rows of a DataFrame where `is_kept` is True, dropping the others in
+    place unless `copy` is True.
+    """
+    # Dropping by label only works in place if labels are unique, which they are once
+    # fetch_events has concatenated DataFrames of several S3 objects, but may not be otherwise
+    if copy or not df.index.is_unique:
+        return df[is_kept]
+
+    # df may be a filtered view of a DataFrame the caller no longer needs, in which
+    # case pandas' SettingWithCopyWarning doesn't apply
+    with pd.option_context("mode.chained_assignment", None):
+        df.drop(index=df.index[~is_kept], inplace=True)
+    return df
+
+
 @dataclass
 class SelectFieldsRelevant(Preprocessor):
     """
@@ -52,20 +176,34 @@ class SelectFieldsRelevant(Preprocessor):
 
     fields_relevant: Set[FieldSnowplow]
 
-    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
-        # Sometimes, df doesn't have all the fields in fields_relevant, so we create
-        # an empty DataFrame with all the fields we'd like to have and concatenate df to it
-        df_empty_with_all_fields = pd.DataFrame(columns=[*self.fields_relevant])
-        # Get a list of fields in fields_relevant that are actually in df, because we
-        # don't want to query for nonexistent fields and have pandas raise a KeyError
-        fields_available = df.columns.intersection([*self.fields_relevant])
-
-        # Query for fields in fields_available and perform said concatenation, so that
-        # the final DataFrame will have all the fields in fields_relevant
-        df = pd.concat([df_empty_with_all_fields, df[[*fields_available]]])
+    def transform(self, df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+        fields_irrelevant = df.columns.difference([*self.fields_relevant])
+        # Dropping fields makes a new DataFrame anyway, so only copy if there's none to drop
+        if len(fields_irrelevant) > 0:
+            df = df.drop(columns=fields_irrelevant)
+        elif copy:
+            df = df.copy()
+
+        # Sometimes, df doesn't have all the fields in fields_relevant, so we add the
+        # missing ones as empty columns
+        with pd.option_context("mode.chained_assignment", None):
+            for field in self.fields_relevant:
+                if field not in df.columns:
+                    df[field] = pd.Series(np.nan, index=df.index, dtype=object)
 
         return df
 
+    def transform_arrow(self, table: "pa.Table") -> "pa.Table":
+        import pyarrow as pa
+
+        table = table.select(
+            [name for name in table.column_names if name in self.fields_relevant or name == _FIELD_POSITION]
+        )
+        for field in self.fields_relevant:
+            if field not in table.column_names:
+                table = table.append_column(str(field), pa.nulls(table.num_rows, type=pa.string()))
+        return table
+
     def log_result(self, df_in=None, df_out=None) -> None:
         logger.info("Selected relevant fields")
 
@@ -79,8 +217,15 @@ class DeleteRowsEmpty(Preprocessor):
 
     fields_required: Set[FieldSnowplow]
 
-    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
-        return df.dropna(subset=[*self.fields_required])
+    def transform(self, df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+        return _drop_rows(df, df[[*self.fields_required]].notna().all(axis=1).to_numpy(), copy=copy)
+
+    def transform_arrow(self, table: "pa.Table") -> "pa.Table":
+        is_valid = np.ones(table.num_rows, dtype=bool)
+        for field in self.fields_required:
+            if table.column(field).null_count > 0:
+                is_valid &= table.column(field).is_valid().to_numpy()
+        return table if is_valid.all() else arrow.filter(table, is_valid)
 
     def log_result(self, df_in: pd.DataFrame, df_out: pd.DataFrame) -> None:
         logger.info(
@@ -97,13 +242,60 @@ class DeleteRowsDuplicateKey(Preprocessor):
     field_primary_key: FieldSnowplow
     field_timestamp: FieldSnowplow
 
-    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+    def transform(self, df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+        # Duplicate keys are rare, so rather than sorting the whole DataFrame, find rows
+        # whose key is repeated by hashing keys, and only sort those. Other rows are kept
+        # as they are, in their original order
+        is_duplicated = df[self.field_primary_key].duplicated(keep=False).to_numpy()
+        if not is_duplicated.any():
+            return df.copy() if copy else df
+
+        positions = np.flatnonzero(is_duplicated)
+        is_kept = ~is_duplicated
+        is_kept[
+            self._get_positions_kept(
+                df[self.field_primary_key].iloc[positions].to_numpy(),
+                df[self.field_timestamp].iloc[positions].reset_index(drop=True),
+                positions,
+            )
+        ] = True
+
+        return _drop_rows(df, is_kept, copy=copy)
+
+    def transform_arrow(self, table: "pa.Table") -> "pa.Table":
+        # Same as transform, with keys hashed by dictionary-encoding them
+        codes, _ = _factorize(table.column(self.field_primary_key))
+        # Like pandas, missing keys count as the same key
+        counts = np.bincount(codes + 1)
+        is_duplicated = counts[codes + 1] > 1
+        if not is_duplicated.any():
+            return table
+
+        positions = np.flatnonzero(is_duplicated)
+        is_kept = ~is_duplicated
+        is_kept[
+            self._get_positions_kept(
+                codes[positions], table.column(self.field_timestamp).take(positions).to_pandas(), positions
+            )
+        ] = True
+        return arrow.filter(table, is_kept)
+
+    @staticmethod
+    def _get_positions_kept(keys: np.ndarray, timestamps: pd.Series, positions: np.ndarray) -> np.ndarray:
+        """
+        Given the keys, timestamps and positions of rows whose key is repeated, returns
+        the positions of those to keep, one per key.
+        """
+        rows_duplicated = pd.DataFrame({"key": keys, "timestamp": timestamps, "position": positions})
         # Sort values by timestamp so the first event kept is the earliest,
         # which is most likely to be a parent (if its key doesn't already exist
-        # in the DB)
+        # in the DB). Ties go to the first row, since the sort is stable
         # (see: https://snowplow.io/blog/dealing-with-duplicate-event-ids/)
-        df = df.sort_values(self.field_timestamp)
-        return df.drop_duplicates(subset=[self.field_primary_key], keep="first")
+        return (
+            rows_duplicated.sort_values("timestamp", kind="stable")
+            .drop_duplicates(subset="key", keep="first")["position"]
+            .to_numpy()
+        )
 
     def log_result(self, df_in: pd.DataFrame, df_out: pd.DataFrame) -> None:
         logger.info(
@@ -111,21 +303,59 @@ class DeleteRowsDuplicateKey(Preprocessor):
         )
 
 
+@functools.lru_cache(maxsize=2**14)
+def _is_bot(user_agent_string: str) -> bool:
+    """
+    Parses a user agent string and checks if it belongs to a bot. Results are
+    cached at the module level, so they're kept across warm Lambda invocations.
+    """
+    # Imported on first use, since loading ua-parser's regexes takes a while
+    import user_agents as ua
+
+    return ua.parse(user_agent_string).is_bot
+
+
 @dataclass
 class DeleteRowsBot(Preprocessor):
     """
     Delete all rows where the event is made by a bot.
+
+    Bots are detected by fully parsing user agents with the user-agents package by
+    default. `BotDetector.REGEX` instead matches them against a single precompiled
+    regex, which is much faster but also flags user agents that have both a device
+    model and a crawler token (see `ata_pipeline0.helpers.bots`).
     """
 
     field_useragent: FieldSnowplow
+    detector: BotDetector = BotDetector.USER_AGENTS
 
-    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
-        return df[df[self.field_useragent].apply(self._safe_bot_check)]
+    def transform(self, df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+        # An hour of events has only a few thousand distinct user agents, so check each
+        # unique one once and map the results back to rows by their codes
+        codes, uniques = pd.factorize(df[self.field_useragent])
+        # factorize codes missing values as -1, which indexes the trailing False, so rows
+        # without a user agent are treated as bots, same as other non-string values
+        is_not_bot = np.append(self._check_uniques(uniques), False)[codes]
+
+        return _drop_rows(df, is_not_bot, copy=copy)
+
+    def transform_arrow(self, table: "pa.Table") -> "pa.Table":
+        codes, uniques = _factorize(table.column(self.field_useragent))
+        is_not_bot = np.append(self._check_uniques(uniques.to_pylist()), False)[codes]
+        return table if is_not_bot.all() else arrow.filter(table, is_not_bot)
+
+    def _check_uniques(self, uniques: Union[pd.Index, np.ndarray, List[Any]]) -> np.ndarray:
+        """
+        Tells which of a list of distinct user agents are not bots.
+        """
+        if self.detector == BotDetector.REGEX:
+            return ~is_bot_regex(pd.Series(uniques, dtype=object)).to_numpy()
+        return np.array([*map(self._safe_bot_check, uniques)], dtype=bool)
 
     @staticmethod
-    def _safe_bot_check(user_agent_string: Any):
+    def _safe_bot_check(user_agent_string: Any) -> bool:
         try:
-            return not ua.parse(user_agent_string).is_bot
+            return not _is_bot(user_agent_string)
         except TypeError:
             # in this case, the user agent is not an expected type (a string). Assume that means abnormal behavior,
             # so assume that means it is a bot; as such, we return False
@@ -148,36 +378,108 @@ class ConvertFieldTypes(Preprocessor):
     fields_categorical: Set[FieldSnowplow]
     fields_json: Set[FieldSnowplow]
 
-    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
-        # Make a copy of the original so that it's not affected, but can remove
-        # this if memory is an issue
-        df = df.copy()
+    def transform(self, df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+        # Make a copy of the original so that it's not affected, unless the caller
+        # owns it
+        if copy:
+            df = df.copy()
 
-        df[[*self.fields_int]] = df[[*self.fields_int]].astype(int)
-        df[[*self.fields_float]] = df[[*self.fields_float]].astype(float)
+        # Same as in _drop_rows
+        with pd.option_context("mode.chained_assignment", None):
+            df[[*self.fields_int]] = df[[*self.fields_int]].astype(int)
+            df[[*self.fields_float]] = df[[*self.fields_float]].astype(float)
 
-        # pd.to_datetime can only turn pandas Series to datetime, so need to convert
-        # one Series/column at a time
-        # All timestamps should already be in UTC: https://discourse.snowplow.io/t/what-timezones-are-the-timestamps-set-in/622,
-        # but setting utc=True just to be safe
-        for field in self.fields_datetime:
-            df[field] = pd.to_datetime(df[field], utc=True)
+            # pd.to_datetime can only turn pandas Series to datetime, so need to convert
+            # one Series/column at a time
+            # All timestamps should already be in UTC: https://discourse.snowplow.io/t/what-timezones-are-the-timestamps-set-in/622,
+            # but setting utc=True just to be safe
+            for field in self.fields_datetime:
+                df[field] = pd.to_datetime(df[field], utc=True)
 
-        df[[*self.fields_categorical]] = df[[*self.fields_categorical]].astype("category")
+            df[[*self.fields_categorical]] = df[[*self.fields_categorical]].astype("category")
 
-        # df = df.replace([np.nan], [None])
+            # df = df.replace([np.nan], [None])
 
-        for field in self.fields_json:
-            df[field] = df[field].apply(self._convert_to_json)
+            for field in self.fields_json:
+                df[field] = self._convert_to_json_column(df[field])
         return df
 
+    def transform_arrow(self, table: "pa.Table") -> "pa.Table":
+        fields = [*self.fields_int, *self.fields_float, *self.fields_datetime, *self.fields_categorical]
+        # Columns are converted in parallel, each by its own thread
+        columns = arrow.map_threaded(lambda field: self._convert_arrow(field, table.column(field)), fields)
+        for field, column in zip(fields, columns):
+            i = table.schema.get_field_index(field)
+            table = table.set_column(i, table.schema.field(i).with_type(column.type), column)
+
+        # JSON is decoded by from_arrow, once converted back to a DataFrame
+        for field in self.fields_json:
+            i = table.schema.get_field_index(field)
+            table = table.set_column(i, table.schema.field(i).with_metadata({_KEY_METADATA_JSON: b""}), table.column(i))
+        return table
+
+    def _convert_arrow(self, field: FieldSnowplow, values: "pa.ChunkedArray") -> "pa.ChunkedArray":
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        if field in self.fields_int:
+            return values.cast(pa.int64())
+        if field in self.fields_float:
+            return values.cast(pa.float64())
+
+        if field in self.fields_datetime:
+            # Naive timestamps are taken as UTC, same as pd.to_datetime(utc=True) does
+            try:
+                return values.cast(pa.timestamp("ns", tz="UTC"))
+            except pa.ArrowInvalid:
+                # Arrow only parses strings with a zone offset (e.g., "...Z") as timezone-aware
+                # timestamps, and Snowplow's (e.g., "2022-11-23 00:18:14.427") have none
+                return pc.assume_timezone(values.cast(pa.timestamp("ns")), "UTC")
+
+        # Categorical: like astype("category"), leave dictionary-encoded values as they are,
+        # and sort the dictionary of others
+        if pa.types.is_dictionary(values.type):
+            return values
+        dictionary = pc.unique(values).drop_null()
+        dictionary = dictionary.take(pc.sort_indices(dictionary))
+        codes = pc.index_in(values, value_set=dictionary)
+        return pa.chunked_array(
+            [pa.DictionaryArray.from_arrays(chunk, dictionary) for chunk in codes.chunks],
+            type=pa.dictionary(pa.int32(), dictionary.type),
+        )
+
+    @classmethod
+    def _convert_to_json_column(cls, values: pd.Series) -> pd.Series:
+        """
+        Decodes a column of JSON strings. Missing values are skipped, and each distinct
+        value is decoded once, so rows with identical payloads share the same decoded
+        object. Missing and invalid values become None.
+        """
+        isna = values.isna().to_numpy()
+        values_decoded = np.full(values.shape[0], None, dtype=object)
+        if not isna.all():
+            codes, uniques = pd.factorize(values[~isna])
+            uniques_decoded = np.empty(uniques.shape[0], dtype=object)
+            # Filled one by one, since numpy would try to broadcast lists
+            for i, value in enumerate(uniques):
+                uniques_decoded[i] = cls._convert_to_json(value)
+            values_decoded[~isna] = uniques_decoded[codes]
+        return pd.Series(values_decoded, index=values.index, name=values.name)
+
     @staticmethod
     def _convert_to_json(value: str) -> Dict:
         try:
-            # if valid json, will convert to a dictionary
-            return ast.literal_eval(value)
+            return loads(value)
         except ValueError:
-            # if invalid, will throw a ValueError and we just want it to return None
+            pass
+
+        # Events parsed before nested values were kept as JSON (e.g., staged ones) hold their
+        # Python repr instead
+        try:
+            # if valid python literal, will convert to a dictionary
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            # if invalid, will throw a ValueError (or SyntaxError, if malformed) and we just want it to return None
             return None  # type: ignore
 
     def log_result(self, df_in=None, df_out=None) -> None:
@@ -193,15 +495,25 @@ class AddFieldSiteName(Preprocessor):
     site_name: SiteName
     field_site_name: FieldNew
 
-    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
-        # Make a copy of the original so that it's not affected, but can remove
-        # this if memory is an issue
-        df = df.copy()
+    def transform(self, df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+        # Make a copy of the original so that it's not affected, unless the caller
+        # owns it
+        if copy:
+            df = df.copy()
 
-        df[self.field_site_name] = self.site_name
+        with pd.option_context("mode.chained_assignment", None):
+            df[self.field_site_name] = self.site_name
 
         return df
 
+    def transform_arrow(self, table: "pa.Table") -> "pa.Table":
+        import pyarrow as pa
+
+        values = pa.repeat(pa.scalar(self.site_name.value, type=pa.string()), table.num_rows)
+        if self.field_site_name in table.column_names:
+            return table.set_column(table.schema.get_field_index(self.field_site_name), str(self.field_site_name), values)
+        return table.append_column(str(self.field_site_name), values)
+
     def log_result(self, df_in=None, df_out=None) -> None:
         logger.info(f"Added site name {self.site_name} as a new field")
 
@@ -214,10 +526,70 @@ class ReplaceNaNs(Preprocessor):
 
     replace_with: Any
 
-    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = df.replace([np.nan], [self.replace_with])
-
+    def transform(self, df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+        # DataFrame.replace makes a new copy of every block, even with inplace=True, and
+        # decodes categoricals, so replace column by column instead, only in columns that
+        # have NaNs. Unlike DataFrame.replace, this leaves columns without NaNs as they are,
+        # even if they share a block with ones that do
+        if copy:
+            df = df.copy(deep=False)
+
+        with pd.option_context("mode.chained_assignment", None):
+            for field in df.columns:
+                isna = df[field].isna()
+                if not isna.any():
+                    continue
+
+                if isinstance(df[field].dtype, pd.CategoricalDtype):
+                    # Categoricals stay encoded until they're written, and their missing
+                    # values are written as None anyway (see write_events), so there's
+                    # only something to replace if it's another value
+                    if self.replace_with is not None:
+                        df[field] = self._fill_categorical(df[field])
+                else:
+                    df[field] = df[field].astype(object).where(~isna, self.replace_with)
         return df
 
+    def _fill_categorical(self, values: pd.Series) -> pd.Series:
+        if self.replace_with not in values.cat.categories:
+            values = values.cat.add_categories([self.replace_with])
+        return values.fillna(self.replace_with)
+
+    def transform_arrow(self, table: "pa.Table") -> "pa.Table":
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        # Arrow has no NaNs but nulls, which from_arrow turns into None rather than NaN
+        if self.replace_with is None:
+            return table.replace_schema_metadata({**(table.schema.metadata or {}), _KEY_METADATA_NONE: b""})
+
+        for i, field in enumerate(table.schema):
+            column = table.column(i)
+            if column.null_count == 0:
+                continue
+            if pa.types.is_dictionary(field.type):
+                column = self._fill_dictionary(column)
+            else:
+                column = pc.fill_null(column, self.replace_with)
+            table = table.set_column(i, field.with_type(column.type), column)
+        return table
+
+    def _fill_dictionary(self, values: "pa.ChunkedArray") -> "pa.ChunkedArray":
+        # Same as _fill_categorical: the value is added to the dictionary if it isn't in it
+        import pyarrow as pa
+
+        values = values.unify_dictionaries()
+        dictionary = values.chunk(0).dictionary
+        code = dictionary.index(self.replace_with).as_py()
+        if code == -1:
+            dictionary = pa.concat_arrays([dictionary, pa.array([self.replace_with], type=dictionary.type)])
+            code = len(dictionary) - 1
+
+        chunks = [
+            pa.DictionaryArray.from_arrays(chunk.indices.cast(pa.int32()).fill_null(code), dictionary)
+            for chunk in values.chunks
+        ]
+        return pa.chunked_array(chunks, type=pa.dictionary(pa.int32(), dictionary.type))
+
     def log_result(self, df_in: pd.DataFrame, df_out: pd.DataFrame) -> None:
         logger.info(f"Replaced all NaNs with {self.replace_with}")
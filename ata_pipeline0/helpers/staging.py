@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+from datetime import datetime
+from typing import TYPE_CHECKING, AbstractSet, Any, Dict, List, Optional
+
+import pandas as pd
+
+from ata_pipeline0.helpers.arrow import is_installed, to_pandas
+from ata_pipeline0.helpers.logging import logging
+from ata_pipeline0.helpers.site import SiteName
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.service_resource import ObjectSummary
+
+logger = logging.getLogger(__name__)
+
+# Key of the schema metadata entry recording what a staged file was parsed from
+_KEY_METADATA = b"ata_pipeline0"
+
+
+class Staging:
+    """
+    Local directory of Parquet files holding the events parsed from each site's
+    date-hour of S3 objects, read back as memory-mapped Arrow tables as long as the
+    hour's objects haven't changed and the file holds all fields asked for.
+
+    Requires pyarrow (`pip install pyarrow`), which is imported on first use.
+    """
+
+    def __init__(self, directory: str) -> None:
+        if not is_installed():
+            raise ImportError("Staging parsed events requires pyarrow: pip install pyarrow")
+
+        self.directory = directory
+
+    def get(
+        self,
+        site_name: SiteName,
+        hour: datetime,
+        object_summaries: List["ObjectSummary"],
+        fields: Optional[AbstractSet[str]] = None,
+    ) -> Optional[pd.DataFrame]:
+        """
+        Returns the events staged for a site's date-hour, projected to `fields` if
+        set, or None if they aren't staged or were staged from other objects or fields.
+        """
+        import pyarrow.parquet as pq
+
+        path = self._get_path(site_name, hour)
+        try:
+            schema = pq.read_schema(path, memory_map=True)
+        except FileNotFoundError:
+            return None
+
+        metadata = json.loads(schema.metadata[_KEY_METADATA])
+        if metadata["objects"] != _get_objects(object_summaries):
+            return None
+        if metadata["fields"] is not None and (fields is None or not _get_fields(fields) <= {*metadata["fields"]}):
+            return None
+
+        columns = None if fields is None else [name for name in schema.names if name in _get_fields(fields)]
+        df = to_pandas(pq.read_table(path, columns=columns, memory_map=True))
+
+        logger.info(f"Read {df.shape[0]} events of {site_name} for {hour} from staging")
+        return df
+
+    def put(
+        self,
+        site_name: SiteName,
+        hour: datetime,
+        object_summaries: List["ObjectSummary"],
+        df: pd.DataFrame,
+        fields: Optional[AbstractSet[str]] = None,
+    ) -> None:
+        """
+        Stages the events parsed from a site's date-hour objects, projected to `fields`
+        (None meaning all fields).
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        metadata: Dict[str, Any] = {
+            "objects": _get_objects(object_summaries),
+            "fields": None if fields is None else sorted(_get_fields(fields)),
+        }
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata, _KEY_METADATA: json.dumps(metadata)})
+
+        path = self._get_path(site_name, hour)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name and renamed, so that readers never see a partial file
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=".tmp-", delete=False) as f:
+            try:
+                pq.write_table(table, f)
+                f.flush()
+                os.replace(f.name, path)
+            except BaseException:
+                os.remove(f.name)
+                raise
+
+    def _get_path(self, site_name: SiteName, hour: datetime) -> str:
+        return os.path.join(self.directory, site_name.value, f"{hour.strftime('%Y/%m/%d/%H')}.parquet")
+
+
+def _get_objects(object_summaries: List["ObjectSummary"]) -> List[List[str]]:
+    return sorted([object_summary.key, object_summary.e_tag] for object_summary in object_summaries)
+
+
+def _get_fields(fields: AbstractSet[str]) -> AbstractSet[str]:
+    # Field enums are cast to str, same as column labels are while parsing
+    return {str(field) for field in fields}
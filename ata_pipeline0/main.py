@@ -1,101 +1,329 @@
+import contextlib
+import json
 import re
-from datetime import datetime
-from typing import List, Optional
-
-import boto3
-from ata_db_models.helpers import get_conn_string
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import urllib.parse
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+)
 
-from ata_pipeline0.fetch_events import fetch_events
+from ata_pipeline0.helpers.cache import ObjectCache
+from ata_pipeline0.helpers.engine import Engine
 from ata_pipeline0.helpers.fields import FieldNew, FieldSnowplow
-from ata_pipeline0.helpers.preprocessors import (
-    AddFieldSiteName,
-    ConvertFieldTypes,
-    DeleteRowsBot,
-    DeleteRowsDuplicateKey,
-    DeleteRowsEmpty,
-    ReplaceNaNs,
-    SelectFieldsRelevant,
-)
+from ata_pipeline0.helpers.manifest import Manifest
 from ata_pipeline0.helpers.site import SiteName
-from ata_pipeline0.preprocess_events import preprocess_events
-from ata_pipeline0.write_events import write_events
+
+# Heavy dependencies (pandas, boto3, SQLAlchemy, user-agents...) are only imported
+# inside the functions that use them, so that importing this module, which is what a
+# Lambda cold start does first, stays fast (see: benchmarks/bench_import.py)
+if TYPE_CHECKING:
+    from mypy_boto3_s3.service_resource import ObjectSummary
+
+    from ata_pipeline0.helpers.preprocessors import Preprocessor
+    from ata_pipeline0.helpers.staging import Staging
+
+# Max number of S3 objects the handler downloads concurrently
+HANDLER_CONCURRENCY_MAX = 8
+
+# Fields with few distinct values relative to their number of rows (e.g., a user agent
+# or a page's path repeats over all of a reader's page pings), which are dictionary-encoded
+# as pandas categoricals from parsing through preprocessing, and only decoded when written
+FIELDS_CATEGORICAL = {
+    FieldSnowplow.DOMAIN_USERID,
+    FieldSnowplow.EVENT_NAME,
+    FieldSnowplow.PAGE_REFERRER,
+    FieldSnowplow.PAGE_URL,
+    FieldSnowplow.PAGE_URLHOST,
+    FieldSnowplow.PAGE_URLPATH,
+    FieldSnowplow.REFR_MEDIUM,
+    FieldSnowplow.REFR_SOURCE,
+    FieldSnowplow.REFR_URLHOST,
+    FieldSnowplow.REFR_URLPATH,
+    FieldSnowplow.USERAGENT,
+}
 
 
 def handler(event, context):
     # Note: this is invoked by an event-driven, async method (s3 trigger) so the return value is discarded
     # see here for example event structure: https://docs.aws.amazon.com/AmazonS3/latest/userguide/notification-content-structure.html
-    bucket_name = event["Records"][0]["s3"]["bucket"]["name"]
-    site_name = SiteName(re.findall("lnl-snowplow-(.*)", bucket_name)[0])
-    object_key = event["Records"][0]["s3"]["object"]["key"]
-    run_pipeline(site_name=site_name, object_key=object_key, concurrency=1)
+    # All objects of a site in the notification (or SQS batch of notifications) go through the pipeline together
+    for site_name, object_keys in get_object_keys_by_site(event).items():
+        run_pipeline(
+            site_name=site_name, object_keys=object_keys, concurrency=min(len(object_keys), HANDLER_CONCURRENCY_MAX)
+        )
+
+
+def get_object_keys_by_site(event: Dict[str, Any]) -> Dict[SiteName, List[str]]:
+    """
+    Gathers the keys of all objects in an S3 event notification, or in a batch of SQS
+    messages holding S3 event notifications, grouped by site. Keys are sorted, which
+    for Snowplow objects means by time.
+    """
+    object_keys_by_site: Dict[SiteName, Set[str]] = {}
+    for record in _get_records_s3(event):
+        bucket_name = record["s3"]["bucket"]["name"]
+        site_name = SiteName(re.findall("lnl-snowplow-(.*)", bucket_name)[0])
+        # Keys are URL-encoded in notifications, e.g., spaces become "+"
+        # (see: https://docs.aws.amazon.com/AmazonS3/latest/userguide/notification-content-structure.html)
+        object_key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
+        object_keys_by_site.setdefault(site_name, set()).add(object_key)
+
+    return {site_name: sorted(object_keys) for site_name, object_keys in object_keys_by_site.items()}
+
+
+def _get_records_s3(event: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    # Test events S3 sends when a notification is set up don't have records
+    for record in event.get("Records", []):
+        if record.get("eventSource") == "aws:sqs":
+            yield from _get_records_s3(json.loads(record["body"]))
+        elif "s3" in record:
+            yield record
+
+
+def get_preprocessors(site_name: SiteName) -> List["Preprocessor"]:
+    """
+    Returns the list of preprocessors, in order, that events fetched from a site's
+    bucket go through before being written to the DB.
+    """
+    from ata_pipeline0.helpers.preprocessors import (
+        AddFieldSiteName,
+        ConvertFieldTypes,
+        DeleteRowsBot,
+        DeleteRowsDuplicateKey,
+        DeleteRowsEmpty,
+        ReplaceNaNs,
+        SelectFieldsRelevant,
+    )
+
+    return [
+        SelectFieldsRelevant(fields_relevant={*FieldSnowplow}),
+        DeleteRowsEmpty(
+            fields_required={
+                FieldSnowplow.DERIVED_TSTAMP,
+                FieldSnowplow.DOC_HEIGHT,
+                FieldSnowplow.DOMAIN_SESSIONIDX,
+                FieldSnowplow.DOMAIN_USERID,
+                FieldSnowplow.DVCE_SCREENHEIGHT,
+                FieldSnowplow.DVCE_SCREENWIDTH,
+                FieldSnowplow.EVENT_ID,
+                FieldSnowplow.EVENT_NAME,
+                FieldSnowplow.PAGE_URL,
+                FieldSnowplow.PAGE_URLHOST,
+                FieldSnowplow.PAGE_URLPATH,
+            }
+        ),
+        ConvertFieldTypes(
+            fields_int={FieldSnowplow.DOMAIN_SESSIONIDX},
+            fields_float={
+                FieldSnowplow.BR_VIEWHEIGHT,
+                FieldSnowplow.BR_VIEWWIDTH,
+                FieldSnowplow.DOC_HEIGHT,
+                FieldSnowplow.DVCE_SCREENHEIGHT,
+                FieldSnowplow.DVCE_SCREENWIDTH,
+                FieldSnowplow.PP_YOFFSET_MAX,
+            },
+            fields_datetime={FieldSnowplow.DERIVED_TSTAMP},
+            # Fields fetched by run_pipeline are categorical already, but other events may not be
+            fields_categorical=FIELDS_CATEGORICAL,
+            fields_json={
+                FieldSnowplow.SEMISTRUCT_FORM_SUBMIT,
+            },
+        ),
+        # This happens after converting field type because timestamps need to be in datetime format
+        DeleteRowsDuplicateKey(field_primary_key=FieldSnowplow.EVENT_ID, field_timestamp=FieldSnowplow.DERIVED_TSTAMP),
+        DeleteRowsBot(field_useragent=FieldSnowplow.USERAGENT),
+        AddFieldSiteName(site_name, field_site_name=FieldNew.SITE_NAME),
+        ReplaceNaNs(replace_with=None),
+    ]
+
+
+@dataclass
+class PipelineResult:
+    """
+    Numbers of rows a pipeline run went through, summed over chunks.
+    """
+
+    num_rows_fetched: int = 0
+    num_rows_preprocessed: int = 0
+    num_rows_inserted: int = 0
+    num_objects_skipped: int = 0
 
 
 def run_pipeline(
     site_name: SiteName,
     timestamps: Optional[List[datetime]] = None,
     object_key: Optional[str] = None,
+    object_keys: Optional[List[str]] = None,
     concurrency: int = 4,
-):
+    chunk_max_rows: Optional[int] = None,
+    use_copy: bool = False,
+    write_batch_size: Optional[int] = None,
+    use_async_fetch: bool = False,
+    write_semaphore: Optional[ContextManager[Any]] = None,
+    manifest: Optional[Manifest] = None,
+    resume: bool = False,
+    skip_existing: bool = False,
+    cache: Optional[ObjectCache] = None,
+    staging: Optional["Staging"] = None,
+    num_parse_processes: Optional[int] = None,
+    engine: Engine = Engine.PANDAS,
+    dedup_window: timedelta = timedelta(hours=1),
+) -> PipelineResult:
+    """
+    Runs the whole fetch-preprocess-write pipeline for a site, given either a list
+    of date-hour timestamps, an S3 object key prefix or a list of S3 object keys.
+
+    By default, all fetched events go through preprocessing and writing as a single
+    DataFrame. If `chunk_max_rows` is set, the pipeline streams instead: events are
+    fetched in chunks of whole S3 objects holding roughly that many rows, and each
+    chunk is preprocessed and written before the next one is fetched, which bounds
+    memory usage on large ranges. Duplicate event IDs within a chunk are removed by
+    DeleteRowsDuplicateKey as usual. Duplicates split across chunks are checked against
+    the derived timestamps of the events inserted so far by the run: later ones are
+    dropped, and earlier ones replace the events inserted (see `replace_events_later`),
+    so that the earliest one is kept, same as in a single-DataFrame run. To bound
+    memory usage, only events within `dedup_window` of the latest one inserted are
+    checked against (see `EventsWritten`); duplicates further apart are skipped by
+    write_events' on-conflict-do-nothing insert, which keeps the first one written.
+
+    If `use_copy` is True, events are written with Postgres' COPY (see `write_events_copy`),
+    which is much faster for large DataFrames. Otherwise, `write_batch_size` splits
+    the INSERT into batches of that many rows (see `write_events`).
+
+    If `use_async_fetch` is True, S3 objects are fetched by the asyncio-based engine,
+    with up to `concurrency` downloads in flight (see `fetch_events`).
+
+    If `write_semaphore` is set, writes to the DB happen while holding it, which caps
+    the number of concurrent writers when several pipelines run at once (e.g., a
+    `multiprocessing.BoundedSemaphore` shared by backfill processes).
+
+    If `manifest` is set, S3 objects are recorded in it once their events have been
+    written, and if `resume` is also True, objects already recorded are skipped.
+
+    If `skip_existing` is True, events already in the DB are dropped before writing
+    (see `drop_events_existing`), which saves sending them over for nothing when
+    backfilling a range that's mostly been loaded already.
+
+    If `cache` is set, S3 objects are read from that local on-disk cache when they're
+    in it, and downloaded into it otherwise (see `ObjectCache`), so that re-running
+    over the same range doesn't download them again.
+
+    If `staging` is set, along with `timestamps`, each hour's parsed events are read
+    from that local Parquet staging when they're in it, and written to it otherwise
+    (see `Staging`), so that re-running over the same range doesn't parse them again.
+    Chunks are then made of whole hours rather than whole S3 objects.
+
+    If `num_parse_processes` is set, S3 objects are decompressed and parsed in a pool
+    of that many processes rather than in threads (see `fetch_events`).
+
+    If `engine` is `Engine.ARROW`, events are preprocessed as Arrow tables, whose
+    columns are converted and filtered in parallel threads, rather than as pandas
+    DataFrames (see `preprocess_events`). Requires pyarrow.
+    """
+    from ata_pipeline0.fetch_events import fetch_events_in_chunks
+    from ata_pipeline0.helpers.clients import get_clients
+    from ata_pipeline0.helpers.duplicates import EventsWritten
+    from ata_pipeline0.preprocess_events import preprocess_events
+    from ata_pipeline0.write_events import (
+        drop_events_existing,
+        replace_events_later,
+        write_events,
+        write_events_copy,
+    )
+
+    s3, session_factory = get_clients(max_pool_connections=concurrency)
+
+    preprocessors = get_preprocessors(site_name)
+    result = PipelineResult()
+
+    object_filter: Optional[Callable[["ObjectSummary"], bool]] = None
+    if manifest is not None and resume:
+        objects_done = manifest.get_objects_done(site_name)
+
+        def is_not_done(object_summary: "ObjectSummary") -> bool:
+            is_done = (object_summary.key, object_summary.e_tag) in objects_done
+            result.num_objects_skipped += is_done
+            return not is_done
+
+        object_filter = is_not_done
+
     # Fetch from S3
-    s3 = boto3.resource("s3")
-    df = fetch_events(
+    chunks = fetch_events_in_chunks(
         s3_resource=s3,
         site_name=site_name,
         timestamps=timestamps,
         object_key=object_key,
+        object_keys=object_keys,
         num_concurrent_downloads=concurrency,
+        max_rows_per_chunk=chunk_max_rows,
+        use_async=use_async_fetch,
+        # Only parse fields that SelectFieldsRelevant would keep anyway
+        fields={*FieldSnowplow},
+        object_filter=object_filter,
+        cache=cache,
+        staging=staging,
+        num_parse_processes=num_parse_processes,
+        fields_categorical=FIELDS_CATEGORICAL,
     )
 
-    # Preprocess
-    df = preprocess_events(
-        df,
-        preprocessors=[
-            SelectFieldsRelevant(fields_relevant={*FieldSnowplow}),
-            DeleteRowsEmpty(
-                fields_required={
-                    FieldSnowplow.DERIVED_TSTAMP,
-                    FieldSnowplow.DOC_HEIGHT,
-                    FieldSnowplow.DOMAIN_SESSIONIDX,
-                    FieldSnowplow.DOMAIN_USERID,
-                    FieldSnowplow.DVCE_SCREENHEIGHT,
-                    FieldSnowplow.DVCE_SCREENWIDTH,
-                    FieldSnowplow.EVENT_ID,
-                    FieldSnowplow.EVENT_NAME,
-                    FieldSnowplow.PAGE_URL,
-                    FieldSnowplow.PAGE_URLHOST,
-                    FieldSnowplow.PAGE_URLPATH,
-                }
-            ),
-            ConvertFieldTypes(
-                fields_int={FieldSnowplow.DOMAIN_SESSIONIDX},
-                fields_float={
-                    FieldSnowplow.BR_VIEWHEIGHT,
-                    FieldSnowplow.BR_VIEWWIDTH,
-                    FieldSnowplow.DOC_HEIGHT,
-                    FieldSnowplow.DVCE_SCREENHEIGHT,
-                    FieldSnowplow.DVCE_SCREENWIDTH,
-                    FieldSnowplow.PP_YOFFSET_MAX,
-                },
-                fields_datetime={FieldSnowplow.DERIVED_TSTAMP},
-                fields_categorical={FieldSnowplow.EVENT_NAME, FieldSnowplow.REFR_MEDIUM, FieldSnowplow.REFR_SOURCE},
-                fields_json={
-                    FieldSnowplow.SEMISTRUCT_FORM_SUBMIT,
-                },
-            ),
-            # This happens after converting field type because timestamps need to be in datetime format
-            DeleteRowsDuplicateKey(
-                field_primary_key=FieldSnowplow.EVENT_ID, field_timestamp=FieldSnowplow.DERIVED_TSTAMP
-            ),
-            DeleteRowsBot(field_useragent=FieldSnowplow.USERAGENT),
-            AddFieldSiteName(site_name, field_site_name=FieldNew.SITE_NAME),
-            ReplaceNaNs(replace_with=None),
-        ],
-    )
+    # When streaming, events inserted so far, to tell duplicates split across chunks apart
+    events_written = EventsWritten(window=dedup_window) if chunk_max_rows is not None else None
+
+    for object_summaries, df in chunks:
+        result.num_rows_fetched += df.shape[0]
+
+        # Preprocess
+        # The chunk isn't used anywhere else, so preprocessors can modify it in place
+        df = preprocess_events(df, preprocessors=preprocessors, copy=False, engine=engine)
+        result.num_rows_preprocessed += df.shape[0]
+
+        df_earlier = None
+        event_ids_inserted: Optional[Set[str]] = None
+        if events_written is not None:
+            df, df_earlier = events_written.split(df)
+            event_ids_inserted = set()
+
+        # Write to DB
+        with write_semaphore or contextlib.nullcontext():
+            num_rows_existing = 0
+            if skip_existing:
+                df, num_rows_existing = drop_events_existing(df, session_factory)
+
+            if use_copy:
+                result.num_rows_inserted += write_events_copy(
+                    df, session_factory, num_rows_existing=num_rows_existing, event_ids_inserted=event_ids_inserted
+                )
+            else:
+                result.num_rows_inserted += write_events(
+                    df,
+                    session_factory,
+                    batch_size=write_batch_size,
+                    num_rows_existing=num_rows_existing,
+                    event_ids_inserted=event_ids_inserted,
+                )
+
+            # Replaced events were counted as inserted when first written
+            if df_earlier is not None:
+                replace_events_later(df_earlier, session_factory)
+
+        # Only events this run inserted are recorded, not those skipped because an earlier run
+        # loaded them, which replace_events_later must leave alone
+        if events_written is not None and event_ids_inserted is not None:
+            events_written.add(df, event_ids_inserted)
+            if df_earlier is not None:
+                events_written.add(df_earlier, set(df_earlier[FieldSnowplow.EVENT_ID]))
 
-    # Write to DB
-    engine = create_engine(get_conn_string())
-    session_factory = sessionmaker(engine)
+        # Chunks are made of whole objects, which are now all written
+        if manifest is not None:
+            manifest.add_objects_done(site_name, object_summaries)
 
-    write_events(df, session_factory)
+    return result
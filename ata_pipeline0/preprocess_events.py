@@ -2,20 +2,41 @@ from typing import List
 
 import pandas as pd
 
+from ata_pipeline0.helpers import metrics
+from ata_pipeline0.helpers.engine import Engine
 from ata_pipeline0.helpers.logging import logging
-from ata_pipeline0.helpers.preprocessors import Preprocessor
+from ata_pipeline0.helpers.preprocessors import Preprocessor, from_arrow, to_arrow
 
 logger = logging.getLogger(__name__)
 
 
-def preprocess_events(df: pd.DataFrame, preprocessors: List[Preprocessor]) -> pd.DataFrame:
+def preprocess_events(
+    df: pd.DataFrame, preprocessors: List[Preprocessor], copy: bool = True, engine: Engine = Engine.PANDAS
+) -> pd.DataFrame:
     """
     Main Snowplow events DataFrame preprocessing function, taking in a list of
     predefined preprocessors as above. Since the output DataFrame of one preprocessor
     becomes the input DataFrame of the one after it, the order of preprocessors matters.
+
+    If `copy` is False, the caller hands `df` over to the pipeline, which then lets
+    preprocessors modify it in place rather than making defensive copies. Don't use
+    `df` afterwards in that case.
+
+    On the Arrow engine, `df` is converted to an Arrow table once, which preprocessors
+    transform in turn (see `Preprocessor.transform_arrow`), and back to a DataFrame
+    once they're done. The result is the same as on the pandas engine, and `df` is
+    left as is either way.
     """
-    for preprocessor in preprocessors:
-        df = preprocessor(df)
+    stage = metrics.start("preprocess_events", df_in=df)
+    if engine == Engine.ARROW:
+        table = to_arrow(df)
+        for preprocessor in preprocessors:
+            table = preprocessor.call_arrow(table)
+        df = from_arrow(table, df.index)
+    else:
+        for preprocessor in preprocessors:
+            df = preprocessor(df, copy=copy)
+    stage.finish(df_out=df)
 
     logger.info(f"Preprocessed DataFrame shape: {df.shape}")
     return df
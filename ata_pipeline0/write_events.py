@@ -1,47 +1,333 @@
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
 import pandas as pd
 from ata_db_models.models import Event
-from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy.orm import sessionmaker
+from pandas.api.types import is_datetime64tz_dtype
+from sqlalchemy import JSON, String, cast, column, table, text
+from sqlalchemy.dialects.postgresql import Insert, insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, sessionmaker
 
+from ata_pipeline0.helpers import categorical, metrics
+from ata_pipeline0.helpers.fields import FieldNew, FieldSnowplow
 from ata_pipeline0.helpers.logging import logging
 
 logger = logging.getLogger(__name__)
 
 
-def write_events(df: pd.DataFrame, session_factory: sessionmaker) -> int:
+def write_events(
+    df: pd.DataFrame,
+    session_factory: sessionmaker,
+    batch_size: Optional[int] = None,
+    transaction_per_batch: bool = False,
+    num_rows_existing: int = 0,
+    event_ids_inserted: Optional[Set[str]] = None,
+) -> int:
     """
     Writes preprocessed events to database.
 
     This function accepts a `sessionmaker`, which is a factory for session
     objects, given an engine. A `sessionmaker` can be created like so:
     >>> session_factory = sessionmaker(engine)
+
+    If `batch_size` is set, events are inserted in batches of that many rows,
+    all within one transaction unless `transaction_per_batch` is True. Either
+    way, each batch is serialized in a background thread while the previous one
+    is being executed by the DB.
+
+    `num_rows_existing` is the number of events already dropped by `drop_events_existing`,
+    which are counted as skipped in the log.
+
+    If `event_ids_inserted` is set, the IDs of events actually inserted (rather than
+    skipped because their composite key already exists) are added to it.
     """
-    data = df.to_dict(orient="records")
+    if df.shape[0] == 0:
+        _log_result(df, 0, num_rows_existing)
+        return 0
+
+    stage = metrics.start("write_events", df_in=df)
+    batches = _serialize_batches(df, batch_size or df.shape[0])
+    num_rows_inserted = 0
+
+    # Wrap execution within a begin-commit-rollback block
+    # (see: https://docs.sqlalchemy.org/en/14/orm/session_basics.html#framing-out-a-begin-commit-rollback-block)
+    # TODO: Once sqlalchemy-stubs catches up to SQLAlchemy 1.4, remove the type: ignore comments below
+    # (see: https://github.com/dropbox/sqlalchemy-stubs/blob/ed9611114925f4b2aea42401217c0eacb1a564e1/sqlalchemy-stubs/orm/session.pyi#L102)
+    if transaction_per_batch:
+        for data in batches:
+            with session_factory.begin() as session:  # type: ignore
+                num_rows_inserted += _insert_batch(session, data, event_ids_inserted)
+    else:
+        with session_factory.begin() as session:  # type: ignore
+            for data in batches:
+                num_rows_inserted += _insert_batch(session, data, event_ids_inserted)
+
+    stage.finish(df_out=df, num_rows_out=num_rows_inserted)
+    _log_result(df, num_rows_inserted, num_rows_existing)
+
+    return num_rows_inserted
+
+
+def _serialize_batches(df: pd.DataFrame, batch_size: int) -> Iterator[List[Dict[Hashable, Any]]]:
+    """
+    Yields a DataFrame's rows as lists of records, `batch_size` rows at a time.
+    The next batch is serialized in a background thread while the current one is
+    being consumed, so that serialization overlaps with DB round trips (psycopg2
+    releases the GIL while waiting on the DB).
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future_prev = None
+        for idx in range(0, df.shape[0], batch_size):
+            future = executor.submit(_to_records, df.iloc[idx : idx + batch_size])
+            if future_prev is not None:
+                yield future_prev.result()
+            future_prev = future
+        if future_prev is not None:
+            yield future_prev.result()
+
+
+def _to_records(df: pd.DataFrame) -> List[Dict[Hashable, Any]]:
+    # Categorical fields are only decoded now, a batch at a time, with missing values as None
+    fields_categorical = [str(field) for field, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    if fields_categorical:
+        df = df.assign(**{field: categorical.decode(df[field]) for field in fields_categorical})
+    return df.to_dict(orient="records")
+
+
+def _insert_batch(
+    session: Session, data: List[Dict[Hashable, Any]], event_ids_inserted: Optional[Set[str]] = None
+) -> int:
+    # Create statement to bulk-insert event rows
+    # Insert.on_conflict_do_nothing skips through events whose [event_id, site_name]
+    # composite key already exists in the DB
+    statement = insert(Event).values(data).on_conflict_do_nothing(index_elements=[Event.site_name, Event.event_id])
+    if event_ids_inserted is not None:
+        return _execute_returning(session.connection(), statement, event_ids_inserted)
+    result = session.execute(statement)
+    # Count number of rows/events inserted
+    return result.rowcount
 
-    if data:
 
-        # Create statement to bulk-insert event rows
+def _execute_returning(connection: Connection, statement: Insert, event_ids_inserted: Set[str]) -> int:
+    # Rows skipped on conflict aren't returned, only those inserted
+    rows = connection.execute(statement.returning(cast(Event.event_id, String))).fetchall()
+    event_ids_inserted.update(event_id for event_id, in rows)
+    return len(rows)
+
+
+def write_events_copy(
+    df: pd.DataFrame,
+    session_factory: sessionmaker,
+    rows_per_read: int = 10_000,
+    num_rows_existing: int = 0,
+    event_ids_inserted: Optional[Set[str]] = None,
+) -> int:
+    """
+    Writes preprocessed events to database, like `write_events`, but using Postgres'
+    COPY instead of one giant INSERT ... VALUES statement, which is much faster and
+    lighter on memory for large DataFrames.
+
+    Events are streamed as CSV, `rows_per_read` rows at a time, into a temporary
+    staging table, from which they're then inserted into the events table, skipping
+    through events whose composite key already exists. `event_ids_inserted` is the
+    same as `write_events`'.
+    """
+    if df.shape[0] == 0:
+        _log_result(df, 0, num_rows_existing)
+        return 0
+
+    stage = metrics.start("write_events_copy", df_in=df)
+    fields = [str(field) for field in df.columns]
+    name_table_staging = f"{Event.__tablename__}_staging"
+
+    with session_factory.begin() as session:  # type: ignore
+        connection = session.connection()
+        quote = connection.dialect.identifier_preparer.quote
+
+        # The staging table mirrors the events table, minus its primary key, and is dropped
+        # once the transaction is over
+        connection.execute(
+            text(f"CREATE TEMPORARY TABLE {quote(name_table_staging)} (LIKE {quote(Event.__tablename__)}) ON COMMIT DROP")
+        )
+        # Timezone-aware timestamps are staged as such so that they're converted to the events
+        # table's naive timestamps the same way write_events' INSERT statement converts them
+        for field in fields:
+            if is_datetime64tz_dtype(df[field]):
+                connection.execute(
+                    text(f"ALTER TABLE {quote(name_table_staging)} ALTER COLUMN {quote(field)} TYPE TIMESTAMPTZ")
+                )
+
+        # COPY isn't supported by SQLAlchemy, so use the underlying psycopg2 cursor
+        with connection.connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {quote(name_table_staging)} ({', '.join(quote(field) for field in fields)}) "
+                + "FROM STDIN WITH (FORMAT CSV, NULL '\\N')",
+                _CSVReader(_serialize_csv(df, rows_per_read)),
+            )
+
         # Insert.on_conflict_do_nothing skips through events whose [event_id, site_name]
         # composite key already exists in the DB
-        statement = insert(Event).values(data).on_conflict_do_nothing(index_elements=[Event.site_name, Event.event_id])
+        table_staging = table(name_table_staging, *[column(field) for field in fields])
+        statement = (
+            insert(Event)
+            .from_select(fields, table_staging.select())
+            .on_conflict_do_nothing(index_elements=[Event.site_name, Event.event_id])
+        )
+        if event_ids_inserted is not None:
+            num_rows_inserted = _execute_returning(connection, statement, event_ids_inserted)
+        else:
+            num_rows_inserted = connection.execute(statement).rowcount
 
-        # Wrap execution within a begin-commit-rollback block
-        # (see: https://docs.sqlalchemy.org/en/14/orm/session_basics.html#framing-out-a-begin-commit-rollback-block)
-        # TODO: Once sqlalchemy-stubs catches up to SQLAlchemy 1.4, remove the type: ignore comment below
-        # (see: https://github.com/dropbox/sqlalchemy-stubs/blob/ed9611114925f4b2aea42401217c0eacb1a564e1/sqlalchemy-stubs/orm/session.pyi#L102)
-        with session_factory.begin() as session:  # type: ignore
-            result = session.execute(statement)
+    stage.finish(df_out=df, num_rows_out=num_rows_inserted)
+    _log_result(df, num_rows_inserted, num_rows_existing)
 
-        # Count number of rows/events inserted
-        num_rows_inserted = result.rowcount
+    return num_rows_inserted
 
-        # Log message
-        logger.info(
-            f"Inserted {num_rows_inserted} rows into the {Event.__name__} table. "
-            + f"Skipped {df.shape[0] - num_rows_inserted} rows whose event ID-site name composite key already exists."
+
+def replace_events_later(df: pd.DataFrame, session_factory: sessionmaker) -> int:
+    """
+    Writes events that duplicate ones already written, replacing each of those whose
+    derived timestamp is later, so that the earliest duplicate is kept, same as
+    DeleteRowsDuplicateKey does within a DataFrame. Returns the number of events replaced.
+
+    This is an upsert, so it should only be given events whose composite key was
+    inserted by the same pipeline run (see `write_events`' `event_ids_inserted`), lest
+    it overwrite events loaded by earlier runs.
+    """
+    if df.shape[0] == 0:
+        return 0
+
+    stage = metrics.start("replace_events_later", df_in=df)
+
+    with session_factory.begin() as session:  # type: ignore
+        statement = insert(Event).values(_to_records(df))
+        statement = statement.on_conflict_do_update(
+            index_elements=[Event.site_name, Event.event_id],
+            set_={str(field): statement.excluded[str(field)] for field in df.columns},
+            where=Event.derived_tstamp > statement.excluded[FieldSnowplow.DERIVED_TSTAMP],
         )
+        num_rows_replaced = session.execute(statement).rowcount
 
-        return num_rows_inserted
-    else:
+    stage.finish(df_out=df, num_rows_out=num_rows_replaced)
+    logger.info(f"Replaced {num_rows_replaced} rows with earlier duplicates of theirs.")
+
+    return num_rows_replaced
+
+
+# Event IDs are passed as a single array, rather than as one bind parameter each, to keep
+# statements small
+_QUERY_EVENT_IDS_EXISTING = text(
+    f"SELECT CAST(event_id AS TEXT) FROM {Event.__tablename__} "
+    + "WHERE site_name = :site_name AND event_id = ANY(CAST(:event_ids AS UUID[]))"
+)
+
+
+def drop_events_existing(
+    df: pd.DataFrame, session_factory: sessionmaker, batch_size: int = 10_000
+) -> Tuple[pd.DataFrame, int]:
+    """
+    Drops events whose event ID-site name composite key already exists in the DB, so
+    that they don't have to be serialized, sent and conflict-checked when written.
+    Returns the remaining events and the number of events dropped, to be passed to
+    `write_events` or `write_events_copy` as `num_rows_existing`.
+
+    Keys are looked up `batch_size` event IDs at a time, through the events table's
+    primary key index.
+    """
+    is_existing = pd.Series(False, index=df.index)
+
+    with session_factory() as session:
+        for site_name in df[FieldNew.SITE_NAME].unique():
+            is_site = df[FieldNew.SITE_NAME] == site_name
+            event_ids = df.loc[is_site, FieldSnowplow.EVENT_ID].unique().tolist()
+
+            event_ids_existing: Set[str] = set()
+            for idx in range(0, len(event_ids), batch_size):
+                rows = session.execute(
+                    _QUERY_EVENT_IDS_EXISTING,
+                    {
+                        "site_name": site_name.value if isinstance(site_name, Enum) else site_name,
+                        "event_ids": event_ids[idx : idx + batch_size],
+                    },
+                ).fetchall()
+                event_ids_existing.update(event_id for event_id, in rows)
+
+            is_existing |= is_site & df[FieldSnowplow.EVENT_ID].isin(event_ids_existing)
+
+    num_rows_existing = int(is_existing.sum())
+    logger.info(f"Dropped {num_rows_existing} rows whose event ID-site name composite key already exists")
+    return df[~is_existing], num_rows_existing
+
+
+def _log_result(df: pd.DataFrame, num_rows_inserted: int, num_rows_existing: int = 0) -> None:
+    if df.shape[0] == 0 and num_rows_existing == 0:
         logger.info("No rows to insert.")
-        return 0
+        return
+
+    logger.info(
+        f"Inserted {num_rows_inserted} rows into the {Event.__name__} table. "
+        + f"Skipped {df.shape[0] - num_rows_inserted + num_rows_existing} rows whose event ID-site name composite key "
+        + "already exists."
+    )
+
+
+def _serialize_csv(df: pd.DataFrame, rows_per_read: int) -> Iterator[str]:
+    """
+    Serializes a DataFrame to CSV, `rows_per_read` rows at a time, with values
+    formatted the way psycopg2 would adapt them in an INSERT statement.
+    """
+    # Enums (e.g., site names) should be written as their values rather than their names
+    fields_enum = [field for field in df.columns if isinstance(df[field].iloc[0], Enum)]
+    # Same as SQLAlchemy's JSON type, None is written as a JSON null rather than an SQL NULL
+    fields_json = [
+        field
+        for field in df.columns
+        if field in Event.__table__.columns and isinstance(Event.__table__.columns[field].type, JSON)
+    ]
+
+    for idx in range(0, df.shape[0], rows_per_read):
+        df_chunk = df.iloc[idx : idx + rows_per_read]
+        fields_converted = {
+            **{field: df_chunk[field].map(lambda x: x.value if isinstance(x, Enum) else x) for field in fields_enum},
+            **{field: df_chunk[field].map(lambda x: json.dumps(None if _is_nan(x) else x)) for field in fields_json},
+        }
+        if fields_converted:
+            df_chunk = df_chunk.assign(**{str(field): values for field, values in fields_converted.items()})
+        yield df_chunk.to_csv(header=False, index=False, na_rep="\\N")
+
+
+def _is_nan(value: object) -> bool:
+    return isinstance(value, float) and value != value
+
+
+class _CSVReader:
+    """
+    Minimal read-only file object over an iterator of CSV strings, so that COPY
+    can consume a DataFrame without it being serialized all at once.
+    """
+
+    def __init__(self, chunks: Iterator[str]) -> None:
+        self._chunks = chunks
+        self._buffer = io.StringIO()
+
+    def read(self, size: int = -1) -> str:
+        parts: List[str] = []
+        num_chars = 0
+
+        while size < 0 or num_chars < size:
+            part = self._buffer.read(-1 if size < 0 else size - num_chars)
+            if part:
+                parts.append(part)
+                num_chars += len(part)
+                continue
+
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer = io.StringIO(chunk)
+
+        return "".join(parts)
@@ -0,0 +1,37 @@
+"""
+Compares the throughput of DeleteRowsBot's bot detectors on a column of user agents
+with a given number of distinct values.
+
+Run from the root of the project, e.g.:
+$ python -m benchmarks.bench_bots --num-rows 200000 --num-unique 5000
+"""
+import time
+
+import click
+import pandas as pd
+
+from ata_pipeline0.helpers.bots import BotDetector
+from ata_pipeline0.helpers.fields import FieldSnowplow
+from ata_pipeline0.helpers.preprocessors import DeleteRowsBot, _is_bot
+from fakes import USERAGENTS
+
+
+@click.command()
+@click.option("--num-rows", type=int, default=200_000, help="Number of events.")
+@click.option("--num-unique", type=int, default=5_000, help="Number of distinct user agents among events.")
+def bench_bots(num_rows: int, num_unique: int) -> None:
+    # Vary the corpus' user agents by appending a version number, to get num_unique distinct ones
+    useragents_unique = [f"{USERAGENTS[i % len(USERAGENTS)]} v/{i}" for i in range(num_unique)]
+    df = pd.DataFrame({FieldSnowplow.USERAGENT: [useragents_unique[i % num_unique] for i in range(num_rows)]})
+
+    for detector in BotDetector:
+        # Start from a cold cache, as in a fresh Lambda container
+        _is_bot.cache_clear()
+        start = time.perf_counter()
+        df_out = DeleteRowsBot(FieldSnowplow.USERAGENT, detector=detector).transform(df)
+        elapsed = time.perf_counter() - start
+        print(f"{detector.value:<12} {elapsed:8.2f}s {num_rows / elapsed:12,.0f} rows/s {df_out.shape[0]:>10} rows kept")
+
+
+if __name__ == "__main__":
+    bench_bots()
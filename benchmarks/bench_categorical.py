@@ -0,0 +1,88 @@
+"""
+Compares the memory footprint and time of parsing and preprocessing an hour of
+events with repetitive string fields held as one str object per row versus
+dictionary-encoded as categoricals (`ata_pipeline0.main.FIELDS_CATEGORICAL`).
+
+Events are made up to look like a real hour's: a few thousand readers, each with
+their own user agent, pinging a few hundred pages.
+
+Run from the root of the project, e.g.:
+$ python -m benchmarks.bench_categorical --num-rows 200000
+"""
+import io
+import random
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import click
+
+from ata_pipeline0.fetch_events import _decompress_parse_object
+from ata_pipeline0.helpers.fields import FieldSnowplow
+from ata_pipeline0.helpers.preprocessors import _is_bot
+from ata_pipeline0.helpers.site import SiteName
+from ata_pipeline0.main import FIELDS_CATEGORICAL, get_preprocessors
+from ata_pipeline0.preprocess_events import preprocess_events
+from fakes import make_event_row, make_object_data
+
+
+def _make_rows(num_rows: int, num_users: int, num_pages: int) -> List[Dict[str, Any]]:
+    rng = random.Random(0)
+    users = [
+        (
+            f"{i:08x}-b05f-4521-a589-52dc6d250e8f",
+            f"Mozilla/5.0 (iPhone; CPU iPhone OS 15_{i % 7} like Mac OS X) AppleWebKit/605.1.{i % 50} Mobile/{i}",
+        )
+        for i in range(num_users)
+    ]
+    paths = [f"/news/2022/11/story-number-{i}-about-something/" for i in range(num_pages)]
+
+    rows = []
+    for _ in range(num_rows):
+        domain_userid, useragent = rng.choice(users)
+        path = rng.choice(paths)
+        rows.append(
+            make_event_row(
+                domain_userid=domain_userid,
+                useragent=useragent,
+                event_name=rng.choice(["page_ping"] * 8 + ["page_view"]),
+                page_url=f"https://fakehost.com{path}",
+                page_urlpath=path,
+                refr_source=rng.choice(["Google", "Bing", None]),
+            )
+        )
+    return rows
+
+
+def _measure(name: str, data: bytes, fields_categorical: Optional[Set[FieldSnowplow]]) -> None:
+    # Don't let the other run's bot checks be reused
+    _is_bot.cache_clear()
+
+    start = time.perf_counter()
+    df = _decompress_parse_object(io.BytesIO(data), fields={*FieldSnowplow}, fields_categorical=fields_categorical)
+    elapsed_parse = time.perf_counter() - start
+    memory_parsed = df.memory_usage(deep=True).sum()
+    memory_parsed_fields = df[[*FIELDS_CATEGORICAL.intersection(df.columns)]].memory_usage(deep=True).sum()
+
+    start = time.perf_counter()
+    df = preprocess_events(df, get_preprocessors(SiteName.AFRO_LA), copy=False)
+    elapsed_preprocess = time.perf_counter() - start
+    memory_preprocessed = df.memory_usage(deep=True).sum()
+
+    print(
+        f"{name:<12} parse {elapsed_parse:6.2f}s {memory_parsed / 2**20:8.1f} MiB "
+        + f"({memory_parsed_fields / 2**20:.1f} MiB of it in FIELDS_CATEGORICAL), preprocess {elapsed_preprocess:6.2f}s {memory_preprocessed / 2**20:8.1f} MiB"
+    )
+
+
+@click.command()
+@click.option("--num-rows", type=int, default=200_000, help="Number of events in the hour.")
+@click.option("--num-users", type=int, default=5_000, help="Number of distinct readers (and user agents).")
+@click.option("--num-pages", type=int, default=300, help="Number of distinct pages.")
+def bench_categorical(num_rows: int, num_users: int, num_pages: int) -> None:
+    data = make_object_data(_make_rows(num_rows, num_users, num_pages))
+    _measure("str", data, None)
+    _measure("categorical", data, FIELDS_CATEGORICAL)
+
+
+if __name__ == "__main__":
+    bench_categorical()
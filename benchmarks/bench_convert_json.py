@@ -0,0 +1,70 @@
+"""
+Compares the time of decoding the form submission field in ConvertFieldTypes with
+ast.literal_eval row by row (the original approach) versus with a JSON decoder on
+distinct non-missing values, on a form-heavy site's events.
+
+Run from the root of the project, e.g.:
+$ python -m benchmarks.bench_convert_json --num-rows 200000 --share-forms 0.2 --num-unique 1000
+"""
+import ast
+import json
+import time
+from typing import Any, Callable, List, Tuple
+
+import click
+import numpy as np
+import pandas as pd
+
+from ata_pipeline0.helpers.fields import FieldSnowplow
+from ata_pipeline0.helpers.preprocessors import ConvertFieldTypes
+
+
+def _convert_literal_eval(values: pd.Series) -> pd.Series:
+    def convert(value: Any) -> Any:
+        try:
+            return ast.literal_eval(value)
+        except ValueError:
+            return None
+
+    return values.apply(convert)
+
+
+def _make_payload(i: int) -> dict:
+    return {
+        "formId": f"newsletter-{i % 7}",
+        "formClasses": ["signup", "footer"],
+        "elements": [
+            {"name": "email", "value": f"reader{i}@example.com", "nodeName": "INPUT", "type": "email"},
+            {"name": "zip", "value": f"{75200 + i % 100}", "nodeName": "INPUT", "type": "text"},
+            {"name": "consent", "value": "on", "nodeName": "INPUT", "type": "checkbox"},
+        ],
+    }
+
+
+@click.command()
+@click.option("--num-rows", type=int, default=200_000, help="Number of events.")
+@click.option("--share-forms", type=float, default=0.2, help="Share of events that are form submissions.")
+@click.option("--num-unique", type=int, default=1_000, help="Number of distinct form submissions.")
+def bench_convert_json(num_rows: int, share_forms: float, num_unique: int) -> None:
+    rng = np.random.default_rng(0)
+    payloads = [_make_payload(i) for i in range(num_unique)]
+    is_form = rng.random(num_rows) < share_forms
+    picks = rng.integers(num_unique, size=num_rows)
+    # Before nested values were kept as JSON, parsing turned them into their Python repr
+    values_json = pd.Series([json.dumps(payloads[j]) if f else np.nan for f, j in zip(is_form, picks)])
+    values_repr = pd.Series([str(payloads[j]) if f else np.nan for f, j in zip(is_form, picks)])
+
+    runs: List[Tuple[str, Callable[[pd.Series], pd.Series], pd.Series]] = [
+        ("literal_eval, row by row", _convert_literal_eval, values_repr),
+        ("fast path, Python literals", ConvertFieldTypes._convert_to_json_column, values_repr),
+        ("fast path, JSON", ConvertFieldTypes._convert_to_json_column, values_json),
+    ]
+    for name, convert, values in runs:
+        start = time.perf_counter()
+        convert(values.rename(FieldSnowplow.SEMISTRUCT_FORM_SUBMIT))
+        elapsed = time.perf_counter() - start
+        print(f"{name:<28} {elapsed:8.3f}s {num_rows / elapsed:14,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    bench_convert_json()
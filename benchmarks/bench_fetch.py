@@ -0,0 +1,56 @@
+"""
+Benchmarks the threaded and asyncio-based engines of fetch_events against an
+in-memory fake S3 with a simulated per-GET latency, so no network is needed, and,
+with --parse-processes, the same engines parsing objects in a process pool.
+
+Run from the root of the project, e.g.:
+$ python -m benchmarks.bench_fetch --num-objects 300 --latency 0.05
+"""
+import time
+from datetime import datetime
+
+import click
+
+from ata_pipeline0.fetch_events import fetch_events
+from ata_pipeline0.helpers.site import SiteName
+from fakes import FakeS3Resource, make_event_row, make_object_data
+
+
+@click.command()
+@click.option("--num-objects", type=int, default=300, help="Number of S3 objects in the hour.")
+@click.option("--num-rows", type=int, default=200, help="Number of events per S3 object.")
+@click.option("--latency", type=float, default=0.05, help="Simulated latency of each GET, in seconds.")
+@click.option("--threads", type=int, default=8, help="Number of threads of the threaded engine.")
+@click.option("--max-concurrency", type=int, default=256, help="Maximum in-flight GETs of the asyncio engine.")
+@click.option("--parse-processes", type=int, default=0, help="Also run the engines with this many parsing processes.")
+def bench_fetch(
+    num_objects: int, num_rows: int, latency: float, threads: int, max_concurrency: int, parse_processes: int
+) -> None:
+    site_name = SiteName.THE_19TH
+    timestamp = datetime(2022, 11, 23, 0)
+
+    s3_resource = FakeS3Resource()
+    bucket = s3_resource.Bucket(f"lnl-snowplow-{site_name}")
+    data = make_object_data([make_event_row() for _ in range(num_rows)])
+    for i in range(num_objects):
+        bucket.put_object(Key=f"enriched/good/{timestamp.strftime('%Y/%m/%d/%H')}/{i:05}.gz", Body=data, latency=latency)
+
+    runs = [
+        (f"threaded ({threads} threads)", dict(num_concurrent_downloads=threads)),
+        (f"async (up to {max_concurrency} in flight)", dict(num_concurrent_downloads=max_concurrency, use_async=True)),
+    ]
+    if parse_processes:
+        runs += [
+            (f"{name} + {parse_processes} processes", dict(**kwargs, num_parse_processes=parse_processes))
+            for name, kwargs in runs
+        ]
+
+    for name, kwargs in runs:
+        start = time.perf_counter()
+        df = fetch_events(s3_resource, site_name, timestamps=[timestamp], **kwargs)  # type: ignore
+        elapsed = time.perf_counter() - start
+        print(f"{name:<50} {elapsed:8.2f}s {df.shape[0] / elapsed:12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    bench_fetch()
@@ -0,0 +1,59 @@
+"""
+Measures how long importing the Lambda entry point takes, which adds to every cold
+start, with `python -X importtime` in fresh processes. Fails if the median import
+time is above a threshold, to catch a heavy dependency creeping back into the
+module-level imports.
+
+Run from the root of the project, e.g.:
+$ python -m benchmarks.bench_import --repeat 10 --max-ms 100
+"""
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+import click
+
+# e.g., "import time:       310 |       6486 |   json"
+_PATTERN_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| *(\S+)")
+
+
+def _import(module: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Imports a module in a fresh interpreter and returns the self and cumulative
+    import times, in microseconds, of each module it imported.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        match = _PATTERN_IMPORTTIME.match(line)
+        if match is not None:
+            time_self, time_cumulative, name = match.groups()
+            times[name] = (int(time_self), int(time_cumulative))
+    return times
+
+
+@click.command()
+@click.option("--module", default="ata_pipeline0.main", help="Module to import.")
+@click.option("--repeat", type=int, default=10, help="Number of fresh processes to import the module in.")
+@click.option("--max-ms", type=float, default=100.0, help="Fail if the median import time is above this.")
+@click.option("--top", type=int, default=10, help="Number of slowest imports (by self time) to list.")
+def bench_import(module: str, repeat: int, max_ms: float, top: int) -> None:
+    runs = [_import(module) for _ in range(repeat)]
+    times_ms = [run[module][1] / 1000 for run in runs]
+    median_ms = statistics.median(times_ms)
+
+    print("Slowest imports (self time, last run):")
+    for name, (time_self, time_cumulative) in sorted(runs[-1].items(), key=lambda item: -item[1][0])[:top]:
+        print(f"{name:<50} {time_self / 1000:8.1f}ms {time_cumulative / 1000:8.1f}ms cumulative")
+    print(f"import {module}: median {median_ms:.1f}ms, min {min(times_ms):.1f}ms, max {max(times_ms):.1f}ms")
+
+    if median_ms > max_ms:
+        raise click.ClickException(f"Importing {module} took {median_ms:.1f}ms (median), above {max_ms:.1f}ms")
+
+
+if __name__ == "__main__":
+    bench_import()
@@ -0,0 +1,47 @@
+"""
+Compares rows/s of decoding a synthetic file of enriched Snowplow events with each
+installed JSON backend, one line at a time versus in batches.
+
+Run from the root of the project, e.g.:
+$ python -m benchmarks.bench_json --num-rows 50000
+"""
+import gzip
+import time
+from typing import Callable, List
+
+import click
+
+from ata_pipeline0.helpers.json import _BACKENDS, get_loads, loads_lines
+from fakes import make_event_row, make_object_data
+
+
+def _measure(name: str, decode: Callable[[List[bytes]], list], lines: List[bytes]) -> None:
+    start = time.perf_counter()
+    decode(lines)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {elapsed:8.3f}s {len(lines) / elapsed:12,.0f} rows/s")
+
+
+@click.command()
+@click.option("--num-rows", type=int, default=50_000, help="Number of events in the synthetic file.")
+@click.option("--batch-size", type=int, default=1000, help="Number of lines decoded per batched call.")
+def bench_json(num_rows: int, batch_size: int) -> None:
+    data = make_object_data([make_event_row() for _ in range(num_rows)])
+    lines = gzip.decompress(data).splitlines()
+
+    for backend in sorted(_BACKENDS):
+        loads = get_loads(backend)
+        _measure(f"{backend} per line", lambda lines: [loads(line) for line in lines], lines)
+        _measure(
+            f"{backend} batched",
+            lambda lines: [
+                event
+                for i in range(0, len(lines), batch_size)
+                for event in loads_lines(lines[i : i + batch_size], loads=loads)
+            ],
+            lines,
+        )
+
+
+if __name__ == "__main__":
+    bench_json()
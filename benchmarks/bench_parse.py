@@ -0,0 +1,50 @@
+"""
+Compares peak memory and time of decompressing and parsing a single S3 object
+all at once (the original approach) versus incrementally, line by line.
+
+Run from the root of the project, e.g.:
+$ python -m benchmarks.bench_parse --num-rows 20000
+"""
+import gzip
+import io
+import json
+import time
+import tracemalloc
+from typing import Callable
+
+import click
+import pandas as pd
+
+from ata_pipeline0.fetch_events import _decompress_parse_object
+from fakes import make_event_row, make_object_data
+
+
+def _decompress_parse_at_once(data: bytes) -> pd.DataFrame:
+    rows = gzip.decompress(data).decode("utf-8").strip().split("\n")
+    return pd.DataFrame([json.loads(row) for row in rows], dtype=str)
+
+
+def _decompress_parse_incrementally(data: bytes) -> pd.DataFrame:
+    return _decompress_parse_object(io.BytesIO(data))
+
+
+def _measure(parse: Callable[[bytes], pd.DataFrame], data: bytes) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = parse(data)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{parse.__name__:<36} {elapsed:8.2f}s {peak / 2**20:10.1f} MiB peak {df.shape[0] / elapsed:12,.0f} rows/s")
+
+
+@click.command()
+@click.option("--num-rows", type=int, default=20_000, help="Number of events in the S3 object.")
+def bench_parse(num_rows: int) -> None:
+    data = make_object_data([make_event_row() for _ in range(num_rows)])
+    for parse in [_decompress_parse_at_once, _decompress_parse_incrementally]:
+        _measure(parse, data)
+
+
+if __name__ == "__main__":
+    bench_parse()
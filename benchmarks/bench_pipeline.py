@@ -0,0 +1,288 @@
+"""
+Times every stage of the pipeline on a synthetic hour of events (see benchmarks/events.py):
+fetching from an in-memory fake S3, parsing on its own, each preprocessor, and, with
+--write, writing to a local Postgres DB. Stages are measured by the metrics hooks of
+`ata_pipeline0.helpers.metrics`, so they're the same stages the pipeline reports.
+
+Each run's median stage times are appended, along with the commit and parameters, to a
+JSON lines file (--results), and compared to the last run there with the same
+parameters. With --max-regression, fails if a stage got slower than that, e.g., 0.2
+for 20% slower.
+
+Writing creates the tables in the DB given by the HOST, PORT, USERNAME, PASSWORD and
+DB_NAME environment variables if they're missing, and deletes the events it wrote
+afterwards.
+
+Run from the root of the project, e.g.:
+$ python -m benchmarks.bench_pipeline --num-objects 20 --num-rows 5000 --repeat 3 --write
+"""
+import io
+import json
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import click
+
+from ata_pipeline0.fetch_events import _decompress_parse_object, fetch_events
+from ata_pipeline0.helpers import metrics
+from ata_pipeline0.helpers.engine import Engine
+from ata_pipeline0.helpers.fields import FieldSnowplow
+from ata_pipeline0.helpers.preprocessors import _is_bot
+from ata_pipeline0.helpers.site import SiteName
+from ata_pipeline0.main import FIELDS_CATEGORICAL, get_preprocessors
+from ata_pipeline0.preprocess_events import preprocess_events
+from benchmarks.events import make_objects, put_objects
+from fakes import FakeS3Resource
+
+# Stages shorter than this are too noisy to flag as regressions
+_SECONDS_MIN_COMPARED = 0.01
+
+
+def _get_commit() -> Optional[str]:
+    process = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    return process.stdout.strip() or None
+
+
+def _run(
+    s3_resource: FakeS3Resource,
+    site_name: SiteName,
+    hour: datetime,
+    datas: List[bytes],
+    concurrency: int,
+    session_factory: Any,
+    use_copy: bool,
+    engine: Engine,
+) -> List[metrics.StageMetrics]:
+    """
+    Runs the pipeline once and returns the metrics of its stages, in order.
+    """
+    from ata_pipeline0.write_events import write_events, write_events_copy
+
+    # Don't let previous runs' bot checks be reused
+    _is_bot.cache_clear()
+
+    stages: List[metrics.StageMetrics] = []
+    metrics.add_hook(stages.append)
+    try:
+        df = fetch_events(
+            s3_resource,  # type: ignore
+            site_name,
+            num_concurrent_downloads=concurrency,
+            timestamps=[hour],
+            fields={*FieldSnowplow},
+            fields_categorical=FIELDS_CATEGORICAL,
+        )
+
+        # Parsing is part of fetching, but is also timed on its own, off the (fake) network
+        stage = metrics.start("parse")
+        num_rows_parsed = sum(
+            _decompress_parse_object(
+                io.BytesIO(data), fields={*FieldSnowplow}, fields_categorical=FIELDS_CATEGORICAL
+            ).shape[0]
+            for data in datas
+        )
+        stage.finish(num_rows_out=num_rows_parsed, num_bytes=sum(len(data) for data in datas))
+
+        df = preprocess_events(df, get_preprocessors(site_name), copy=False, engine=engine)
+
+        if session_factory is not None:
+            try:
+                if use_copy:
+                    write_events_copy(df, session_factory)
+                else:
+                    write_events(df, session_factory)
+            finally:
+                _delete_events(session_factory, site_name, df[FieldSnowplow.EVENT_ID].tolist())
+    finally:
+        metrics.remove_hook(stages.append)
+
+    return stages
+
+
+def _get_session_factory() -> Any:
+    from ata_db_models.helpers import get_conn_string
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlmodel import SQLModel
+
+    engine = create_engine(get_conn_string())
+    SQLModel.metadata.create_all(engine)
+    return sessionmaker(engine)
+
+
+def _delete_events(session_factory: Any, site_name: SiteName, event_ids: List[str]) -> None:
+    from ata_db_models.models import Event
+    from sqlalchemy import text
+
+    with session_factory.begin() as session:
+        session.execute(
+            text(
+                f"DELETE FROM {Event.__tablename__} "
+                + "WHERE site_name = :site_name AND event_id = ANY(CAST(:event_ids AS UUID[]))"
+            ),
+            {"site_name": site_name.value, "event_ids": event_ids},
+        )
+
+
+def _summarize(runs: List[List[metrics.StageMetrics]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Medians, over runs, of each stage's times, along with its rows and how much it
+    raised peak memory (which only the first run is likely to). A stage run more than
+    once per run (e.g., fetching several chunks) is summed.
+    """
+    stages: Dict[str, Dict[str, Any]] = {}
+    for i, run in enumerate(runs):
+        for stage_metrics in run:
+            stage = stages.setdefault(
+                stage_metrics.stage,
+                {
+                    "seconds_wall": [0.0] * len(runs),
+                    "seconds_cpu": [0.0] * len(runs),
+                    "num_rows_in": stage_metrics.num_rows_in,
+                    "num_rows_out": stage_metrics.num_rows_out,
+                    "memory_peak_increase_bytes": 0,
+                },
+            )
+            stage["seconds_wall"][i] += stage_metrics.seconds_wall
+            stage["seconds_cpu"][i] += stage_metrics.seconds_cpu
+            stage["memory_peak_increase_bytes"] = max(
+                stage["memory_peak_increase_bytes"], stage_metrics.memory_peak_increase_bytes
+            )
+
+    for stage in stages.values():
+        stage["seconds_wall"] = statistics.median(stage["seconds_wall"])
+        stage["seconds_cpu"] = statistics.median(stage["seconds_cpu"])
+    return stages
+
+
+def _read_previous(path: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    previous = None
+    try:
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record["params"] == params:
+                    previous = record
+    except FileNotFoundError:
+        pass
+    return previous
+
+
+@click.command()
+@click.option("--num-objects", type=int, default=20, help="Number of S3 objects in the hour.")
+@click.option("--num-rows", type=int, default=5_000, help="Number of events per S3 object.")
+@click.option("--duplicate-rate", type=float, default=0.01, help="Share of events that are duplicates.")
+@click.option("--bot-ratio", type=float, default=0.05, help="Share of events by crawlers.")
+@click.option("--form-submit-share", type=float, default=0.01, help="Share of events that are form submissions.")
+@click.option(
+    "--columns",
+    type=click.Choice(["all", "relevant"]),
+    default="all",
+    help="Whether events hold all fields of a real enriched event, or only those the pipeline uses.",
+)
+@click.option("--seed", type=int, default=0, help="Seed of the event generator.")
+@click.option("--concurrency", type=int, default=8, help="Number of concurrent downloads.")
+@click.option(
+    "--engine",
+    type=click.Choice([engine.value for engine in Engine]),
+    default=Engine.PANDAS.value,
+    help="Engine to preprocess events on.",
+)
+@click.option("--repeat", type=int, default=3, help="Number of runs, whose median times are reported.")
+@click.option("--write/--no-write", default=False, help="Also time writing events to the local Postgres DB.")
+@click.option("--use-copy", is_flag=True, help="Write events with COPY (write_events_copy).")
+@click.option("--results", default=".benchmark-results.jsonl", help="JSON lines file results are appended to.")
+@click.option("--max-regression", type=float, help="Fail if a stage is this much slower than last time, e.g., 0.2.")
+def bench_pipeline(
+    num_objects: int,
+    num_rows: int,
+    duplicate_rate: float,
+    bot_ratio: float,
+    form_submit_share: float,
+    columns: str,
+    seed: int,
+    concurrency: int,
+    engine: str,
+    repeat: int,
+    write: bool,
+    use_copy: bool,
+    results: str,
+    max_regression: Optional[float],
+) -> None:
+    site_name = SiteName.AFRO_LA
+    hour = datetime(2022, 11, 23, 0)
+    params: Dict[str, Any] = dict(
+        num_objects=num_objects,
+        num_rows=num_rows,
+        duplicate_rate=duplicate_rate,
+        bot_ratio=bot_ratio,
+        form_submit_share=form_submit_share,
+        columns=columns,
+        seed=seed,
+        concurrency=concurrency,
+        engine=engine,
+        write="copy" if write and use_copy else "insert" if write else None,
+    )
+
+    datas = make_objects(
+        num_objects,
+        num_rows,
+        duplicate_rate=duplicate_rate,
+        bot_ratio=bot_ratio,
+        form_submit_share=form_submit_share,
+        fields=None if columns == "all" else {*FieldSnowplow},
+        hour=hour,
+        seed=seed,
+    )
+    s3_resource = FakeS3Resource()
+    put_objects(s3_resource.Bucket(f"lnl-snowplow-{site_name}"), hour, datas)
+    print(f"Generated {num_objects} objects of {num_rows} events, {sum(len(data) for data in datas) / 2**20:.1f} MiB")
+
+    session_factory = _get_session_factory() if write else None
+    runs = [
+        _run(s3_resource, site_name, hour, datas, concurrency, session_factory, use_copy, Engine(engine))
+        for _ in range(repeat)
+    ]
+    stages = _summarize(runs)
+
+    previous = _read_previous(results, params)
+    with open(results, "a") as f:
+        record = dict(
+            timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            commit=_get_commit(),
+            params=params,
+            stages=stages,
+        )
+        f.write(json.dumps(record) + "\n")
+
+    header = f"{'stage':<24} {'wall':>8} {'cpu':>8} {'rows in':>10} {'rows out':>10} {'peak +MiB':>10}"
+    if previous is not None:
+        header += f" {'previous':>9} (commit {previous['commit']}, {previous['timestamp']})"
+    print(header)
+
+    regressions = []
+    for name, stage in stages.items():
+        line = (
+            f"{name:<24} {stage['seconds_wall']:7.3f}s {stage['seconds_cpu']:7.3f}s "
+            + f"{stage['num_rows_in'] if stage['num_rows_in'] is not None else '':>10} "
+            + f"{stage['num_rows_out'] if stage['num_rows_out'] is not None else '':>10} "
+            + f"{stage['memory_peak_increase_bytes'] / 2**20:10.1f}"
+        )
+        stage_previous = None if previous is None else previous["stages"].get(name)
+        if stage_previous is not None:
+            change = stage["seconds_wall"] / stage_previous["seconds_wall"] - 1 if stage_previous["seconds_wall"] else 0
+            line += f" {stage_previous['seconds_wall']:8.3f}s {change:+7.0%}"
+            if max_regression is not None and change > max_regression and stage["seconds_wall"] >= _SECONDS_MIN_COMPARED:
+                regressions.append(f"{name} ({change:+.0%})")
+        print(line)
+
+    if regressions:
+        raise click.ClickException(
+            f"Stages slower than {max_regression:.0%} more than last time: {', '.join(regressions)}"
+        )
+
+
+if __name__ == "__main__":
+    bench_pipeline()
@@ -0,0 +1,103 @@
+"""
+Compares peak RSS and time of the preprocessing chain on a large synthetic events
+DataFrame, concatenated from per-object DataFrames as fetch_events makes it, when
+it defensively copies (with SelectFieldsRelevant's original concat,
+or without) versus when the pipeline owns the DataFrame and preprocessors modify it
+in place. Each mode runs in a fresh process, so that peak RSS isn't shared, and peak
+RSS is reset after the DataFrame is made (Linux only).
+
+Run from the root of the project, e.g.:
+$ python -m benchmarks.bench_preprocess --num-rows 200000
+"""
+import gc
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
+from typing import Tuple
+
+import click
+import pandas as pd
+
+from ata_pipeline0.fetch_events import _concat
+from ata_pipeline0.helpers.preprocessors import SelectFieldsRelevant
+from ata_pipeline0.helpers.site import SiteName
+from ata_pipeline0.main import get_preprocessors
+from ata_pipeline0.preprocess_events import preprocess_events
+from fakes import USERAGENTS_CRAWLERS, make_event_row
+
+MODES = ["copy-concat", "copy", "no-copy"]
+
+
+@dataclass
+class _SelectFieldsRelevantConcat(SelectFieldsRelevant):
+    """
+    SelectFieldsRelevant as it was before it could skip copies.
+    """
+
+    def transform(self, df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+        df_empty_with_all_fields = pd.DataFrame(columns=[*self.fields_relevant])
+        fields_available = df.columns.intersection([*self.fields_relevant])
+        return pd.concat([df_empty_with_all_fields, df[[*fields_available]]])
+
+
+def _make_df(num_rows: int, num_rows_per_object: int = 5_000) -> pd.DataFrame:
+    # Each row has a few fields that get dropped, as S3 objects do, and 1% of rows are
+    # duplicates and 2% are by bots, so that preprocessors have rows to delete
+    rows = [make_event_row(br_colordepth="24", os_timezone="America/Chicago") for _ in range(num_rows)]
+    for i in range(0, num_rows - 1, 100):
+        rows[i + 1]["event_id"] = rows[i]["event_id"]
+    for i in range(2, num_rows, 50):
+        rows[i]["useragent"] = USERAGENTS_CRAWLERS[i % len(USERAGENTS_CRAWLERS)]
+    # Concatenated object by object, as fetch_events does, rather than made at once
+    return _concat(
+        pd.DataFrame({field: [row[field] for row in rows[i : i + num_rows_per_object]] for field in rows[0]}, dtype=str)
+        for i in range(0, num_rows, num_rows_per_object)
+    )
+
+
+def _get_rss_peak() -> float:
+    # In MiB
+    with open("/proc/self/status") as f:
+        return int(re.search(r"VmHWM:\s+(\d+) kB", f.read()).group(1)) / 2**10  # type: ignore
+
+
+def _reset_rss_peak() -> None:
+    # (see: https://www.kernel.org/doc/html/latest/filesystems/proc.html#proc-pid-clear-refs-clearing-the-soft-dirty-bit)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def _run(mode: str, num_rows: int) -> Tuple[float, float, float]:
+    df = _make_df(num_rows)
+    preprocessors = get_preprocessors(SiteName.AFRO_LA)
+    if mode == "copy-concat":
+        preprocessors[0] = _SelectFieldsRelevantConcat(preprocessors[0].fields_relevant)  # type: ignore
+
+    # Don't count the memory it took to make the DataFrame
+    gc.collect()
+    _reset_rss_peak()
+    rss_before = _get_rss_peak()
+
+    start = time.perf_counter()
+    preprocess_events(df, preprocessors, copy=mode != "no-copy")
+    elapsed = time.perf_counter() - start
+
+    return elapsed, rss_before, _get_rss_peak()
+
+
+@click.command()
+@click.option("--num-rows", type=int, default=200_000, help="Number of events in the DataFrame.")
+def bench_preprocess(num_rows: int) -> None:
+    for mode in MODES:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            elapsed, rss_before, rss_peak = executor.submit(_run, mode, num_rows).result()
+        print(
+            f"{mode:<12} {elapsed:8.2f}s {rss_before:10.1f} MiB before {rss_peak:10.1f} MiB peak "
+            f"{rss_peak - rss_before:10.1f} MiB added"
+        )
+
+
+if __name__ == "__main__":
+    bench_preprocess()
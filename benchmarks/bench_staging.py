@@ -0,0 +1,53 @@
+"""
+Compares the time of getting an hour's events by decompressing and parsing its S3
+objects versus by reading them back from Parquet staging.
+
+Run from the root of the project, e.g.:
+$ python -m benchmarks.bench_staging --num-objects 10 --num-rows 20000
+"""
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+import click
+
+from ata_pipeline0.fetch_events import fetch_events
+from ata_pipeline0.helpers.fields import FieldSnowplow
+from ata_pipeline0.helpers.site import SiteName
+from ata_pipeline0.helpers.staging import Staging
+from fakes import FakeS3Resource, make_event_row, make_object_data
+
+
+@click.command()
+@click.option("--num-objects", type=int, default=10, help="Number of S3 objects in the hour.")
+@click.option("--num-rows", type=int, default=20_000, help="Number of events per object.")
+def bench_staging(num_objects: int, num_rows: int) -> None:
+    site_name = SiteName.AFRO_LA
+    hour = datetime(2022, 11, 23, 0)
+    # Typed as Any because fetch_events expects a boto3 S3ServiceResource
+    s3_resource: Any = FakeS3Resource()
+    bucket = s3_resource.Bucket(f"lnl-snowplow-{site_name}")
+    for i in range(num_objects):
+        data = make_object_data([make_event_row() for _ in range(num_rows)])
+        bucket.put_object(Key=f"enriched/good/{hour.strftime('%Y/%m/%d/%H')}/{i}.gz", Body=data)
+
+    with tempfile.TemporaryDirectory() as directory:
+        staging = Staging(directory)
+        runs: List[Tuple[str, Optional[Staging]]] = [("parse", None), ("parse + stage", staging), ("staged", staging)]
+        for name, staging_run in runs:
+            start = time.perf_counter()
+            df = fetch_events(
+                s3_resource,
+                site_name,
+                num_concurrent_downloads=4,
+                timestamps=[hour],
+                fields={*FieldSnowplow},
+                staging=staging_run,
+            )
+            elapsed = time.perf_counter() - start
+            print(f"{name:<14} {elapsed:8.2f}s {df.shape[0] / elapsed:12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    bench_staging()
@@ -0,0 +1,217 @@
+"""
+Deterministic generator of realistic Snowplow enriched events, for benchmarks: readers
+with their own user agent, screen and sessions browsing a site's pages, a share of
+crawlers among them, form submissions, fields Snowplow omits when they're empty, and
+duplicated events (same ID, later timestamp) as Snowplow's at-least-once delivery
+produces. The same arguments always make the same events and objects.
+"""
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import AbstractSet, Any, Dict, List, Optional
+
+from fakes import (
+    USERAGENTS_BROWSERS,
+    USERAGENTS_CRAWLERS,
+    FakeBucket,
+    FakeObjectSummary,
+    make_object_data,
+)
+
+# Fields of a real enriched event that the pipeline doesn't use, but still has to parse past
+_FIELDS_IRRELEVANT = {
+    "app_id": "site",
+    "platform": "web",
+    "etl_tstamp": "2022-11-23 01:02:05.132",
+    "v_tracker": "js-3.5.0",
+    "v_collector": "ssc-2.8.0-kinesis",
+    "v_etl": "snowplow-enrich-kinesis-3.2.3",
+    "name_tracker": "sp",
+    "user_ipaddress": "203.0.113.0",
+    "geo_country": "US",
+    "geo_region": "TX",
+    "geo_city": "Dallas",
+    "geo_timezone": "America/Chicago",
+    "br_lang": "en-US",
+    "br_cookies": True,
+    "br_colordepth": "24",
+    "os_timezone": "America/Chicago",
+    "doc_charset": "UTF-8",
+    "doc_width": 1200,
+    "event_vendor": "com.snowplowanalytics.snowplow",
+    "event_format": "jsonschema",
+    "event_version": "1-0-0",
+    "event_fingerprint": "0a3d8c9b0e2f4a7d9c4b5e6f7a8b9c0d",
+}
+
+_SCREENS = [(736, 414), (844, 390), (896, 414), (1080, 1920), (1440, 2560), (900, 1440), (768, 1024)]
+_REFERRERS = [
+    ("search", "Google", "www.google.com", "/"),
+    ("search", "Bing", "www.bing.com", "/search"),
+    ("search", "DuckDuckGo", "duckduckgo.com", "/"),
+    ("social", "Facebook", "m.facebook.com", "/"),
+    ("social", "Twitter", "t.co", "/AbCdEf123"),
+    ("email", None, "mail.google.com", "/mail/u/0/"),
+    ("unknown", None, "news.example.org", "/roundup/"),
+]
+
+# Share of events that are page views; the rest, other than form submissions, are page pings
+SHARE_PAGE_VIEWS = 0.15
+
+
+def make_rows(
+    num_rows: int,
+    duplicate_rate: float = 0.01,
+    bot_ratio: float = 0.05,
+    form_submit_share: float = 0.01,
+    fields: Optional[AbstractSet[str]] = None,
+    num_users: Optional[int] = None,
+    num_pages: Optional[int] = None,
+    hour: datetime = datetime(2022, 11, 23, 0),
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Creates an hour's worth of enriched events, as they'd appear in S3 objects.
+
+    `duplicate_rate` is the share of events that are duplicates of an earlier one,
+    `bot_ratio` the share of (non-duplicate) events by crawlers, and `form_submit_share`
+    that of form submissions. Events hold every field of a real enriched event unless
+    `fields` is set, in which case they only hold those. By default, there's a reader
+    per 40 events and a page per 500.
+    >>> rows = make_rows(1000, duplicate_rate=0.1, fields={*FieldSnowplow})
+    """
+    rng = random.Random(seed)
+    num_users = num_users or max(1, num_rows // 40)
+    num_pages = num_pages or max(1, num_rows // 500)
+
+    visitors = [_make_visitor(rng, i, USERAGENTS_BROWSERS) for i in range(num_users)]
+    # Crawlers are fewer, but each fires many more events
+    crawlers = [_make_visitor(rng, i, USERAGENTS_CRAWLERS) for i in range(max(1, num_users // 50))]
+    pages = [
+        (f"/news/{2015 + i % 8}/{1 + i % 12:02}/story-number-{i}-about-something/", rng.randrange(2000, 8000))
+        for i in range(num_pages)
+    ]
+
+    rows: List[Dict[str, Any]] = []
+    for _ in range(num_rows):
+        if rows and rng.random() < duplicate_rate:
+            row = {**rng.choice(rows)}
+            # Redelivered a bit later, with the same event ID
+            if "derived_tstamp" in row:
+                row["derived_tstamp"] = _format_timestamp(
+                    datetime.fromisoformat(row["derived_tstamp"]) + timedelta(seconds=rng.uniform(0, 5))
+                )
+            rows.append(row)
+            continue
+
+        visitor = rng.choice(crawlers if rng.random() < bot_ratio else visitors)
+        path, doc_height = rng.choice(pages)
+        draw = rng.random()
+        event_name = (
+            "submit_form"
+            if draw < form_submit_share
+            else "page_view"
+            if draw < form_submit_share + SHARE_PAGE_VIEWS
+            else "page_ping"
+        )
+
+        row = {
+            **_FIELDS_IRRELEVANT,
+            "event_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "event": "unstruct" if event_name == "submit_form" else event_name,
+            "event_name": event_name,
+            "collector_tstamp": _format_timestamp(hour + timedelta(seconds=rng.uniform(0, 3600))),
+            "dvce_created_tstamp": _format_timestamp(hour + timedelta(seconds=rng.uniform(0, 3600))),
+            "derived_tstamp": _format_timestamp(hour + timedelta(seconds=rng.uniform(0, 3600))),
+            "domain_userid": visitor["domain_userid"],
+            "domain_sessionidx": visitor["domain_sessionidx"],
+            "domain_sessionid": visitor["domain_sessionid"],
+            "useragent": visitor["useragent"],
+            "dvce_screenheight": visitor["dvce_screenheight"],
+            "dvce_screenwidth": visitor["dvce_screenwidth"],
+            "br_viewheight": visitor["br_viewheight"],
+            "br_viewwidth": visitor["br_viewwidth"],
+            "doc_height": doc_height,
+            "page_url": f"https://fakehost.com{path}",
+            "page_urlscheme": "https",
+            "page_urlhost": "fakehost.com",
+            "page_urlport": 443,
+            "page_urlpath": path,
+            "page_title": path.strip("/").split("/")[-1].replace("-", " ").capitalize(),
+        }
+        if rng.random() < 0.1:
+            row["page_urlquery"] = f"utm_source=newsletter&utm_campaign={rng.randrange(20)}"
+        if event_name == "page_ping":
+            row["pp_xoffset_min"] = row["pp_xoffset_max"] = 0
+            row["pp_yoffset_min"] = rng.randrange(0, 2000)
+            row["pp_yoffset_max"] = row["pp_yoffset_min"] + rng.randrange(0, 2000)
+        if event_name == "submit_form":
+            row["unstruct_event_com_snowplowanalytics_snowplow_submit_form_1"] = _make_form_submit(rng)
+        # Snowplow leaves out fields that are empty, such as those of a missing referrer
+        if visitor["referrer"] is not None:
+            refr_medium, refr_source, refr_urlhost, refr_urlpath = visitor["referrer"]
+            row["page_referrer"] = f"https://{refr_urlhost}{refr_urlpath}"
+            row["refr_medium"] = refr_medium
+            row["refr_urlhost"] = refr_urlhost
+            row["refr_urlpath"] = refr_urlpath
+            if refr_source is not None:
+                row["refr_source"] = refr_source
+
+        if fields is not None:
+            row = {field: value for field, value in row.items() if field in fields}
+        rows.append(row)
+
+    return rows
+
+
+def make_objects(num_objects: int, num_rows: int, **kwargs: Any) -> List[bytes]:
+    """
+    Splits an hour of events made by `make_rows` (with `kwargs`) into `num_objects`
+    gzipped S3 objects of `num_rows` events each. Duplicates may land in another
+    object than the event they duplicate, like in a real hour's objects.
+    """
+    rows = make_rows(num_objects * num_rows, **kwargs)
+    return [make_object_data(rows[i * num_rows : (i + 1) * num_rows]) for i in range(num_objects)]
+
+
+def put_objects(bucket: FakeBucket, hour: datetime, datas: List[bytes], latency: float = 0.0) -> List[FakeObjectSummary]:
+    """
+    Puts objects in a fake bucket under the hour's key, like Snowplow's S3 loader would.
+    """
+    return [
+        bucket.put_object(Key=f"enriched/good/{hour.strftime('%Y/%m/%d/%H')}/{i:05}.gz", Body=data, latency=latency)
+        for i, data in enumerate(datas)
+    ]
+
+
+def _make_visitor(rng: random.Random, i: int, useragents: List[str]) -> Dict[str, Any]:
+    screenheight, screenwidth = rng.choice(_SCREENS)
+    return {
+        "domain_userid": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "domain_sessionidx": rng.randrange(1, 30),
+        "domain_sessionid": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        # Tell readers with the same browser apart, as their versions and devices would
+        "useragent": f"{rng.choice(useragents)} v/{i % 97}",
+        "dvce_screenheight": screenheight,
+        "dvce_screenwidth": screenwidth,
+        "br_viewheight": screenheight - rng.randrange(50, 200),
+        "br_viewwidth": screenwidth,
+        "referrer": rng.choice([*_REFERRERS, None, None, None]),
+    }
+
+
+def _make_form_submit(rng: random.Random) -> Dict[str, Any]:
+    email = f"reader{rng.randrange(10**6)}@example.com"
+    return {
+        "formId": f"newsletter-{rng.randrange(7)}",
+        "formClasses": ["signup", "footer"],
+        "elements": [
+            {"name": "email", "value": email, "nodeName": "INPUT", "type": "email"},
+            {"name": "zip", "value": f"{75200 + rng.randrange(100)}", "nodeName": "INPUT", "type": "text"},
+        ],
+    }
+
+
+def _format_timestamp(timestamp: datetime) -> str:
+    # Like Snowplow's, e.g., "2022-11-23 00:18:14.427"
+    return timestamp.isoformat(sep=" ", timespec="milliseconds")
@@ -0,0 +1,195 @@
+"""
+Fake S3 resources and event data, shared by the tests and the benchmarks.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+from botocore.exceptions import ClientError
+
+# Corpus of real-world user agents of browsers and of crawlers, used to compare bot detectors
+USERAGENTS_BROWSERS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.1 Safari/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:106.0) Gecko/20100101 Firefox/106.0",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:106.0) Gecko/20100101 Firefox/106.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36 Edg/107.0.1418.52",
+    "Mozilla/5.0 (X11; CrOS x86_64 14541.0.0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 16_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.1 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 16_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/107.0.5304.101 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (iPad; CPU OS 15_7 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.6.1 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 13; Pixel 7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Linux; Android 12; SM-G991B) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/19.0 Chrome/102.0.5005.125 Mobile Safari/537.36",
+    "Mozilla/5.0 (Linux; Android 11; 5087Z Build/RP1A.200720.011; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/107.0.5304.105 Mobile Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 16_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 [FBAN/FBIOS;FBDV/iPhone14,5;FBMD/iPhone;FBSN/iOS;FBSV/16.1;FBSS/3;FBID/phone;FBLC/en_US;FBOP/5]",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 16_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Instagram 258.1.0.26.100",
+    "Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Windows NT 6.1; Trident/7.0; rv:11.0) like Gecko",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36 OPR/93.0.0.0",
+]
+USERAGENTS_CRAWLERS = [
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "Mozilla/5.0 (Linux; Android 6.0.1; Nexus 5X Build/MMB29P) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/106.0.5249.119 Mobile Safari/537.36 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; compatible; Googlebot/2.1; +http://www.google.com/bot.html) Chrome/107.0.5304.110 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 14_7_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Mobile/15E148 Safari/604.1 (compatible; AdsBot-Google-Mobile; +http://www.google.com/mobile/adsbot.html)",
+    "AdsBot-Google (+http://www.google.com/adsbot.html)",
+    "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+    "Mozilla/5.0 (compatible; YandexBot/3.0; +http://yandex.com/bots)",
+    "Mozilla/5.0 (compatible; Baiduspider/2.0; +http://www.baidu.com/search/spider.html)",
+    "DuckDuckBot/1.1; (+http://duckduckgo.com/duckduckbot.html)",
+    "facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)",
+    "Twitterbot/1.0",
+    "Slackbot-LinkExpanding 1.0 (+https://api.slack.com/robots)",
+    "LinkedInBot/1.0 (compatible; Mozilla/5.0; Apache-HttpClient +http://www.linkedin.com)",
+    "Mozilla/5.0 (compatible; AhrefsBot/7.0; +http://ahrefs.com/robot/)",
+    "Mozilla/5.0 (compatible; SemrushBot/7~bl; +http://www.semrush.com/bot.html)",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.1.1 Safari/605.1.15 (Applebot/0.1; +http://www.apple.com/go/applebot)",
+    "Mozilla/5.0 (compatible; PetalBot;+https://webmaster.petalsearch.com/site/petalbot)",
+    "Mozilla/5.0 (Linux; Android 7.0;) AppleWebKit/537.36 (KHTML, like Gecko) Mobile Safari/537.36 (compatible; AspiegelBot)",
+    "Pingdom.com_bot_version_1.4_(http://www.pingdom.com/)",
+    "Mozilla/5.0 (compatible; Yahoo! Slurp; http://help.yahoo.com/help/us/ysearch/slurp)",
+    "Screaming Frog SEO Spider/17.2",
+    "WhatsApp/2.22.24.81 A",
+    "Python-urllib/3.9",
+    "Mozilla/5.0 (compatible; DotBot/1.2; +https://opensiteexplorer.org/dotbot; help@moz.com)",
+    "Mozilla/5.0 (compatible; MJ12bot/v1.4.8; http://mj12bot.com/)",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) HeadlessChrome/107.0.5304.87 Safari/537.36",
+    "python-requests/2.28.1",
+    "curl/7.85.0",
+    "Mozilla/5.0 (Linux; Android 12; SM-G991B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Mobile Safari/537.36 WhatsApp/2.22",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 16_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Twitterbot/1.0",
+]
+USERAGENTS = USERAGENTS_BROWSERS + USERAGENTS_CRAWLERS
+
+
+def make_event_row(
+    event_id: Optional[str] = None,
+    derived_tstamp: str = "2022-11-23 00:18:14.427",
+    useragent: str = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.6 Safari/605.1.15",
+    **fields: Any,
+) -> Dict[str, Any]:
+    """
+    Creates a dummy Snowplow enriched event holding every field the pipeline
+    requires, as it'd appear in an S3 object. Fields can be overridden or added
+    as keyword arguments.
+    """
+    row = {
+        "event_id": event_id or str(uuid.uuid4()),
+        "derived_tstamp": derived_tstamp,
+        "doc_height": 2654,
+        "domain_sessionidx": 1,
+        "domain_userid": "9c6e4788-b05f-4521-a589-52dc6d250e8f",
+        "dvce_screenheight": 736,
+        "dvce_screenwidth": 414,
+        "event_name": "page_view",
+        "page_url": "https://fakehost.com/a/b/c/d.md",
+        "page_urlhost": "fakehost.com",
+        "page_urlpath": "/a/b/c/d.md",
+        "page_referrer": "https://duckduckgo.com/",
+        "refr_medium": "search",
+        "useragent": useragent,
+    }
+    row.update(fields)
+    return row
+
+
+def make_object_data(rows: Iterable[Dict[str, Any]]) -> bytes:
+    """
+    Serializes event rows the way Snowplow's S3 loader does: newline-delimited
+    JSON, gzipped. The gzip header's timestamp is zeroed, so that the same rows
+    always make the same object (and ETag).
+    """
+    return gzip.compress("\n".join(json.dumps(row) for row in rows).encode("utf-8"), mtime=0)
+
+
+# HTTP status codes S3 responds with along with error codes
+_HTTP_STATUS_CODES = {"AccessDenied": 403, "NoSuchKey": 404, "SlowDown": 503}
+
+
+class FakeObjectSummary:
+    """
+    In-memory stand-in for boto3's ObjectSummary. `latency` (in seconds) is slept
+    on every GET to mimic a network round trip, and the first `num_failures` GETs
+    fail with S3's `error_code` (by default, that of throttling).
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        key: str,
+        data: bytes,
+        latency: float = 0.0,
+        num_failures: int = 0,
+        error_code: str = "SlowDown",
+    ) -> None:
+        self.bucket_name = bucket_name
+        self.key = key
+        self.size = len(data)
+        self.e_tag = f'"{hashlib.md5(data).hexdigest()}"'
+        self._data = data
+        self._latency = latency
+        self._num_failures = num_failures
+        self._error_code = error_code
+
+    def get(self) -> Dict[str, Any]:
+        if self._latency:
+            time.sleep(self._latency)
+        if self._num_failures > 0:
+            self._num_failures -= 1
+            raise ClientError(
+                {
+                    "Error": {"Code": self._error_code, "Message": self._error_code},
+                    "ResponseMetadata": {
+                        "RequestId": "",
+                        "HostId": "",
+                        "HTTPStatusCode": _HTTP_STATUS_CODES[self._error_code],
+                        "HTTPHeaders": {},
+                        "RetryAttempts": 0,
+                    },
+                },
+                "GetObject",
+            )
+        return {"Body": io.BytesIO(self._data), "ContentLength": self.size, "ETag": self.e_tag}
+
+
+class FakeObjectCollection:
+    def __init__(self, object_summaries: Dict[str, FakeObjectSummary]) -> None:
+        self._object_summaries = object_summaries
+
+    def filter(self, Prefix: str = "") -> List[FakeObjectSummary]:
+        # Like S3, list keys in lexicographic order
+        return [self._object_summaries[key] for key in sorted(self._object_summaries) if key.startswith(Prefix)]
+
+
+class FakeBucket:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._object_summaries: Dict[str, FakeObjectSummary] = {}
+        self.objects = FakeObjectCollection(self._object_summaries)
+
+    def put_object(
+        self, Key: str, Body: bytes, latency: float = 0.0, num_failures: int = 0, error_code: str = "SlowDown"
+    ) -> FakeObjectSummary:
+        self._object_summaries[Key] = FakeObjectSummary(
+            self.name, Key, Body, latency=latency, num_failures=num_failures, error_code=error_code
+        )
+        return self._object_summaries[Key]
+
+
+class FakeS3Resource:
+    """
+    In-memory stand-in for boto3's S3ServiceResource, covering only what the
+    pipeline uses.
+    """
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, FakeBucket] = {}
+
+    def Bucket(self, name: str) -> FakeBucket:
+        return self._buckets.setdefault(name, FakeBucket(name))
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+import user_agents as ua
+
+from ata_pipeline0.helpers.bots import is_bot_regex
+from fakes import USERAGENTS
+
+
+# ---------- TESTS ----------
+@pytest.mark.unit
+def test_is_bot_regex_agrees_with_user_agents() -> None:
+    is_bot = is_bot_regex(pd.Series(USERAGENTS))
+    assert is_bot.tolist() == [ua.parse(useragent).is_bot for useragent in USERAGENTS]
+    # Make sure the corpus has both bots and non-bots
+    assert 0 < is_bot.sum() < len(USERAGENTS)
+
+
+@pytest.mark.unit
+def test_is_bot_regex_device_and_crawler_token() -> None:
+    # user-agents picks the Samsung device regex before the crawler ones, but the regex
+    # detector doesn't check device regexes at all
+    useragent = "Mozilla/5.0 (Linux; Android 12; SM-G991B) WhatsApp/2.22"
+    assert not ua.parse(useragent).is_bot
+    assert is_bot_regex(pd.Series([useragent])).tolist() == [True]
+
+
+@pytest.mark.unit
+def test_is_bot_regex_non_string() -> None:
+    assert is_bot_regex(pd.Series([None, 123, float("nan")], dtype=object)).tolist() == [True, True, True]
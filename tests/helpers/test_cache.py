@@ -0,0 +1,109 @@
+import os
+import pickle
+from typing import Any
+
+import pytest
+
+from ata_pipeline0.helpers import cache as cache_module
+from ata_pipeline0.helpers.cache import ObjectCache
+from fakes import FakeS3Resource
+
+
+# ---------- FIXTURES ----------
+@pytest.fixture
+def bucket() -> Any:
+    # Typed as Any because the cache expects boto3 ObjectSummary objects
+    return FakeS3Resource().Bucket("lnl-snowplow-afro-la")
+
+
+# ---------- TESTS ----------
+@pytest.mark.unit
+def test_object_cache(bucket, tmp_path) -> None:
+    object_summary = bucket.put_object(Key="a.gz", Body=b"a" * 10)
+    cache = ObjectCache(str(tmp_path / "cache"), size_max=100)
+    assert cache.get(object_summary) is None
+
+    with cache.put(object_summary, object_summary.get()["Body"]) as content_put:
+        assert content_put.read() == b"a" * 10
+
+    # The cache persists across instances and processes
+    cache = pickle.loads(pickle.dumps(ObjectCache(cache.directory, size_max=100)))
+    content = cache.get(object_summary)
+    assert content is not None
+    with content:
+        assert content.read() == b"a" * 10
+
+    # Once the object is overwritten, its ETag changes and the cached content is stale
+    object_summary = bucket.put_object(Key="a.gz", Body=b"b" * 10)
+    assert cache.get(object_summary) is None
+
+
+@pytest.mark.unit
+def test_object_cache_empty(bucket, tmp_path) -> None:
+    object_summary = bucket.put_object(Key="a.gz", Body=b"")
+    cache = ObjectCache(str(tmp_path), size_max=100)
+
+    with cache.put(object_summary, object_summary.get()["Body"]) as content_put:
+        assert content_put.read() == b""
+    content = cache.get(object_summary)
+    assert content is not None
+    assert content.read() == b""
+
+
+@pytest.mark.unit
+def test_object_cache_evicts_least_recently_used(bucket, tmp_path) -> None:
+    object_summaries = [bucket.put_object(Key=f"{key}.gz", Body=key.encode() * 40) for key in "abc"]
+    cache = ObjectCache(str(tmp_path), size_max=100)
+
+    def put(object_summary: Any, time: int) -> None:
+        cache.put(object_summary, object_summary.get()["Body"]).close()
+        # Pin access times, rather than rely on the filesystem's timestamp resolution
+        os.utime(cache._get_path(object_summary), (time, time))
+
+    put(object_summaries[0], time=1)
+    put(object_summaries[1], time=2)
+    # Reading a makes b the least recently used object, so it's the one evicted to make room for c
+    content = cache.get(object_summaries[0])
+    assert content is not None
+    content.close()
+    put(object_summaries[2], time=3)
+
+    assert [cache.get(object_summary) is not None for object_summary in object_summaries] == [True, False, True]
+    assert sum(entry.stat().st_size for entry in os.scandir(tmp_path)) <= 100
+
+
+@pytest.mark.unit
+def test_object_cache_keeps_object_larger_than_max(bucket, tmp_path) -> None:
+    object_summary = bucket.put_object(Key="a.gz", Body=b"a" * 200)
+    cache = ObjectCache(str(tmp_path), size_max=100)
+
+    with cache.put(object_summary, object_summary.get()["Body"]) as content:
+        assert content.read() == b"a" * 200
+
+
+@pytest.mark.unit
+def test_object_cache_scans_only_to_evict(bucket, tmp_path, monkeypatch) -> None:
+    object_summaries = [bucket.put_object(Key=f"{i}.gz", Body=b"a" * 20) for i in range(6)]
+    cache = ObjectCache(str(tmp_path), size_max=100)
+
+    scandir = os.scandir
+    num_scans = 0
+
+    def scandir_counted(path: Any) -> Any:
+        nonlocal num_scans
+        num_scans += 1
+        return scandir(path)
+
+    monkeypatch.setattr(cache_module.os, "scandir", scandir_counted)
+
+    for i, object_summary in enumerate(object_summaries[:5]):
+        cache.put(object_summary, object_summary.get()["Body"]).close()
+        os.utime(cache._get_path(object_summary), (i, i))
+    # Only the first write scans the directory, to find how large the cache is already
+    assert num_scans == 1
+
+    # Going over the cap scans again, and evicts down to 90% of it
+    cache.put(object_summaries[5], object_summaries[5].get()["Body"]).close()
+    assert num_scans == 2
+    assert [cache.get(object_summary) is not None for object_summary in object_summaries] == [False, False] + [True] * 4
+    assert cache._size == 80
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+from pandas.api.types import is_categorical_dtype
+
+from ata_pipeline0.helpers.categorical import concat, decode
+
+
+# ---------- TESTS ----------
+@pytest.mark.unit
+def test_concat() -> None:
+    df_a = pd.DataFrame({"a": pd.Categorical(["x", "y"]), "b": ["1", "2"]})
+    df_b = pd.DataFrame({"a": pd.Categorical(["z", None, "x"]), "b": ["3", "4", "5"]})
+    df_c = pd.DataFrame({"b": ["6"]})
+
+    df = concat([df_a, df_b, df_c])
+
+    # Categories differ, but the column stays categorical, with rows missing it as missing values
+    assert is_categorical_dtype(df["a"])
+    assert df["a"].cat.categories.tolist() == ["x", "y", "z"]
+    pd.testing.assert_frame_equal(df.astype({"a": object}), pd.concat([df_a, df_b, df_c]).astype({"a": object}))
+    # Inputs are left as they are
+    assert df_b["a"].cat.categories.tolist() == ["x", "z"]
+
+
+@pytest.mark.unit
+def test_concat_empty() -> None:
+    assert concat([]).shape == (0, 0)
+
+
+@pytest.mark.unit
+def test_decode() -> None:
+    values = decode(pd.Series(pd.Categorical(["a", None, "a"]), index=[2, 3, 4]))
+    assert values.dtype == object
+    assert values.tolist() == ["a", None, "a"]
+    assert values.index.tolist() == [2, 3, 4]
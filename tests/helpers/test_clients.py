@@ -0,0 +1,44 @@
+import logging
+
+import pytest
+
+from ata_pipeline0.helpers import clients
+
+
+# ---------- TESTS ----------
+@pytest.mark.integration
+def test_get_clients(monkeypatch, caplog) -> None:
+    monkeypatch.setattr(clients, "_s3_resource", None)
+    monkeypatch.setattr(clients, "_s3_max_pool_connections", 0)
+    clients.get_session_factory.cache_clear()
+
+    with caplog.at_level(logging.INFO):
+        s3_resource, session_factory = clients.get_clients(max_pool_connections=4)
+        assert "(cold)" in caplog.text
+        caplog.clear()
+
+        # Warm invocations reuse the same clients
+        assert clients.get_clients(max_pool_connections=4) == (s3_resource, session_factory)
+        assert "(warm)" in caplog.text
+
+        # A larger connection pool than the S3 resource has means building another one
+        caplog.clear()
+        s3_resource_larger, _ = clients.get_clients(max_pool_connections=16)
+        assert s3_resource_larger is not s3_resource
+        assert "(cold)" in caplog.text
+
+
+@pytest.mark.unit
+def test_get_s3_resource(monkeypatch) -> None:
+    monkeypatch.setattr(clients, "_s3_resource", None)
+    monkeypatch.setattr(clients, "_s3_max_pool_connections", 0)
+
+    # Pools up to boto3's default size share one S3 resource
+    s3_resource = clients.get_s3_resource(1)
+    assert clients.get_s3_resource(8) is s3_resource
+
+    # Only a larger pool means another one, which then serves smaller pools too
+    s3_resource_larger = clients.get_s3_resource(16)
+    assert s3_resource_larger is not s3_resource
+    assert clients.get_s3_resource(4) is s3_resource_larger
+    assert s3_resource_larger.meta.client.meta.config.max_pool_connections == 16
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from ata_pipeline0.helpers.concurrency import AdaptiveLimiter
+
+
+@pytest.mark.unit
+def test_adaptive_limiter() -> None:
+    num_in_flight_max = 0
+
+    async def run() -> AdaptiveLimiter:
+        limiter = AdaptiveLimiter(limit_max=8, limit_initial=2)
+
+        async def task(fail: bool) -> None:
+            nonlocal num_in_flight_max
+            async with limiter:
+                num_in_flight_max = max(num_in_flight_max, limiter._num_in_flight)
+                await asyncio.sleep(0.001)
+                if fail:
+                    raise RuntimeError("Throttled")
+
+        # Every window of as many successes as the limit raises it by 1, up to limit_max
+        await asyncio.gather(*[task(fail=False) for _ in range(2 + 3)])
+        assert limiter.limit == 4
+        await asyncio.gather(*[task(fail=False) for _ in range(4 + 5 + 6 + 7 + 10)])
+        assert limiter.limit == 8
+
+        # Failures halve it
+        await asyncio.gather(task(fail=True), return_exceptions=True)
+        assert limiter.limit == 4
+
+        return limiter
+
+    asyncio.run(run())
+
+    assert num_in_flight_max <= 8
+
+
+@pytest.mark.unit
+def test_adaptive_limiter_is_failure() -> None:
+    async def run() -> None:
+        limiter = AdaptiveLimiter(limit_max=8, is_failure=lambda exc: isinstance(exc, RuntimeError))
+
+        async def task(exc: Exception) -> None:
+            async with limiter:
+                raise exc
+
+        # Only exceptions is_failure deems failures halve the limit
+        await asyncio.gather(task(KeyError("a")), return_exceptions=True)
+        assert limiter.limit == 8
+        await asyncio.gather(task(RuntimeError("Throttled")), return_exceptions=True)
+        assert limiter.limit == 4
+
+    asyncio.run(run())
@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+from ata_pipeline0.helpers import duplicates
+from ata_pipeline0.helpers.duplicates import EventsWritten
+from ata_pipeline0.helpers.fields import FieldSnowplow
+
+
+# ---------- HELPERS ----------
+def make_df(event_ids, derived_tstamps) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            FieldSnowplow.EVENT_ID: event_ids,
+            FieldSnowplow.DERIVED_TSTAMP: pd.to_datetime(derived_tstamps, utc=True),
+        }
+    )
+
+
+# ---------- TESTS ----------
+@pytest.mark.unit
+def test_events_written_split() -> None:
+    events_written = EventsWritten(window=timedelta(hours=1))
+    df = make_df(["A", "B", "C"], ["2022-11-23 00:05", "2022-11-23 00:05", "2022-11-23 00:05"])
+    df_new, df_earlier = events_written.split(df)
+    assert df_new[FieldSnowplow.EVENT_ID].tolist() == ["A", "B", "C"]
+    assert df_earlier.shape[0] == 0
+
+    # C wasn't inserted (e.g., an earlier run had loaded it), so it's not recorded
+    events_written.add(df, {"A", "B"})
+    assert len(events_written) == 2
+
+    df = make_df(["A", "B", "C", "D"], ["2022-11-23 00:01", "2022-11-23 00:09", "2022-11-23 00:01", "2022-11-23 00:01"])
+    df_new, df_earlier = events_written.split(df)
+    # A duplicates an event inserted later, so it replaces it, and B one inserted earlier, so it's dropped
+    assert df_new[FieldSnowplow.EVENT_ID].tolist() == ["C", "D"]
+    assert df_earlier[FieldSnowplow.EVENT_ID].tolist() == ["A"]
+
+
+@pytest.mark.unit
+def test_events_written_forgets_old_events(monkeypatch) -> None:
+    monkeypatch.setattr(duplicates, "_NUM_EVENTS_PRUNED_MIN", 2)
+    events_written = EventsWritten(window=timedelta(hours=1))
+
+    events_written.add(make_df(["A", "B"], ["2022-11-23 00:00", "2022-11-23 00:30"]), {"A", "B"})
+    events_written.add(make_df(["C"], ["2022-11-23 01:00"]), {"C"})
+    assert len(events_written) == 3
+
+    # Once there are twice as many events as last time, those over an hour older than the latest are forgotten
+    events_written.add(make_df(["D", "E"], ["2022-11-23 01:45", "2022-11-23 01:45"]), {"D", "E"})
+    assert len(events_written) == 3
+    df_new, _ = events_written.split(make_df(["A", "B", "C"], ["2022-11-23 00:00"] * 3))
+    assert df_new[FieldSnowplow.EVENT_ID].tolist() == ["A", "B"]
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from ata_pipeline0.helpers.json import _BACKENDS, get_loads, loads_lines
+
+
+# ---------- FIXTURES ----------
+@pytest.fixture(scope="module")
+def lines() -> list:
+    return [
+        json.dumps({"event_id": str(i), "page_url": f"https://example.com/{i}", "doc_height": i * 1.5}).encode()
+        for i in range(5)
+    ]
+
+
+# ---------- TESTS ----------
+@pytest.mark.unit
+@pytest.mark.parametrize("backend", sorted(_BACKENDS))
+def test_loads_lines(backend: str, lines: list) -> None:
+    assert loads_lines(lines, loads=get_loads(backend)) == [json.loads(line) for line in lines]
+
+
+@pytest.mark.unit
+def test_loads_lines_invalid(lines: list) -> None:
+    # Falls back to decoding line by line, so the error comes from the bad line
+    with pytest.raises(ValueError):
+        loads_lines([*lines, b"{not json}"])
+
+    # Lines that would decode inside an array but aren't valid on their own
+    with pytest.raises(ValueError):
+        loads_lines([b"1, 2"], loads=get_loads("json"))
+
+
+@pytest.mark.unit
+def test_get_loads_not_installed() -> None:
+    with pytest.raises(ValueError):
+        get_loads("ujson")
@@ -0,0 +1,40 @@
+import pickle
+from typing import Any
+
+import pytest
+
+from ata_pipeline0.helpers.manifest import Manifest, _get_hour
+from ata_pipeline0.helpers.site import SiteName
+from fakes import FakeS3Resource, make_event_row, make_object_data
+
+
+# ---------- TESTS ----------
+@pytest.mark.unit
+def test_manifest(tmp_path) -> None:
+    # Typed as Any because the manifest expects boto3 ObjectSummary objects
+    bucket: Any = FakeS3Resource().Bucket("lnl-snowplow-afro-la")
+    object_summary_a = bucket.put_object(
+        Key="enriched/good/2022/11/23/00/a.gz", Body=make_object_data([make_event_row()])
+    )
+    object_summary_b = bucket.put_object(
+        Key="enriched/good/2022/11/23/01/b.gz", Body=make_object_data([make_event_row()])
+    )
+
+    manifest = Manifest(str(tmp_path / "manifest.sqlite3"))
+    manifest.add_objects_done(SiteName.AFRO_LA, [object_summary_a, object_summary_b])
+    # Recording an object twice is fine
+    manifest.add_objects_done(SiteName.AFRO_LA, [object_summary_a])
+
+    # The manifest persists across instances and processes
+    manifest = pickle.loads(pickle.dumps(Manifest(manifest.path)))
+    assert manifest.get_objects_done(SiteName.AFRO_LA) == {
+        (object_summary_a.key, object_summary_a.e_tag),
+        (object_summary_b.key, object_summary_b.e_tag),
+    }
+    assert manifest.get_objects_done(SiteName.THE_19TH) == set()
+
+
+@pytest.mark.unit
+def test_get_hour() -> None:
+    assert _get_hour("enriched/good/2022/11/23/05/a.gz") == "2022-11-23 05:00"
+    assert _get_hour("a.gz") is None
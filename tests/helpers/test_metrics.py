@@ -0,0 +1,151 @@
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Iterator, List
+
+import pandas as pd
+import pytest
+
+from ata_pipeline0.fetch_events import fetch_events_in_chunks
+from ata_pipeline0.helpers import metrics
+from ata_pipeline0.helpers.site import SiteName
+from ata_pipeline0.main import get_preprocessors
+from ata_pipeline0.preprocess_events import preprocess_events
+from fakes import FakeS3Resource, make_event_row, make_object_data
+
+
+# ---------- FIXTURES ----------
+@pytest.fixture
+def stages() -> Iterator[List[metrics.StageMetrics]]:
+    """
+    Metrics of stages run while the fixture is in use, in order.
+    """
+    stages: List[metrics.StageMetrics] = []
+    metrics.add_hook(stages.append)
+    yield stages
+    metrics.remove_hook(stages.append)
+
+
+@pytest.fixture
+def df() -> pd.DataFrame:
+    rows = [
+        make_event_row(),
+        make_event_row(),
+        make_event_row(useragent="Googlebot/2.1 (+http://www.google.com/bot.html)"),
+    ]
+    # Last event is a duplicate of the first
+    rows.append({**rows[0]})
+    return pd.DataFrame(rows, dtype=str)
+
+
+# ---------- TESTS ----------
+@pytest.mark.unit
+def test_start_disabled() -> None:
+    # Without hooks, nothing is measured
+    stage = metrics.start("stage")
+    assert stage is metrics.start("other stage")
+    stage.finish(num_rows_out=1)
+
+
+@pytest.mark.unit
+def test_preprocess_events(df, stages) -> None:
+    preprocessors = get_preprocessors(SiteName.AFRO_LA)
+    df_out = preprocess_events(df, preprocessors)
+
+    # One stage per preprocessor, then one for the whole of preprocessing
+    assert [stage.stage for stage in stages] == [
+        *[type(preprocessor).__name__ for preprocessor in preprocessors],
+        "preprocess_events",
+    ]
+    # Each preprocessor's output is the next one's input
+    assert [stage.num_rows_in for stage in stages[:-1]] == [4, 4, 4, 4, 3, 2, 2]
+    assert [stage.num_rows_out for stage in stages[:-1]] == [4, 4, 4, 3, 2, 2, 2]
+    assert (stages[-1].num_rows_in, stages[-1].num_rows_out) == (df.shape[0], df_out.shape[0])
+
+    for stage in stages:
+        assert stage.seconds_wall >= 0
+        assert stage.seconds_cpu >= 0
+        assert stage.num_bytes is not None and stage.num_bytes > 0
+        assert stage.memory_peak_bytes > 0
+        assert stage.memory_peak_increase_bytes >= 0
+
+
+@pytest.mark.unit
+def test_fetch_events_in_chunks(stages) -> None:
+    # Typed as Any because fetch_events_in_chunks expects a boto3 S3ServiceResource
+    s3_resource: Any = FakeS3Resource()
+    bucket = s3_resource.Bucket("lnl-snowplow-afro-la")
+    object_summaries = [
+        bucket.put_object(Key=f"enriched/good/2022/11/23/00/{i}.gz", Body=make_object_data([make_event_row()] * 2))
+        for i in range(3)
+    ]
+
+    chunks = list(
+        fetch_events_in_chunks(
+            s3_resource, SiteName.AFRO_LA, num_concurrent_downloads=2, object_key="enriched", max_rows_per_chunk=4
+        )
+    )
+
+    # One stage per chunk, whose bytes are those of the objects it's made of
+    assert len(stages) == len(chunks) == 2
+    assert [stage.stage for stage in stages] == ["fetch_events"] * 2
+    assert [stage.num_rows_out for stage in stages] == [4, 2]
+    assert [stage.num_bytes for stage in stages] == [
+        object_summaries[0].size + object_summaries[1].size,
+        object_summaries[2].size,
+    ]
+
+
+@pytest.mark.unit
+def test_format_emf() -> None:
+    stage_metrics = metrics.StageMetrics(
+        stage="fetch_events",
+        seconds_wall=1.5,
+        seconds_cpu=1.0,
+        num_rows_in=None,
+        num_rows_out=10,
+        num_bytes=100,
+        memory_peak_bytes=2**30,
+        memory_peak_increase_bytes=0,
+    )
+    emf = metrics.format_emf(stage_metrics)
+
+    directive = emf["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Dimensions"] == [["stage"]]
+    assert emf["stage"] == "fetch_events"
+    # Metrics that weren't measured are left out
+    assert "num_rows_in" not in emf
+    assert {metric["Name"] for metric in directive["Metrics"]} == {
+        "seconds_wall",
+        "seconds_cpu",
+        "num_rows_out",
+        "num_bytes",
+        "memory_peak_bytes",
+        "memory_peak_increase_bytes",
+    }
+    assert all(isinstance(emf[metric["Name"]], (int, float)) for metric in directive["Metrics"])
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("format", ["json", "emf"])
+def test_metrics_format_env(format) -> None:
+    # In a fresh interpreter, since the environment variable is read on import
+    code = (
+        "import pandas as pd; from ata_pipeline0.helpers.preprocessors import SelectFieldsRelevant; "
+        + "SelectFieldsRelevant(fields_relevant=set())(pd.DataFrame({'a': [1, 2]}))"
+    )
+    stdout = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "METRICS_FORMAT": format},
+    ).stdout
+
+    # Metrics are logged to stdout as bare JSON lines, and nothing else is
+    (line,) = stdout.splitlines()
+    record = json.loads(line)
+    assert record["stage"] == "SelectFieldsRelevant"
+    assert record["num_rows_out"] == 2
+    assert ("_aws" in record) == (format == "emf")
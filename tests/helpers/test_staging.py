@@ -0,0 +1,71 @@
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ata_pipeline0.helpers.fields import FieldSnowplow
+from ata_pipeline0.helpers.site import SiteName
+from ata_pipeline0.helpers.staging import Staging
+from fakes import FakeS3Resource
+
+pytest.importorskip("pyarrow")
+
+
+# ---------- FIXTURES ----------
+@pytest.fixture
+def object_summaries() -> list:
+    # Typed as a plain list because staging expects boto3 ObjectSummary objects
+    bucket: Any = FakeS3Resource().Bucket("lnl-snowplow-afro-la")
+    return [bucket.put_object(Key=f"enriched/good/2022/11/23/00/{key}.gz", Body=key.encode()) for key in "ab"]
+
+
+@pytest.fixture
+def df() -> pd.DataFrame:
+    """
+    Events as parsed from S3 objects: all str, with NaN for missing values.
+    """
+    return pd.DataFrame(
+        {
+            FieldSnowplow.EVENT_ID: ["a", "b", "c"],
+            FieldSnowplow.DOC_HEIGHT: ["1500", np.nan, "1.5"],
+            FieldSnowplow.REFR_MEDIUM: [np.nan, np.nan, np.nan],
+        },
+        dtype=str,
+    )
+
+
+# ---------- TESTS ----------
+@pytest.mark.unit
+def test_staging(object_summaries, df, tmp_path) -> None:
+    staging = Staging(str(tmp_path))
+    hour = datetime(2022, 11, 23, 0)
+    assert staging.get(SiteName.AFRO_LA, hour, object_summaries) is None
+
+    staging.put(SiteName.AFRO_LA, hour, object_summaries, df)
+
+    # Objects may be listed in any order
+    df_staged = staging.get(SiteName.AFRO_LA, hour, object_summaries[::-1])
+    assert df_staged is not None
+    pd.testing.assert_frame_equal(df_staged, df)
+    # Nothing's staged for other sites or hours
+    assert staging.get(SiteName.THE_19TH, hour, object_summaries) is None
+    assert staging.get(SiteName.AFRO_LA, datetime(2022, 11, 23, 1), object_summaries) is None
+    # Staged events are stale once the hour has other objects
+    assert staging.get(SiteName.AFRO_LA, hour, object_summaries[:1]) is None
+
+
+@pytest.mark.unit
+def test_staging_projected(object_summaries, df, tmp_path) -> None:
+    staging = Staging(str(tmp_path))
+    hour = datetime(2022, 11, 23, 0)
+    staging.put(SiteName.AFRO_LA, hour, object_summaries, df, fields={FieldSnowplow.EVENT_ID, FieldSnowplow.DOC_HEIGHT})
+
+    # Events are read back projected to a subset of the fields they were staged with...
+    df_projected = staging.get(SiteName.AFRO_LA, hour, object_summaries, fields={FieldSnowplow.EVENT_ID})
+    assert df_projected is not None
+    pd.testing.assert_frame_equal(df_projected, df[[FieldSnowplow.EVENT_ID]])
+    # ...but not with fields they weren't staged with
+    assert staging.get(SiteName.AFRO_LA, hour, object_summaries, fields={FieldSnowplow.USERAGENT}) is None
+    assert staging.get(SiteName.AFRO_LA, hour, object_summaries) is None
@@ -0,0 +1,75 @@
+from datetime import datetime
+from typing import Any, List
+
+import pytest
+from click.testing import CliRunner
+
+from ata_pipeline0.backfill import backfill, get_batches, run_batches
+from ata_pipeline0.helpers.datetime import get_timestamps
+from ata_pipeline0.helpers.site import SiteName
+from ata_pipeline0.main import PipelineResult
+
+
+# ---------- HELPERS ----------
+def run_fake(site_name: SiteName, timestamps: List[datetime], write_semaphore: Any) -> PipelineResult:
+    """
+    Stands in for run_pipeline. Defined at the module level so that worker processes
+    can unpickle it.
+    """
+    if site_name == SiteName.THE_19TH:
+        raise RuntimeError("Fake failure")
+
+    # Writing can only happen while holding the semaphore, if there's one
+    if write_semaphore is not None:
+        with write_semaphore:
+            pass
+    return PipelineResult(num_rows_fetched=len(timestamps), num_rows_inserted=1)
+
+
+# ---------- FIXTURES ----------
+@pytest.fixture(scope="module")
+def timestamps() -> List[datetime]:
+    return get_timestamps(start_date=datetime(2022, 11, 23), days=1)
+
+
+# ---------- TESTS ----------
+@pytest.mark.unit
+def test_get_batches(timestamps) -> None:
+    batches = get_batches([SiteName.AFRO_LA, SiteName.OPEN_VALLEJO], timestamps, batch_size=10)
+    assert [(site, len(batch)) for site, batch in batches] == [
+        (SiteName.AFRO_LA, 10),
+        (SiteName.AFRO_LA, 10),
+        (SiteName.AFRO_LA, 4),
+        (SiteName.OPEN_VALLEJO, 10),
+        (SiteName.OPEN_VALLEJO, 10),
+        (SiteName.OPEN_VALLEJO, 4),
+    ]
+
+    # Without a batch size, each site gets a single batch
+    assert get_batches([SiteName.AFRO_LA], timestamps) == [(SiteName.AFRO_LA, timestamps)]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_batches(timestamps, workers) -> None:
+    batches = get_batches([SiteName.AFRO_LA, SiteName.THE_19TH], timestamps, batch_size=12)
+    summaries = run_batches(batches, run_fake, workers=workers, max_concurrent_writes=1)
+
+    # Summaries are in the same order as batches
+    assert [(summary.site_name, summary.timestamps) for summary in summaries] == batches
+
+    # Failed batches don't stop the others
+    for summary in summaries:
+        if summary.site_name == SiteName.THE_19TH:
+            assert summary.result is None
+            assert "Fake failure" in str(summary.error)
+        else:
+            assert summary.result == PipelineResult(num_rows_fetched=12, num_rows_inserted=1)
+            assert summary.error is None
+
+
+@pytest.mark.unit
+def test_backfill_resume_requires_manifest() -> None:
+    result = CliRunner().invoke(backfill, ["--resume", SiteName.AFRO_LA.value])
+    assert result.exit_code == 2
+    assert "--resume requires --manifest" in result.output
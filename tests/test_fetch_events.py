@@ -0,0 +1,404 @@
+import functools
+import gzip
+import io
+import json
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+import pytest
+from botocore.exceptions import ClientError
+from pandas.api.types import is_categorical_dtype
+
+from ata_pipeline0.fetch_events import (
+    AsyncFetcher,
+    _decompress_parse_columnar,
+    _decompress_parse_object,
+    _from_columnar,
+    fetch_events,
+    fetch_events_in_chunks,
+)
+from ata_pipeline0.helpers import arrow
+from ata_pipeline0.helpers.cache import ObjectCache
+from ata_pipeline0.helpers.fields import FieldSnowplow
+from ata_pipeline0.helpers.site import SiteName
+from ata_pipeline0.helpers.staging import Staging
+from fakes import FakeS3Resource, make_event_row, make_object_data
+
+
+# ---------- FIXTURES ----------
+@pytest.fixture(scope="module")
+def site_name() -> SiteName:
+    return SiteName.AFRO_LA
+
+
+@pytest.fixture(scope="module")
+def timestamps() -> List[datetime]:
+    return [datetime(2022, 11, 23, 0), datetime(2022, 11, 23, 1)]
+
+
+@pytest.fixture(scope="module")
+def rows_by_key() -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Dummy Snowplow events, grouped by the S3 object key they're stored under.
+    """
+
+    def make_rows(prefix: str, num_rows: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                FieldSnowplow.EVENT_ID: f"{prefix}-{i}",
+                FieldSnowplow.DOC_HEIGHT: 1500,
+                FieldSnowplow.EVENT_NAME: "page_ping",
+            }
+            for i in range(num_rows)
+        ]
+
+    return {
+        "enriched/good/2022/11/23/00/a.gz": make_rows("A", 2),
+        "enriched/good/2022/11/23/00/b.gz": make_rows("B", 3),
+        "enriched/good/2022/11/23/01/c.gz": make_rows("C", 1),
+        # Outside of the requested timestamps, so it shouldn't be fetched
+        "enriched/good/2022/11/23/02/d.gz": make_rows("D", 4),
+    }
+
+
+@pytest.fixture(scope="module")
+def s3_resource(site_name, rows_by_key) -> FakeS3Resource:
+    s3_resource = FakeS3Resource()
+    bucket = s3_resource.Bucket(f"lnl-snowplow-{site_name}")
+    for key, rows in rows_by_key.items():
+        bucket.put_object(Key=key, Body=make_object_data(rows))
+    return s3_resource
+
+
+@pytest.fixture(scope="module")
+def rows_varied() -> List[Dict[str, Any]]:
+    """
+    Dummy Snowplow events with all sorts of JSON values and missing fields. Numeric
+    fields are missing from none of them, see test_decompress_parse_object_int_missing.
+    """
+    return [
+        make_event_row(
+            event_name="submit_form",
+            unstruct_event_com_snowplowanalytics_snowplow_submit_form_1={
+                "formId": "FORM",
+                "elements": [{"name": "s", "value": "south dallas", "nodeName": "INPUT"}],
+            },
+        ),
+        make_event_row(refr_medium=None, br_viewheight=1.5, is_bot=False),
+        # Missing a string field
+        {field: value for field, value in make_event_row(page_urlquery="").items() if field != "refr_medium"},
+    ]
+
+
+# ---------- TESTS ----------
+@pytest.mark.unit
+def test_fetch_events(s3_resource, site_name, timestamps) -> None:
+    df = fetch_events(s3_resource, site_name, num_concurrent_downloads=2, timestamps=timestamps)
+
+    assert df.shape[0] == 6
+    assert set(df[FieldSnowplow.EVENT_ID].str[0]) == {"A", "B", "C"}
+    # Rows of different objects don't share index labels
+    assert df.index.is_unique
+    # Everything is parsed as str, typecasting happens during preprocessing
+    assert (df[FieldSnowplow.DOC_HEIGHT] == "1500").all()
+
+
+@pytest.mark.unit
+def test_fetch_events_object_key(s3_resource, site_name) -> None:
+    df = fetch_events(s3_resource, site_name, num_concurrent_downloads=2, object_key="enriched/good/2022/11/23/02/d.gz")
+
+    assert df.shape[0] == 4
+
+
+@pytest.mark.unit
+def test_fetch_events_in_chunks(s3_resource, site_name, timestamps) -> None:
+    chunks = list(
+        fetch_events_in_chunks(
+            s3_resource, site_name, num_concurrent_downloads=2, timestamps=timestamps, max_rows_per_chunk=2
+        )
+    )
+
+    # Each chunk is yielded as soon as it holds at least 2 rows, and is made of whole objects
+    assert [[o.key[-4:] for o in object_summaries] for object_summaries, _ in chunks] == [
+        ["a.gz"],
+        ["b.gz"],
+        ["c.gz"],
+    ]
+    assert [df.shape[0] for _, df in chunks] == [2, 3, 1]
+
+    # Chunks together hold the same events as a single fetch
+    df_chunked = pd.concat([df for _, df in chunks], ignore_index=True)
+    df = fetch_events(s3_resource, site_name, num_concurrent_downloads=2, timestamps=timestamps)
+    pd.testing.assert_frame_equal(df_chunked, df)
+
+
+@pytest.mark.unit
+def test_fetch_events_in_chunks_without_limit(s3_resource, site_name, timestamps) -> None:
+    chunks = list(fetch_events_in_chunks(s3_resource, site_name, num_concurrent_downloads=2, timestamps=timestamps))
+
+    assert len(chunks) == 1
+    object_summaries, df = chunks[0]
+    assert len(object_summaries) == 3
+    assert df.shape[0] == 6
+
+
+@pytest.mark.unit
+def test_fetch_events_async(s3_resource, site_name, timestamps) -> None:
+    df = fetch_events(s3_resource, site_name, num_concurrent_downloads=2, timestamps=timestamps)
+    df_async = fetch_events(s3_resource, site_name, num_concurrent_downloads=64, timestamps=timestamps, use_async=True)
+
+    pd.testing.assert_frame_equal(df_async, df)
+
+
+@pytest.mark.unit
+def test_async_fetcher_retries(rows_by_key) -> None:
+    s3_resource = FakeS3Resource()
+    bucket = s3_resource.Bucket("bucket")
+    object_summaries: list = [
+        bucket.put_object(Key=key, Body=make_object_data(rows), num_failures=2) for key, rows in rows_by_key.items()
+    ]
+
+    with AsyncFetcher(max_concurrency=8, backoff_base=0.001) as fetcher:
+        dfs = fetcher.map(object_summaries)
+
+    # Every object eventually got through, in order
+    assert [df.shape[0] for df in dfs] == [len(rows) for rows in rows_by_key.values()]
+
+
+@pytest.mark.unit
+def test_async_fetcher_gives_up(rows_by_key) -> None:
+    s3_resource = FakeS3Resource()
+    bucket = s3_resource.Bucket("bucket")
+    object_summary: Any = bucket.put_object(Key="a.gz", Body=make_object_data([{"a": 1}]), num_failures=3)
+
+    with AsyncFetcher(max_concurrency=8, max_attempts=3, backoff_base=0.001) as fetcher:
+        with pytest.raises(ClientError, match="SlowDown"):
+            fetcher.map([object_summary])
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("error_code", ["NoSuchKey", "AccessDenied"])
+def test_async_fetcher_raises_permanent_errors(error_code) -> None:
+    bucket = FakeS3Resource().Bucket("bucket")
+    object_summary: Any = bucket.put_object(
+        Key="a.gz", Body=make_object_data([{"a": 1}]), num_failures=1, error_code=error_code
+    )
+
+    with AsyncFetcher(max_concurrency=8, backoff_base=0.001) as fetcher:
+        limit = fetcher._limit
+        # Raised on the first attempt, which would've otherwise succeeded on the second
+        with pytest.raises(ClientError, match=error_code):
+            fetcher.map([object_summary])
+        # Without throttling everything else down
+        assert fetcher._limit == limit
+
+
+@pytest.mark.unit
+def test_decompress_parse_object(rows_varied) -> None:
+    df = _decompress_parse_object(io.BytesIO(make_object_data(rows_varied)))
+
+    # Same as decompressing and parsing the object all at once, except that nested values are
+    # kept as JSON rather than turned into their Python repr
+    data = gzip.decompress(make_object_data(rows_varied)).decode("utf-8").strip().split("\n")
+    rows = [
+        {
+            field: json.dumps(value) if isinstance(value, (dict, list)) else value
+            for field, value in json.loads(row).items()
+        }
+        for row in data
+    ]
+    df_expected = pd.DataFrame(rows, dtype=str)
+    pd.testing.assert_frame_equal(df, df_expected)
+
+
+@pytest.mark.unit
+def test_decompress_parse_object_int_missing() -> None:
+    rows: List[Dict[str, Any]] = [{FieldSnowplow.DOMAIN_SESSIONIDX: 1}, {FieldSnowplow.EVENT_ID: "A0"}, {}]
+    data = b"\n" + gzip.decompress(make_object_data(rows)) + b"\n\n"
+    df = _decompress_parse_object(io.BytesIO(gzip.compress(data)))
+
+    # Blank lines are skipped
+    assert df.shape[0] == 3
+    # Ints stay ints even if the field is missing from some events, so that they can later be typecast
+    assert df[FieldSnowplow.DOMAIN_SESSIONIDX].iloc[0] == "1"
+    assert df[FieldSnowplow.DOMAIN_SESSIONIDX].iloc[1:].isna().all()
+
+
+@pytest.mark.unit
+def test_decompress_parse_object_projected(rows_varied) -> None:
+    fields = {FieldSnowplow.EVENT_ID, FieldSnowplow.REFR_MEDIUM, FieldSnowplow.PAGE_URLFRAGMENT}
+    df = _decompress_parse_object(io.BytesIO(make_object_data(rows_varied)), fields=fields)
+
+    # Fields that no event has aren't added
+    assert set(df.columns) == {FieldSnowplow.EVENT_ID, FieldSnowplow.REFR_MEDIUM}
+    assert all(type(column) is str for column in df.columns)
+
+    # Same values as when all fields are parsed
+    df_all = _decompress_parse_object(io.BytesIO(make_object_data(rows_varied)))
+    pd.testing.assert_frame_equal(df, df_all[df.columns])
+
+
+@pytest.mark.unit
+def test_decompress_parse_object_categorical(rows_varied) -> None:
+    fields_categorical = {FieldSnowplow.EVENT_NAME, FieldSnowplow.REFR_MEDIUM, FieldSnowplow.USERAGENT}
+    df = _decompress_parse_object(io.BytesIO(make_object_data(rows_varied)), fields_categorical=fields_categorical)
+
+    # Same values as when nothing is dictionary-encoded, with JSON nulls as missing values
+    df_expected = _decompress_parse_object(io.BytesIO(make_object_data(rows_varied)))
+    assert set(df.columns) == set(df_expected.columns)
+    for field in df.columns:
+        if field in fields_categorical:
+            assert is_categorical_dtype(df[field])
+            assert df[field].isna().tolist() == df_expected[field].isna().tolist()
+            assert df[field].dropna().tolist() == df_expected[field].dropna().tolist()
+        else:
+            pd.testing.assert_series_equal(df[field], df_expected[field])
+
+    # Each distinct value is kept once
+    assert df[FieldSnowplow.USERAGENT].cat.categories.tolist() == [rows_varied[0][FieldSnowplow.USERAGENT]]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("use_async", [False, True])
+def test_fetch_events_categorical(s3_resource, site_name, timestamps, use_async) -> None:
+    fields_categorical = {FieldSnowplow.EVENT_ID, FieldSnowplow.EVENT_NAME}
+    df = fetch_events(
+        s3_resource,
+        site_name,
+        num_concurrent_downloads=2,
+        timestamps=timestamps,
+        use_async=use_async,
+        fields_categorical=fields_categorical,
+    )
+
+    # Objects have different event IDs, and thus different categories, which are merged
+    # rather than decoded when objects are concatenated
+    assert all(is_categorical_dtype(df[field]) for field in fields_categorical)
+    df_expected = fetch_events(s3_resource, site_name, num_concurrent_downloads=2, timestamps=timestamps)
+    pd.testing.assert_frame_equal(df.astype({field: object for field in fields_categorical}), df_expected[df.columns])
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("use_async", [False, True])
+def test_fetch_events_projected(s3_resource, site_name, timestamps, use_async) -> None:
+    df = fetch_events(
+        s3_resource,
+        site_name,
+        num_concurrent_downloads=2,
+        timestamps=timestamps,
+        use_async=use_async,
+        fields={FieldSnowplow.EVENT_ID},
+    )
+
+    assert df.shape == (6, 1)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("use_async", [False, True])
+def test_fetch_events_cached(s3_resource, site_name, timestamps, rows_by_key, use_async, tmp_path) -> None:
+    cache = ObjectCache(str(tmp_path), size_max=2**20)
+    fetch = functools.partial(
+        fetch_events, site_name=site_name, num_concurrent_downloads=2, timestamps=timestamps, use_async=use_async
+    )
+    df = fetch(s3_resource)
+    df_cold = fetch(s3_resource, cache=cache)
+
+    # Same objects, but every GET fails, so they can only be read from the cache
+    s3_resource_down = FakeS3Resource()
+    bucket = s3_resource_down.Bucket(f"lnl-snowplow-{site_name}")
+    for key, rows in rows_by_key.items():
+        bucket.put_object(Key=key, Body=make_object_data(rows), num_failures=100)
+    df_warm = fetch(s3_resource_down, cache=cache)
+
+    pd.testing.assert_frame_equal(df_cold, df)
+    pd.testing.assert_frame_equal(df_warm, df)
+
+
+@pytest.mark.unit
+def test_fetch_events_staged(s3_resource, site_name, timestamps, rows_by_key, tmp_path) -> None:
+    pytest.importorskip("pyarrow")
+    staging = Staging(str(tmp_path))
+    fetch = functools.partial(
+        fetch_events,
+        site_name=site_name,
+        num_concurrent_downloads=2,
+        timestamps=timestamps,
+        fields={*FieldSnowplow},
+        staging=staging,
+    )
+    df = fetch_events(s3_resource, site_name, num_concurrent_downloads=2, timestamps=timestamps, fields={*FieldSnowplow})
+    df_cold = fetch(s3_resource)
+
+    # Same objects, but every GET fails, so events can only be read from staging
+    s3_resource_down = FakeS3Resource()
+    bucket = s3_resource_down.Bucket(f"lnl-snowplow-{site_name}")
+    for key, rows in rows_by_key.items():
+        bucket.put_object(Key=key, Body=make_object_data(rows), num_failures=100)
+    df_warm = fetch(s3_resource_down)
+
+    # Row labels restart at each object when parsing, but at each hour when reading from staging
+    pd.testing.assert_frame_equal(df_cold, df)
+    pd.testing.assert_frame_equal(df_warm.reset_index(drop=True), df.reset_index(drop=True))
+
+    # Once an hour has a new object, it's parsed again
+    bucket.put_object(Key="enriched/good/2022/11/23/01/e.gz", Body=make_object_data([{FieldSnowplow.EVENT_ID: "E"}]))
+    with pytest.raises(ClientError):
+        fetch(s3_resource_down)
+
+
+@pytest.mark.unit
+def test_fetch_events_in_chunks_staged(s3_resource, site_name, timestamps, tmp_path) -> None:
+    pytest.importorskip("pyarrow")
+    chunks = list(
+        fetch_events_in_chunks(
+            s3_resource,
+            site_name,
+            num_concurrent_downloads=2,
+            timestamps=timestamps,
+            max_rows_per_chunk=2,
+            staging=Staging(str(tmp_path)),
+        )
+    )
+
+    # Chunks are made of whole hours
+    assert [[o.key[-4:] for o in object_summaries] for object_summaries, _ in chunks] == [["a.gz", "b.gz"], ["c.gz"]]
+    assert [df.shape[0] for _, df in chunks] == [5, 1]
+
+    with pytest.raises(ValueError):
+        next(fetch_events_in_chunks(s3_resource, site_name, 2, object_key="a.gz", staging=Staging(str(tmp_path))))
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("use_async", [False, True])
+def test_fetch_events_parse_processes(s3_resource, site_name, timestamps, use_async) -> None:
+    df = fetch_events(s3_resource, site_name, num_concurrent_downloads=2, timestamps=timestamps)
+    df_processes = fetch_events(
+        s3_resource,
+        site_name,
+        num_concurrent_downloads=2,
+        timestamps=timestamps,
+        use_async=use_async,
+        num_parse_processes=2,
+    )
+
+    pd.testing.assert_frame_equal(df_processes, df)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("use_arrow", [False, True])
+def test_decompress_parse_columnar(rows_varied, use_arrow, monkeypatch) -> None:
+    if use_arrow:
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(arrow, "is_installed", lambda: False)
+    data = make_object_data(rows_varied)
+    df = _from_columnar(_decompress_parse_columnar(data))
+
+    # Same events as when parsed in the same process, except that JSON nulls come back as NaN if
+    # they went through Arrow, as missing values do
+    df_expected = _decompress_parse_object(io.BytesIO(data))
+    if use_arrow:
+        df_expected = df_expected.where(df_expected.notna(), np.nan)
+    pd.testing.assert_frame_equal(df, df_expected)
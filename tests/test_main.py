@@ -1,2 +1,327 @@
-def test_handler():
-    pass
+import functools
+import json
+import subprocess
+import sys
+import urllib.parse
+from collections.abc import Generator
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+import pytest
+from ata_db_models.helpers import get_conn_string
+from ata_db_models.models import Event, SQLModel
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+from ata_pipeline0 import main
+from ata_pipeline0.helpers import clients
+from ata_pipeline0.helpers.manifest import Manifest
+from ata_pipeline0.helpers.site import SiteName
+from fakes import FakeS3Resource, make_event_row, make_object_data
+
+
+# ---------- FIXTURES ----------
+@pytest.fixture(scope="module")
+def site_name() -> SiteName:
+    return SiteName.AFRO_LA
+
+
+@pytest.fixture(scope="module")
+def object_key_prefix() -> str:
+    return "enriched/good/2022/11/23/00"
+
+
+@pytest.fixture(scope="module")
+def event_id_duplicate() -> str:
+    return "3784c768-0eaf-407e-ac35-baa285bfba53"
+
+
+@pytest.fixture(scope="module")
+def s3_resource(site_name, object_key_prefix, event_id_duplicate) -> FakeS3Resource:
+    """
+    Fake S3 holding three objects, with a duplicate event ID within the second
+    object and another one across the first and third objects.
+    """
+    s3_resource = FakeS3Resource()
+    bucket = s3_resource.Bucket(f"lnl-snowplow-{site_name}")
+    bucket.put_object(
+        Key=f"{object_key_prefix}/a.gz",
+        Body=make_object_data(
+            [make_event_row(event_id_duplicate, derived_tstamp="2022-11-23 00:01:00.000"), make_event_row()]
+        ),
+    )
+    bucket.put_object(
+        Key=f"{object_key_prefix}/b.gz",
+        Body=make_object_data(
+            [
+                make_event_row("74309984-1b10-445a-9b1a-e05ee448abd9", derived_tstamp="2022-11-23 00:03:00.000"),
+                make_event_row("74309984-1b10-445a-9b1a-e05ee448abd9", derived_tstamp="2022-11-23 00:02:00.000"),
+                make_event_row(useragent="Mozilla/5.0 (compatible; AhrefsBot/7.0;  http://ahrefs.com/robot/)"),
+            ]
+        ),
+    )
+    bucket.put_object(
+        Key=f"{object_key_prefix}/c.gz",
+        Body=make_object_data(
+            [make_event_row(event_id_duplicate, derived_tstamp="2022-11-23 00:05:00.000"), make_event_row()]
+        ),
+    )
+    return s3_resource
+
+
+@pytest.fixture(scope="module")
+def engine() -> Engine:
+    return create_engine(get_conn_string())
+
+
+# ---------- HELPERS ----------
+@contextmanager
+def create_and_drop_tables(engine: Engine) -> Generator[None, None, None]:
+    """
+    Context manager to safely create and drop tables before and after each test.
+    """
+    SQLModel.metadata.create_all(engine)
+    try:
+        yield
+    finally:
+        SQLModel.metadata.drop_all(engine)
+
+
+def select_events(engine: Engine) -> List[tuple]:
+    with engine.connect() as conn:
+        return conn.execute(Event.__table__.select().order_by(Event.event_id)).fetchall()
+
+
+def make_record_s3(bucket_name: str, object_key: str) -> Dict[str, Any]:
+    """
+    Makes an S3 event notification record, with only the fields the handler reads.
+    """
+    return {
+        "eventSource": "aws:s3",
+        "s3": {"bucket": {"name": bucket_name}, "object": {"key": urllib.parse.quote_plus(object_key, safe="/")}},
+    }
+
+
+# ---------- TESTS ----------
+@pytest.mark.unit
+def test_import_lazy() -> None:
+    # In a fresh interpreter, since this one has them all imported already
+    modules = subprocess.run(
+        [sys.executable, "-c", "import sys, ata_pipeline0.main; print(*sys.modules)"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+
+    modules_heavy = {
+        "ata_db_models",
+        "boto3",
+        "botocore",
+        "mypy_boto3_s3",
+        "numpy",
+        "pandas",
+        "sqlalchemy",
+        "ua_parser",
+        "user_agents",
+    }
+    assert modules_heavy.isdisjoint(module.split(".")[0] for module in modules)
+
+
+@pytest.mark.unit
+def test_get_object_keys_by_site() -> None:
+    record_a = make_record_s3("lnl-snowplow-afro-la", "enriched/good/2022/11/23/00/b b.gz")
+    record_b = make_record_s3("lnl-snowplow-afro-la", "enriched/good/2022/11/23/00/a.gz")
+    record_c = make_record_s3("lnl-snowplow-the-19th", "enriched/good/2022/11/23/00/c.gz")
+    object_keys_by_site = {
+        SiteName.AFRO_LA: ["enriched/good/2022/11/23/00/a.gz", "enriched/good/2022/11/23/00/b b.gz"],
+        SiteName.THE_19TH: ["enriched/good/2022/11/23/00/c.gz"],
+    }
+
+    # A plain S3 notification
+    assert main.get_object_keys_by_site({"Records": [record_a, record_b, record_c]}) == object_keys_by_site
+
+    # A batch of SQS messages wrapping S3 notifications, including a test one and a repeated record
+    event_sqs = {
+        "Records": [
+            {"eventSource": "aws:sqs", "body": json.dumps({"Records": [record_a, record_c]})},
+            {"eventSource": "aws:sqs", "body": json.dumps({"Records": [record_b, record_a]})},
+            {"eventSource": "aws:sqs", "body": json.dumps({"Service": "Amazon S3", "Event": "s3:TestEvent"})},
+        ]
+    }
+    assert main.get_object_keys_by_site(event_sqs) == object_keys_by_site
+
+
+@pytest.mark.integration
+def test_handler(s3_resource, site_name, object_key_prefix, engine, monkeypatch) -> None:
+    monkeypatch.setattr(clients, "get_s3_resource", lambda *args, **kwargs: s3_resource)
+    bucket_name = f"lnl-snowplow-{site_name}"
+
+    with create_and_drop_tables(engine):
+        main.run_pipeline(site_name=site_name, object_key=object_key_prefix)
+        events = select_events(engine)
+
+    # One record per object, as S3 sends them
+    event = {
+        "Records": [
+            make_record_s3(bucket_name, object_summary.key)
+            for object_summary in s3_resource.Bucket(bucket_name).objects.filter(Prefix=object_key_prefix)
+        ]
+    }
+    with create_and_drop_tables(engine):
+        main.handler(event, None)
+        events_handled = select_events(engine)
+
+    assert events_handled == events
+
+
+@pytest.mark.integration
+def test_run_pipeline_streaming(s3_resource, site_name, object_key_prefix, engine, monkeypatch) -> None:
+    monkeypatch.setattr(clients, "get_s3_resource", lambda *args, **kwargs: s3_resource)
+
+    with create_and_drop_tables(engine):
+        main.run_pipeline(site_name=site_name, object_key=object_key_prefix)
+        events = select_events(engine)
+
+    with create_and_drop_tables(engine):
+        main.run_pipeline(site_name=site_name, object_key=object_key_prefix, chunk_max_rows=1)
+        events_streamed = select_events(engine)
+
+    # 7 events, minus 2 duplicates and 1 bot
+    assert len(events) == 4
+    # Streaming through the pipeline object by object writes the same events
+    assert events_streamed == events
+
+
+@pytest.mark.integration
+def test_run_pipeline_streaming_earlier_later(
+    site_name, object_key_prefix, event_id_duplicate, engine, monkeypatch
+) -> None:
+    # The later duplicate is in the object listed first
+    s3_resource = FakeS3Resource()
+    bucket = s3_resource.Bucket(f"lnl-snowplow-{site_name}")
+    bucket.put_object(
+        Key=f"{object_key_prefix}/a.gz",
+        Body=make_object_data(
+            [make_event_row(event_id_duplicate, derived_tstamp="2022-11-23 00:09:00.000", page_urlpath="/late")]
+        ),
+    )
+    bucket.put_object(
+        Key=f"{object_key_prefix}/b.gz",
+        Body=make_object_data(
+            [make_event_row(event_id_duplicate, derived_tstamp="2022-11-23 00:01:00.000", page_urlpath="/early")]
+        ),
+    )
+    monkeypatch.setattr(clients, "get_s3_resource", lambda *args, **kwargs: s3_resource)
+
+    with create_and_drop_tables(engine):
+        main.run_pipeline(site_name=site_name, object_key=object_key_prefix)
+        events = select_events(engine)
+
+    with create_and_drop_tables(engine):
+        result = main.run_pipeline(site_name=site_name, object_key=object_key_prefix, chunk_max_rows=1)
+        events_streamed = select_events(engine)
+
+    # The earliest duplicate is kept either way, even though it's written last when streaming
+    assert len(events) == 1
+    assert "/early" in tuple(events[0])
+    assert events_streamed == events
+    assert result.num_rows_inserted == 1
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("skip_existing", [False, True])
+def test_run_pipeline_streaming_loaded_before(
+    site_name, object_key_prefix, event_id_duplicate, engine, monkeypatch, skip_existing
+) -> None:
+    s3_resource = FakeS3Resource()
+    bucket = s3_resource.Bucket(f"lnl-snowplow-{site_name}")
+    for key, derived_tstamp, page_urlpath in [("a", "00:09", "/late"), ("b", "00:01", "/early")]:
+        bucket.put_object(
+            Key=f"{object_key_prefix}/{key}.gz",
+            Body=make_object_data(
+                [
+                    make_event_row(
+                        event_id_duplicate,
+                        derived_tstamp=f"2022-11-23 {derived_tstamp}:00.000",
+                        page_urlpath=page_urlpath,
+                    )
+                ]
+            ),
+        )
+    monkeypatch.setattr(clients, "get_s3_resource", lambda *args, **kwargs: s3_resource)
+
+    events_by_chunk_max_rows = {}
+    for chunk_max_rows in [None, 1]:
+        with create_and_drop_tables(engine):
+            # The later duplicate was loaded by an earlier run
+            main.run_pipeline(site_name=site_name, object_keys=[f"{object_key_prefix}/a.gz"])
+            main.run_pipeline(
+                site_name=site_name,
+                object_key=object_key_prefix,
+                chunk_max_rows=chunk_max_rows,
+                skip_existing=skip_existing,
+            )
+            events_by_chunk_max_rows[chunk_max_rows] = select_events(engine)
+
+    # Events loaded by earlier runs are left alone, whether streaming or not
+    assert "/late" in tuple(events_by_chunk_max_rows[None][0])
+    assert events_by_chunk_max_rows[1] == events_by_chunk_max_rows[None]
+
+
+@pytest.mark.integration
+def test_run_pipeline_copy(s3_resource, site_name, object_key_prefix, engine, monkeypatch) -> None:
+    monkeypatch.setattr(clients, "get_s3_resource", lambda *args, **kwargs: s3_resource)
+
+    with create_and_drop_tables(engine):
+        main.run_pipeline(site_name=site_name, object_key=object_key_prefix)
+        events = select_events(engine)
+
+    with create_and_drop_tables(engine):
+        main.run_pipeline(site_name=site_name, object_key=object_key_prefix, use_copy=True)
+        events_copied = select_events(engine)
+
+    assert events_copied == events
+
+
+@pytest.mark.integration
+def test_run_pipeline_resume(site_name, object_key_prefix, engine, monkeypatch, tmp_path) -> None:
+    s3_resource = FakeS3Resource()
+    bucket = s3_resource.Bucket(f"lnl-snowplow-{site_name}")
+    for key in ["a", "b", "c"]:
+        bucket.put_object(Key=f"{object_key_prefix}/{key}.gz", Body=make_object_data([make_event_row()]))
+    monkeypatch.setattr(clients, "get_s3_resource", lambda *args, **kwargs: s3_resource)
+
+    manifest = Manifest(str(tmp_path / "manifest.sqlite3"))
+    run = functools.partial(
+        main.run_pipeline, site_name=site_name, object_key=object_key_prefix, chunk_max_rows=1, manifest=manifest
+    )
+
+    with create_and_drop_tables(engine):
+        result = run()
+        assert result.num_rows_inserted == 3
+
+        # All objects have been recorded, so resuming skips them all
+        result = run(resume=True)
+        assert result == main.PipelineResult(num_objects_skipped=3)
+
+        # An object that's been overwritten since isn't skipped
+        bucket.put_object(Key=f"{object_key_prefix}/b.gz", Body=make_object_data([make_event_row()]))
+        result = run(resume=True)
+        assert result.num_objects_skipped == 2
+        assert result.num_rows_inserted == 1
+
+        assert len(select_events(engine)) == 4
+
+
+@pytest.mark.integration
+def test_run_pipeline_skip_existing(s3_resource, site_name, object_key_prefix, engine, monkeypatch) -> None:
+    monkeypatch.setattr(clients, "get_s3_resource", lambda *args, **kwargs: s3_resource)
+
+    with create_and_drop_tables(engine):
+        main.run_pipeline(site_name=site_name, object_key=object_key_prefix)
+        events = select_events(engine)
+
+        result = main.run_pipeline(site_name=site_name, object_key=object_key_prefix, skip_existing=True)
+        assert result.num_rows_preprocessed == len(events)
+        assert result.num_rows_inserted == 0
+        assert select_events(engine) == events
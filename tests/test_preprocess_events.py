@@ -1,5 +1,9 @@
+import io
+import json
+import warnings
 from typing import Set
 
+import numpy as np
 import pandas as pd
 import pytest
 import user_agents as ua
@@ -10,6 +14,9 @@ from pandas.api.types import (
     is_int64_dtype,
 )
 
+from ata_pipeline0.fetch_events import _concat, _decompress_parse_object
+from ata_pipeline0.helpers.bots import BotDetector
+from ata_pipeline0.helpers.engine import Engine
 from ata_pipeline0.helpers.fields import FieldNew, FieldSnowplow
 from ata_pipeline0.helpers.preprocessors import (
     AddFieldSiteName,
@@ -19,11 +26,26 @@ from ata_pipeline0.helpers.preprocessors import (
     DeleteRowsEmpty,
     ReplaceNaNs,
     SelectFieldsRelevant,
+    _is_bot,
 )
 from ata_pipeline0.helpers.site import SiteName
+from ata_pipeline0.main import FIELDS_CATEGORICAL, get_preprocessors
+from ata_pipeline0.preprocess_events import preprocess_events
+from fakes import make_event_row, make_object_data
 
 
 # ---------- FIXTURES ----------
+@pytest.fixture(params=[Engine.PANDAS, Engine.ARROW])
+def engine(request) -> Engine:
+    """
+    Engine preprocessors run on. Tests using it run on both, the Arrow one only if
+    pyarrow is installed.
+    """
+    if request.param == Engine.ARROW:
+        pytest.importorskip("pyarrow")
+    return request.param
+
+
 @pytest.fixture(scope="module")
 def key_duplicate() -> str:
     return "A0"
@@ -160,14 +182,14 @@ def replace_with() -> str:
 
 # ---------- TESTS ----------
 @pytest.mark.unit
-def test_select_fields_relevant(df, fields_relevant) -> None:
-    df = SelectFieldsRelevant(fields_relevant)(df)
+def test_select_fields_relevant(df, fields_relevant, engine) -> None:
+    df = SelectFieldsRelevant(fields_relevant)(df, engine=engine)
     assert set(df.columns) == fields_relevant
 
 
 @pytest.mark.unit
-def test_delete_rows_empty(df, fields_required) -> None:
-    df = DeleteRowsEmpty(fields_required)(df)
+def test_delete_rows_empty(df, fields_required, engine) -> None:
+    df = DeleteRowsEmpty(fields_required)(df, engine=engine)
     # doc_height is not required, so the first row is off the hook
     assert df.shape[0] == 2
     # isna() should return False for all cells under required fields;
@@ -176,14 +198,16 @@ def test_delete_rows_empty(df, fields_required) -> None:
 
 
 @pytest.mark.unit
-def test_convert_field_types(df, fields_int, fields_float, fields_datetime, fields_categorical, fields_json) -> None:
+def test_convert_field_types(
+    df, fields_int, fields_float, fields_datetime, fields_categorical, fields_json, engine
+) -> None:
     df = ConvertFieldTypes(
         fields_int=fields_int,
         fields_float=fields_float,
         fields_datetime=fields_datetime,
         fields_categorical=fields_categorical,
         fields_json=fields_json,
-    )(df)
+    )(df, engine=engine)
 
     for f in fields_int:
         assert is_int64_dtype(df[f])
@@ -199,17 +223,33 @@ def test_convert_field_types(df, fields_int, fields_float, fields_datetime, fiel
 
 
 @pytest.mark.unit
-def test_delete_rows_duplicate_key(df, field_primary_key, field_timestamp, key_duplicate) -> None:
+def test_convert_field_types_json(fields_json, engine) -> None:
+    (field,) = fields_json
+    payload = {"formId": "a", "elements": [{"name": "s", "value": "v"}], "isValid": True}
+    values = [json.dumps(payload), np.nan, str(payload), None, "{not valid", json.dumps(payload)]
+    df = pd.DataFrame({field: values}, index=[5, 4, 3, 2, 1, 0])
+
+    df_out = ConvertFieldTypes(set(), set(), set(), set(), fields_json=fields_json)(df, engine=engine)
+
+    # Python literals, as events parsed before nested values were kept as JSON have, still decode
+    assert df_out[field].tolist() == [payload, None, payload, None, None, payload]
+    assert df_out.index.tolist() == df.index.tolist()
+    # Identical payloads are decoded once
+    assert df_out[field].iloc[0] is df_out[field].iloc[5]
+
+
+@pytest.mark.unit
+def test_delete_rows_duplicate_key(df, field_primary_key, field_timestamp, key_duplicate, engine) -> None:
     df = ConvertFieldTypes(
         fields_int=set(),
         fields_float=set(),
         fields_datetime={field_timestamp},
         fields_categorical=set(),
         fields_json=set(),
-    )(df)
+    )(df, engine=engine)
     duplicate_timestamp_min = df[df[field_primary_key] == key_duplicate][field_timestamp].min()
 
-    df = DeleteRowsDuplicateKey(field_primary_key, field_timestamp)(df)
+    df = DeleteRowsDuplicateKey(field_primary_key, field_timestamp)(df, engine=engine)
 
     # 1 row (second row) should be removed
     assert df.shape[0] == 3
@@ -225,8 +265,47 @@ def test_delete_rows_duplicate_key(df, field_primary_key, field_timestamp, key_d
 
 
 @pytest.mark.unit
-def test_delete_fields_bot(df, field_useragent) -> None:
-    df = DeleteRowsBot(field_useragent)(df)
+@pytest.mark.parametrize("copy", [True, False])
+def test_delete_rows_duplicate_key_order(field_primary_key, field_timestamp, copy, engine) -> None:
+    # Repeated index labels, as after concatenating the DataFrames of several objects,
+    # with ties and missing timestamps among duplicates
+    df = pd.DataFrame(
+        {
+            field_primary_key: ["A", "B", "A", "C", "B", "A", "D", "D", "E", "E"],
+            field_timestamp: pd.to_datetime(
+                [
+                    "2022-01-01 00:03",
+                    "2022-01-01 00:05",
+                    "2022-01-01 00:01",
+                    "2022-01-01 00:00",
+                    "2022-01-01 00:05",
+                    "2022-01-01 00:02",
+                    "NaT",
+                    "2022-01-01 00:04",
+                    "NaT",
+                    "NaT",
+                ],
+                utc=True,
+            ),
+            "position": range(10),
+        },
+        index=[0, 1, 2, 3, 4, 0, 1, 2, 3, 4],
+    )
+    df_expected = (
+        df.sort_values(field_timestamp, kind="stable").drop_duplicates(subset=[field_primary_key]).sort_values("position")
+    )
+
+    df_out = DeleteRowsDuplicateKey(field_primary_key, field_timestamp)(df, copy=copy, engine=engine)
+
+    # Same rows as keeping the earliest of each key after sorting all rows by timestamp
+    # (ties going to the first), in their original order
+    assert df_out["position"].tolist() == [1, 2, 3, 7, 8]
+    pd.testing.assert_frame_equal(df_out, df_expected)
+
+
+@pytest.mark.unit
+def test_delete_fields_bot(df, field_useragent, engine) -> None:
+    df = DeleteRowsBot(field_useragent)(df, engine=engine)
     # Only first row should be removed
     assert df.shape[0] == 3
     # All other rows should be non-bot events
@@ -234,14 +313,150 @@ def test_delete_fields_bot(df, field_useragent) -> None:
 
 
 @pytest.mark.unit
-def test_add_field_site_name(df, site_name, field_site_name) -> None:
-    df = AddFieldSiteName(site_name, field_site_name)(df)
+def test_delete_fields_bot_regex(df, field_useragent, engine) -> None:
+    df_out = DeleteRowsBot(field_useragent, detector=BotDetector.REGEX)(df, engine=engine)
+    assert df_out.equals(DeleteRowsBot(field_useragent)(df, engine=engine))
+
+
+@pytest.mark.unit
+def test_delete_fields_bot_repeated(df, field_useragent) -> None:
+    # Repeat user agents many times over and mix in non-string values, which count as bots
+    # (pandas engine only, since Arrow columns can't mix strings and numbers)
+    useragents = pd.Series([*df[field_useragent], None, np.nan, 123] * 100, dtype=object)
+    df_repeated = pd.DataFrame({field_useragent: useragents, "row": range(len(useragents))})
+
+    _is_bot.cache_clear()
+    df_out = DeleteRowsBot(field_useragent)(df_repeated)
+
+    # Each distinct value was checked once (the non-string one raises, so isn't cached)
+    assert _is_bot.cache_info().misses == df[field_useragent].nunique() + 1
+    assert _is_bot.cache_info().hits == 0
+
+    # Same rows (and order) as checking every row one by one
+    df_expected = df_repeated[df_repeated[field_useragent].apply(DeleteRowsBot._safe_bot_check)]
+    assert df_out["row"].tolist() == df_expected["row"].tolist()
+    assert df_out.shape[0] == 300
+
+
+@pytest.mark.unit
+def test_add_field_site_name(df, site_name, field_site_name, engine) -> None:
+    df = AddFieldSiteName(site_name, field_site_name)(df, engine=engine)
     # pd.Series.all returns True if all of its boolean values are True
     assert (df[field_site_name] == site_name).all()
 
 
 @pytest.mark.unit
-def test_replace_nans(df, replace_with) -> None:
-    df = ReplaceNaNs(replace_with)(df)
+def test_replace_nans(df, replace_with, engine) -> None:
+    df = ReplaceNaNs(replace_with)(df, engine=engine)
     df_check = df.dropna()
     assert df.shape == df_check.shape
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("copy", [True, False])
+def test_replace_nans_none(df, copy, engine) -> None:
+    df = ConvertFieldTypes(
+        fields_int=set(),
+        fields_float={FieldSnowplow.DOC_HEIGHT, FieldSnowplow.PP_YOFFSET_MAX},
+        fields_datetime={FieldSnowplow.DERIVED_TSTAMP},
+        fields_categorical={FieldSnowplow.EVENT_NAME},
+        fields_json=set(),
+    )(df, engine=engine)
+    df_out = ReplaceNaNs(None)(df.copy(), copy=copy, engine=engine)
+    assert df_out.shape == df.shape
+    for field in df.columns:
+        if is_categorical_dtype(df[field]):
+            # Categoricals stay encoded, with missing values as nulls, until they're written
+            pd.testing.assert_series_equal(df_out[field], df[field])
+            continue
+        # Missing values are all None, and other values are kept
+        assert df_out[field].tolist() == [None if pd.isna(value) else value for value in df[field]]
+
+
+@pytest.mark.unit
+def test_replace_nans_categorical(engine) -> None:
+    df = pd.DataFrame({FieldSnowplow.REFR_MEDIUM: pd.Categorical(["search", None, "social"])})
+    df_out = ReplaceNaNs("unknown")(df, engine=engine)
+    assert is_categorical_dtype(df_out[FieldSnowplow.REFR_MEDIUM])
+    assert df_out[FieldSnowplow.REFR_MEDIUM].tolist() == ["search", "unknown", "social"]
+
+
+@pytest.mark.unit
+def test_preprocess_events_no_copy(site_name, engine) -> None:
+    rows = [
+        make_event_row(),
+        make_event_row(doc_height=None),
+        make_event_row(useragent="Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)"),
+        make_event_row(unstruct_event_com_snowplowanalytics_snowplow_submit_form_1="{'formId': 'a'}"),
+        make_event_row(irrelevant_field="1"),
+    ]
+    df = _decompress_parse_object(io.BytesIO(make_object_data(rows)))
+    df_before = df.copy()
+
+    df_copied = preprocess_events(df, get_preprocessors(site_name), engine=engine)
+    # The input DataFrame is left as is
+    assert df.equals(df_before)
+
+    # The pipeline owns the input DataFrame, which it can modify, but the result is the same,
+    # except that ReplaceNaNs leaves columns without NaNs with their original types
+    df_owned = preprocess_events(df, get_preprocessors(site_name), copy=False, engine=engine)
+    pd.testing.assert_frame_equal(df_owned, df_copied, check_dtype=False)
+    assert df_owned.shape[0] == 3
+
+
+@pytest.mark.unit
+def test_preprocess_events_no_copy_concatenated(site_name) -> None:
+    # Events of two objects, concatenated as fetch_events does
+    df = _concat(
+        _decompress_parse_object(io.BytesIO(make_object_data(rows)))
+        for rows in [
+            [
+                make_event_row(event_id="A", derived_tstamp="2022-11-23 00:10:00.000"),
+                make_event_row(useragent="Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)"),
+            ],
+            [make_event_row(event_id="A", derived_tstamp="2022-11-23 00:05:00.000"), make_event_row(doc_height=None)],
+        ]
+    )
+
+    # Rows are dropped in place, even from a slice of another DataFrame, without pandas warning about it
+    df_slice = df[df.columns[1:]]
+    assert DeleteRowsBot(field_useragent=FieldSnowplow.USERAGENT)(df_slice, copy=False) is df_slice
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        df_out = preprocess_events(df, get_preprocessors(site_name), copy=False)
+
+    assert df_out[FieldSnowplow.DERIVED_TSTAMP].tolist() == [pd.Timestamp("2022-11-23 00:05:00.000", tz="UTC")]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("fields_categorical", [None, FIELDS_CATEGORICAL])
+def test_preprocess_events_engines(site_name, fields_categorical) -> None:
+    pytest.importorskip("pyarrow")
+    rows = [
+        make_event_row(event_id="A", derived_tstamp="2022-11-23 00:10:00.000"),
+        # Duplicate of the first event, delivered earlier, so kept instead
+        make_event_row(event_id="A", derived_tstamp="2022-11-23 00:05:00.000", refr_source="Google"),
+        make_event_row(useragent="Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)"),
+        make_event_row(dvce_screenheight=None),
+        make_event_row(
+            event_name="submit_form",
+            unstruct_event_com_snowplowanalytics_snowplow_submit_form_1={"formId": "a", "elements": []},
+        ),
+        make_event_row(br_viewheight=1.5, pp_yoffset_max=300, page_urlquery="a=b"),
+        # Missing a field, which another object has
+        {field: value for field, value in make_event_row().items() if field != "refr_medium"},
+    ]
+    # Repeated index labels, as after concatenating the DataFrames of several objects
+    df = pd.concat(
+        _decompress_parse_object(
+            io.BytesIO(make_object_data(rows_object)), fields={*FieldSnowplow}, fields_categorical=fields_categorical
+        )
+        for rows_object in [rows[:4], rows[4:]]
+    )
+
+    df_pandas = preprocess_events(df, get_preprocessors(site_name))
+    df_arrow = preprocess_events(df, get_preprocessors(site_name), engine=Engine.ARROW)
+
+    # Same rows, index, types and values, down to decoded JSON and None for missing values
+    pd.testing.assert_frame_equal(df_arrow, df_pandas)
+    assert df_arrow.shape[0] == 4
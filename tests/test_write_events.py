@@ -1,3 +1,4 @@
+import logging
 from collections.abc import Generator
 from contextlib import contextmanager
 
@@ -7,12 +8,18 @@ from ata_db_models.helpers import get_conn_string
 from ata_db_models.models import Event, SQLModel
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
+from sqlalchemy.exc import StatementError
 from sqlalchemy.orm import sessionmaker
 
 from ata_pipeline0.helpers.fields import FieldNew, FieldSnowplow
-from ata_pipeline0.helpers.preprocessors import ConvertFieldTypes
+from ata_pipeline0.helpers.preprocessors import ConvertFieldTypes, ReplaceNaNs
 from ata_pipeline0.helpers.site import SiteName
-from ata_pipeline0.write_events import write_events
+from ata_pipeline0.main import FIELDS_CATEGORICAL
+from ata_pipeline0.write_events import (
+    drop_events_existing,
+    write_events,
+    write_events_copy,
+)
 
 
 # ---------- FIXTURES ----------
@@ -225,3 +232,122 @@ def test_write_events_duplicate_key(df_duplicate_key, engine, session_factory) -
         # Assert all rows except the last one were written
         with session_factory.begin() as session:
             assert session.query(Event).count() == num_unique_keys
+
+
+@pytest.mark.integration
+def test_write_events_copy(df, engine, session_factory) -> None:
+    with create_and_drop_tables(engine):
+        # Stream a row at a time to make sure CSV chunks are stitched together correctly
+        num_rows_written = write_events_copy(df, session_factory, rows_per_read=1)
+        assert num_rows_written == df.shape[0]
+
+        with session_factory.begin() as session:
+            assert session.query(Event).count() == df.shape[0]
+
+
+@pytest.mark.integration
+def test_write_events_copy_duplicate_key(df_duplicate_key, engine, session_factory) -> None:
+    num_unique_keys = df_duplicate_key.groupby([FieldSnowplow.EVENT_ID, FieldNew.SITE_NAME]).ngroups
+
+    with create_and_drop_tables(engine):
+        write_events_copy(df_duplicate_key.iloc[:-1], session_factory)
+
+        # Last event's composite key already exists, so it should not go through
+        num_rows_written = write_events_copy(df_duplicate_key.iloc[[-1]], session_factory)
+        assert num_rows_written == 0
+
+        with session_factory.begin() as session:
+            assert session.query(Event).count() == num_unique_keys
+
+
+@pytest.mark.integration
+def test_write_events_copy_same_as_insert(df, engine, session_factory) -> None:
+    # As in the pipeline, NaNs are replaced with None before writing
+    df = ReplaceNaNs(replace_with=None)(df)
+
+    with create_and_drop_tables(engine):
+        write_events(df, session_factory)
+        with engine.connect() as conn:
+            rows_inserted = conn.execute(Event.__table__.select().order_by(Event.event_id)).fetchall()
+
+    with create_and_drop_tables(engine):
+        write_events_copy(df, session_factory)
+        with engine.connect() as conn:
+            rows_copied = conn.execute(Event.__table__.select().order_by(Event.event_id)).fetchall()
+
+    assert rows_copied == rows_inserted
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("write", [write_events, write_events_copy])
+def test_write_events_categorical(df, engine, session_factory, write) -> None:
+    df_object = ReplaceNaNs(replace_with=None)(df.astype({field: object for field in FIELDS_CATEGORICAL}))
+    # As when fetched by the pipeline, more fields are categorical, and stay so through preprocessing
+    df_categorical = ReplaceNaNs(replace_with=None)(df.astype({field: "category" for field in FIELDS_CATEGORICAL}))
+
+    with create_and_drop_tables(engine):
+        write(df_object, session_factory)
+        with engine.connect() as conn:
+            rows_expected = conn.execute(Event.__table__.select().order_by(Event.event_id)).fetchall()
+
+    with create_and_drop_tables(engine):
+        write(df_categorical, session_factory)
+        with engine.connect() as conn:
+            rows = conn.execute(Event.__table__.select().order_by(Event.event_id)).fetchall()
+
+    assert rows == rows_expected
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("transaction_per_batch", [False, True])
+def test_write_events_batched(df_duplicate_key, engine, session_factory, transaction_per_batch) -> None:
+    num_unique_keys = df_duplicate_key.groupby([FieldSnowplow.EVENT_ID, FieldNew.SITE_NAME]).ngroups
+
+    with create_and_drop_tables(engine):
+        # The last event's key clashes with the first's, which by then is already in the DB
+        num_rows_written = write_events(
+            df_duplicate_key, session_factory, batch_size=1, transaction_per_batch=transaction_per_batch
+        )
+        assert num_rows_written == num_unique_keys
+
+        with session_factory.begin() as session:
+            assert session.query(Event).count() == num_unique_keys
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("transaction_per_batch,num_rows_expected", [(False, 0), (True, 2)])
+def test_write_events_batched_failure(df, engine, session_factory, transaction_per_batch, num_rows_expected) -> None:
+    df = df.copy()
+    # Last event's ID isn't a UUID, so its batch will fail
+    df.loc[df.shape[0] - 1, FieldSnowplow.EVENT_ID] = "not-a-uuid"
+
+    with create_and_drop_tables(engine):
+        with pytest.raises(StatementError):
+            write_events(df, session_factory, batch_size=2, transaction_per_batch=transaction_per_batch)
+
+        # Batches are all rolled back when they share a transaction, otherwise only the failed one is
+        with session_factory.begin() as session:
+            assert session.query(Event).count() == num_rows_expected
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("write", [write_events, write_events_copy])
+def test_drop_events_existing(df, engine, session_factory, write, caplog) -> None:
+    with create_and_drop_tables(engine):
+        write(df.iloc[:-1], session_factory)
+
+        # Look up a key at a time to make sure batches are put together correctly
+        df_new, num_rows_existing = drop_events_existing(df, session_factory, batch_size=1)
+        assert num_rows_existing == df.shape[0] - 1
+        pd.testing.assert_frame_equal(df_new, df.iloc[[-1]])
+
+        # Rows dropped beforehand are still counted as skipped
+        with caplog.at_level(logging.INFO):
+            num_rows_written = write(df_new, session_factory, num_rows_existing=num_rows_existing)
+        assert num_rows_written == 1
+        assert f"Skipped {num_rows_existing} rows" in caplog.text
+
+        # Nothing left to write
+        df_new, num_rows_existing = drop_events_existing(df, session_factory)
+        assert df_new.shape[0] == 0
+        assert num_rows_existing == df.shape[0]